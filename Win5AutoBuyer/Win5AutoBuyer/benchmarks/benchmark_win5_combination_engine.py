@@ -0,0 +1,362 @@
+'''
+組合せ計算エンジンのベンチマーク
+Win5AutoBuyer直下で python benchmarks/benchmark_win5_combination_engine.py として実行する
+'''
+# 標準モジュール
+import os
+import sys  # nopep8
+import time
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+
+# インストールモジュール
+import numpy as np
+import pandas as pd
+
+# 自作モジュール
+from win5_combination_engine import *  # nopep8
+from win5_race_card import RaceCard  # nopep8
+
+# フルゲートの頭数
+FULL_FIELD_HORSE_CNT = 18
+
+
+def create_race_details(horse_cnt: int, seed: int = 0) -> pd.DataFrame:
+    '''
+    ベンチマーク用の全レース同じ頭数のレース詳細を作成する処理
+    '''
+    rng = np.random.default_rng(seed)
+    rows = []
+    for race_no in range(1, LEG_COUNT+1):
+        popular_list = rng.permutation(horse_cnt) + 1
+        for horse_num, popular in zip(range(1, horse_cnt+1), popular_list):
+            rows.append({'レース番号': race_no, '馬番': horse_num, '枠番': min((horse_num + 1) // 2, 8),
+                         '人気': popular, 'オッズ': float(popular) * 1.7})
+
+    return pd.DataFrame(rows)
+
+
+def calc_combination_iterrows(df_target_race_details: pd.DataFrame, filter_params: dict) -> list:
+    '''
+    従来のiterrowsによる5重ループの組合せ算出処理(比較用)
+    '''
+    legs = [df_target_race_details.loc[df_target_race_details['レース番号'] == race_no]
+            for race_no in range(1, LEG_COUNT+1)]
+
+    product_list = []
+    for _, first_race in legs[0].iterrows():
+        for _, second_race in legs[1].iterrows():
+            for _, third_race in legs[2].iterrows():
+                for _, fourth_race in legs[3].iterrows():
+                    for _, fifth_race in legs[4].iterrows():
+                        races = [first_race, second_race,
+                                 third_race, fourth_race, fifth_race]
+                        tmp_ninki_list = [race.loc['人気'] for race in races]
+                        if -1 in tmp_ninki_list:
+                            continue
+                        if len(filter_params['ninkiwa']) > 0 and not sum(tmp_ninki_list) in filter_params['ninkiwa']:
+                            continue
+                        if len(filter_params['ninki_tousu']) > 0 and not tmp_ninki_list.count(1) in filter_params['ninki_tousu']:
+                            continue
+                        tmp_waku_list = np.array(
+                            [race.loc['枠番'] for race in races])
+                        if len(filter_params['waku']) > 0:
+                            if 0 in filter_params['waku'] and all(tmp_waku_list >= 7):
+                                continue
+                            if 1 in filter_params['waku'] and all(tmp_waku_list <= 2):
+                                continue
+                        tmp_horse_num_list = [race.loc['馬番'] for race in races]
+                        if len(filter_params['horse_num']) > 0:
+                            if 0 in filter_params['horse_num'] and all([num % 2 != 0 for num in tmp_horse_num_list]):
+                                continue
+                            if 1 in filter_params['horse_num'] and all([num % 2 == 0 for num in tmp_horse_num_list]):
+                                continue
+                        product_list.append(tmp_horse_num_list)
+
+    return product_list
+
+
+def measure(func, *args, repeat: int = 1):
+    '''
+    処理時間の最小値を計測する処理
+    '''
+    elapsed_list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func(*args)
+        elapsed_list.append(time.perf_counter() - start)
+
+    return min(elapsed_list), ret
+
+
+def benchmark_vectorized(filter_params: dict):
+    '''
+    従来処理と配列演算の処理時間を比較する処理
+    従来処理は18頭立てでは終わらないため、小さい頭数で1組合せあたりの時間を計測し、18頭立ての時間を推定する
+    '''
+    small_horse_cnt = 5
+    df_small = create_race_details(small_horse_cnt)
+    elapsed_iterrows, expected = measure(
+        calc_combination_iterrows, df_small, filter_params)
+    _, result = measure(calc_combination_array,
+                        get_leg_arrays(df_small), filter_params)
+    assert result.tolist() == expected
+
+    per_candidate = elapsed_iterrows / small_horse_cnt ** LEG_COUNT
+    estimated_iterrows = per_candidate * FULL_FIELD_HORSE_CNT ** LEG_COUNT
+
+    df_full = create_race_details(FULL_FIELD_HORSE_CNT)
+    elapsed_vectorized, result = measure(
+        calc_combination_array, get_leg_arrays(df_full), filter_params, repeat=3)
+
+    print(f'[vectorized] 18x18x18x18x18 filters={filter_params}')
+    print(f'  iterrows  : {estimated_iterrows:10.3f} s (estimated from {small_horse_cnt}^5 = {elapsed_iterrows:.3f} s)')
+    print(f'  vectorized: {elapsed_vectorized:10.3f} s ({len(result)} tickets)')
+    print(f'  speedup   : {estimated_iterrows / elapsed_vectorized:10.1f} x')
+
+
+def measure_peak_memory(func, *args):
+    '''
+    処理中のメモリ使用量のピークを計測する処理
+    '''
+    tracemalloc.start()
+    ret = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak, ret
+
+
+def benchmark_chunks(filter_params: dict):
+    '''
+    一括算出と逐次算出のメモリ使用量のピークを比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+
+    peak_array, result = measure_peak_memory(
+        calc_combination_array, legs, filter_params)
+    peak_list, _ = measure_peak_memory(
+        lambda: calc_combination_array(legs, filter_params).tolist())
+    peak_chunks, cnt = measure_peak_memory(
+        lambda: sum(len(chunk) for chunk in iter_combination_chunks(legs, filter_params)))
+    peak_packed, packed = measure_peak_memory(
+        calc_packed_tickets, legs, filter_params)
+    assert cnt == len(result) == len(packed)
+
+    print(f'[chunks] 18x18x18x18x18 {cnt} tickets peak memory')
+    print(f'  list of lists : {peak_list / 1024 ** 2:10.1f} MiB')
+    print(f'  (N,5) array   : {peak_array / 1024 ** 2:10.1f} MiB')
+    print(f'  chunks        : {peak_chunks / 1024 ** 2:10.1f} MiB')
+    print(f'  packed uint32 : {peak_packed / 1024 ** 2:10.1f} MiB (stored {packed.nbytes / 1024 ** 2:.1f} MiB)')
+
+
+def benchmark_parallel(filter_params: dict):
+    '''
+    ワーカープロセス数ごとの処理時間を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+
+    worker_cnt_list = sorted({1, 2, 4, os.cpu_count()})
+    print(f'[parallel] 18x18x18x18x18 cpu_count={os.cpu_count()}')
+
+    elapsed_single = None
+    for worker_cnt in worker_cnt_list:
+        elapsed, packed = measure(
+            lambda: calc_packed_tickets(legs, filter_params, worker_cnt=worker_cnt), repeat=3)
+        elapsed_single = elapsed if elapsed_single is None else elapsed_single
+        print(f'  workers={worker_cnt:2d}: {elapsed:8.3f} s ({len(packed)} tickets, x{elapsed_single / elapsed:.2f})')
+
+
+def benchmark_enumeration_methods(horse_cnt: int, filter_params: dict):
+    '''
+    全列挙、枝刈り、半分全列挙の処理時間とコストモデルの選択結果を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(horse_cnt))
+
+    elapsed_brute_force, expected = measure(
+        calc_packed_tickets, legs, filter_params, repeat=3)
+    elapsed_bnb, result_bnb = measure(
+        calc_packed_tickets_branch_and_bound, legs, filter_params, repeat=3)
+    elapsed_mitm, result_mitm = measure(
+        calc_packed_tickets_meet_in_the_middle, legs, filter_params, repeat=3)
+    assert result_bnb.tolist() == expected.tolist() == result_mitm.tolist()
+
+    print(f'[enumeration methods] {horse_cnt}^5 ninkiwa={filter_params["ninkiwa"][0]}-{filter_params["ninkiwa"][-1]} ({len(expected)} tickets)')
+    print(f'  brute force       : {elapsed_brute_force:8.4f} s')
+    print(f'  branch and bound  : {elapsed_bnb:8.4f} s')
+    print(f'  meet in the middle: {elapsed_mitm:8.4f} s')
+    print(f'  cost model choice : {choose_enumeration_method(legs, filter_params)}')
+
+
+def benchmark_incremental(filter_params: dict):
+    '''
+    1頭追加、抽出条件変更時の差分再計算と一括再計算の処理時間を比較する処理
+    '''
+    df = create_race_details(FULL_FIELD_HORSE_CNT)
+    engine = IncrementalCombinationEngine(RaceCard(df))
+    for leg_idx in range(LEG_COUNT):
+        for horse_num in range(1, FULL_FIELD_HORSE_CNT + (0 if leg_idx == 0 else 1)):
+            engine.add_horse(leg_idx, horse_num)
+    engine.set_filter_params(filter_params)
+
+    elapsed_full, _ = measure(
+        calc_packed_tickets, get_leg_arrays(df), filter_params, repeat=3)
+    elapsed_add, _ = measure(
+        lambda: engine.add_horse(0, FULL_FIELD_HORSE_CNT))
+    elapsed_remove, _ = measure(
+        lambda: engine.remove_horse(0, FULL_FIELD_HORSE_CNT))
+    elapsed_filter, _ = measure(
+        lambda: engine.set_filter_params(filter_params))
+
+    print('[incremental] 18x18x18x18x18')
+    print(f'  full recompute : {elapsed_full:8.4f} s')
+    print(f'  add 1 horse    : {elapsed_add:8.4f} s')
+    print(f'  remove 1 horse : {elapsed_remove:8.4f} s')
+    print(f'  change filters : {elapsed_filter:8.4f} s')
+
+
+def benchmark_odds(filter_params: dict):
+    '''
+    合成オッズの条件の有無で処理時間を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+    odds_filter_params = dict(filter_params, odds_min=[1000.0], odds_max=[1000000.0])
+
+    elapsed_base, base = measure(
+        calc_packed_tickets, legs, filter_params, repeat=3)
+    elapsed_odds, result = measure(
+        calc_packed_tickets, legs, odds_filter_params, repeat=3)
+
+    print('[odds] 18x18x18x18x18 odds=1000-1000000')
+    print(f'  without odds: {elapsed_base:8.3f} s ({len(base)} tickets)')
+    print(f'  with odds   : {elapsed_odds:8.3f} s ({len(result)} tickets)')
+
+
+def benchmark_expression():
+    '''
+    人気和、枠のチェックボックスと同じ条件を抽出式で指定した場合の処理時間を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+    checkbox_filter_params = {'ninkiwa': list(range(20, 40)), 'waku': [0]}
+    expression_filter_params = {
+        'expression': ['sum(pop) between 20 and 39 and not all(waku >= 7)']}
+
+    elapsed_checkbox, checkbox = measure(
+        calc_packed_tickets, legs, checkbox_filter_params, repeat=3)
+    elapsed_expression, expression = measure(
+        calc_packed_tickets, legs, expression_filter_params, repeat=3)
+
+    print('[expression] 18x18x18x18x18 ninkiwa=20-39 waku=0')
+    print(f'  checkbox  : {elapsed_checkbox:8.3f} s ({len(checkbox)} tickets)')
+    print(f'  expression: {elapsed_expression:8.3f} s ({len(expression)} tickets)')
+
+
+def benchmark_top_k(k: int):
+    '''
+    全件を並べ替える場合とチャンクごとに上位k件を選択する場合の処理時間を比較する処理
+    '''
+    df = create_race_details(FULL_FIELD_HORSE_CNT)
+    race_card = RaceCard(df)
+    packed = calc_packed_tickets(get_leg_arrays(df), {})
+
+    def sort_all():
+        log_probs = sum(partial_lookup_values(
+            race_card.lookups, packed)(IMPLIED_LOG_PROB_COLUMN))
+        return packed[np.argsort(-log_probs, kind='stable')[:k]]
+
+    elapsed_sort, _ = measure(sort_all, repeat=3)
+    elapsed_top_k, _ = measure(
+        lambda: select_top_k_tickets(packed, race_card.lookups, k), repeat=3)
+
+    print(f'[top k] 18x18x18x18x18 {len(packed)} tickets k={k}')
+    print(f'  sort all     : {elapsed_sort:8.3f} s')
+    print(f'  argpartition : {elapsed_top_k:8.3f} s')
+
+
+def benchmark_box_cover(filter_params: dict):
+    '''
+    組合せをフォーメーションで覆う処理時間と圧縮率、削減できる入力操作数を計測する処理
+    '''
+    df = create_race_details(FULL_FIELD_HORSE_CNT)
+    packed = calc_packed_tickets(get_leg_arrays(df), filter_params)
+
+    elapsed, boxes = measure(calc_box_cover, packed)
+    report = get_box_cover_report(len(packed), boxes)
+
+    print(f'[box cover] 18x18x18x18x18 {filter_params}')
+    print(f'  elapsed          : {elapsed:8.3f} s')
+    print(f'  tickets / boxes  : {report["ticket_cnt"]} / {report["box_cnt"]} (ratio {report["compression_ratio"]:.1f})')
+    print(f'  entry operations : {report["ticket_operations"]} -> {report["box_operations"]}')
+
+
+def benchmark_filter_order(filter_params: dict):
+    '''
+    抽出条件をget_filter_stagesの順に直積全体へ適用する場合と、
+    効率のよい順に並べ替えて残った組合せのみに適用する場合の処理時間を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+
+    elapsed_fixed, fixed = measure(
+        lambda: calc_packed_tickets(legs, filter_params, adaptive=False), repeat=3)
+    elapsed_adaptive, adaptive = measure(
+        lambda: calc_packed_tickets(legs, filter_params), repeat=3)
+    order = [name for name, _ in get_ordered_filter_stages(legs, filter_params)]
+
+    print(f'[filter order] 18x18x18x18x18 {sorted(filter_params)}')
+    print(f'  adaptive order: {order}')
+    print(f'  fixed   : {elapsed_fixed:8.3f} s ({len(fixed)} tickets)')
+    print(f'  adaptive: {elapsed_adaptive:8.3f} s ({len(adaptive)} tickets)')
+
+
+def benchmark_dead_horses(filter_params: dict):
+    '''
+    どの組合せにも含まれない馬を除いてから全列挙する場合と、そのまま全列挙する場合の処理時間を比較する処理
+    '''
+    legs = get_leg_arrays(create_race_details(FULL_FIELD_HORSE_CNT))
+
+    elapsed_full, full = measure(
+        calc_packed_tickets, legs, filter_params, repeat=3)
+    elapsed_drop, dropped = measure(
+        lambda: calc_packed_tickets(drop_dead_horses(legs, filter_params), filter_params), repeat=3)
+    alive_cnt = sum(alive.sum()
+                    for alive in calc_alive_horses(legs, filter_params))
+
+    print(f'[dead horses] 18x18x18x18x18 {filter_params}')
+    print(f'  alive horses       : {alive_cnt} / {FULL_FIELD_HORSE_CNT * LEG_COUNT}')
+    print(f'  brute force        : {elapsed_full:8.3f} s ({len(full)} tickets)')
+    print(f'  drop + brute force : {elapsed_drop:8.3f} s ({len(dropped)} tickets)')
+
+
+if __name__ == '__main__':
+    benchmark_vectorized({'ninkiwa': [], 'ninki_tousu': [],
+                          'waku': [], 'horse_num': []})
+    benchmark_vectorized({'ninkiwa': list(range(20, 40)), 'ninki_tousu': [0, 1],
+                          'waku': [0, 1], 'horse_num': [0, 1]})
+    benchmark_chunks({'ninkiwa': [], 'ninki_tousu': [],
+                      'waku': [], 'horse_num': []})
+    benchmark_parallel({'ninkiwa': list(range(20, 40)), 'ninki_tousu': [0, 1],
+                        'waku': [0, 1], 'horse_num': [0, 1]})
+    for horse_cnt in (10, 18):
+        for ninkiwa in (range(8, 13), range(20, 30), range(40, 50), range(25, 65)):
+            benchmark_enumeration_methods(horse_cnt, {'ninkiwa': list(ninkiwa), 'ninki_tousu': [],
+                                                      'waku': [0], 'horse_num': [0]})
+    benchmark_incremental({'ninkiwa': list(range(20, 40)), 'ninki_tousu': [0, 1],
+                           'waku': [0, 1], 'horse_num': [0, 1]})
+    benchmark_odds({'ninkiwa': [], 'ninki_tousu': [],
+                    'waku': [], 'horse_num': []})
+    benchmark_top_k(200)
+    benchmark_expression()
+    benchmark_box_cover({'ninkiwa': list(range(10, 16)), 'ninki_tousu': [],
+                         'waku': [], 'horse_num': []})
+    benchmark_box_cover({'ninkiwa': list(range(20, 40)), 'ninki_tousu': [0, 1],
+                         'waku': [0, 1], 'horse_num': [0, 1]})
+    benchmark_filter_order({'ninkiwa': list(range(20, 40)), 'ninki_tousu': [0, 1],
+                            'waku': [0, 1], 'horse_num': [0, 1]})
+    benchmark_filter_order({'ninkiwa': list(range(20, 30)), 'waku': [0, 1], 'horse_num': [0, 1],
+                            'odds_min': [1000.0], 'odds_max': [1000000.0]})
+    benchmark_filter_order({'ninkiwa': list(range(15, 25)), 'waku': [0],
+                            'expression': ['sum(odds) > 40 and count(pop <= 3) >= 2']})
+    benchmark_filter_order({'waku': [0, 1], 'horse_num': [0, 1],
+                            'expression': ['count(pop <= 3) >= 3']})
+    benchmark_dead_horses({'ninkiwa': list(range(10, 16))})
+    benchmark_dead_horses({'ninkiwa': list(range(10, 25)), 'odds_max': [5000.0]})
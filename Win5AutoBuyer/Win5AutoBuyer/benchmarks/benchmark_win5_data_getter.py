@@ -0,0 +1,138 @@
+'''
+出馬表の解析処理のベンチマーク
+Win5AutoBuyer直下で python benchmarks/benchmark_win5_data_getter.py として実行する
+'''
+# 標準モジュール
+import os
+import sys  # nopep8
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+
+# インストールモジュール
+import pandas as pd
+from bs4 import BeautifulSoup as bs
+
+# 自作モジュール
+from win5_data_getter import parse_entry_horce_info  # nopep8
+
+# 保存済みの出馬表のページ
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data')
+SYUTSUBA_PAGE_FILES = ['syutsuba_odds.html',
+                       'syutsuba_entry.html', 'syutsuba_undecided.html']
+
+
+def parse_entry_horce_info_bs(content: bytes, race_date: str, race_no: str) -> pd.DataFrame:
+    '''
+    従来のBeautifulSoup(html.parser)で列ごとにCSSセレクタで検索する出馬表の解析処理(比較用)
+    '''
+    soup = bs(content, 'html.parser')
+
+    tbody = soup.select_one('#syutsuba > table > tbody')
+
+    # 枠番
+    if tbody.select_one('tr > td.waku > img') is not None:
+        waku_list = [int(waku_img.attrs['alt'][1:-1])
+                     for waku_img in tbody.select('tr > td.waku > img')]
+    else:
+        waku_list = [int(waku.text.replace('\n', '')) if waku.text.replace('\n', '') != '' else -1
+                     for waku in tbody.select('tr > td.waku')]
+
+    # 馬番
+    num_list = [int(num.text.replace('\n', '')) if num.text.replace('\n', '') != '' else -1
+                for num in tbody.select('tr > td.num')]
+
+    # 馬名
+    horse_name_list = [hourse_name.text.replace('\n', '').replace('\r', '') for hourse_name in tbody.select(
+        'tr > td.horse > div.name_line > div.name > a')]
+
+    # オッズ
+    if tbody.select_one(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong') is not None:
+        odds_list = [float(odds_num.text) for odds_num in tbody.select(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong')]
+    else:
+        odds_list = [-1 for rg in range(len(horse_name_list))]
+
+    # 人気
+    if tbody.select_one(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank') is not None:
+        pop_rank_list = [int(pop_rank.text.replace('(', '').replace('番人気)', '')) for pop_rank in tbody.select(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank')]
+    else:
+        pop_rank_list = [-1 for rg in range(len(horse_name_list))]
+
+    # 調教師名
+    trainer_list = [trainer.text for trainer in tbody.select(
+        'tr > td.horse > p.trainer')]
+
+    # 年齢
+    age_list = [age.text for age in tbody.select('tr > td.jockey > p.age')]
+
+    # 斤量
+    weight_list = [float(weight.next.text.replace('\r\n', '')) if weight.next.text.replace('\r\n', '') != '' else -1
+                   for weight in tbody.select('tr > td.jockey > p.weight')]
+
+    # ジョッキー
+    jockey_list = [jockey.text for jockey in tbody.select(
+        'tr > td.jockey > p.jockey > a')]
+
+    # コース
+    course_list = [soup.select_one('div.cell.course').text.replace(
+        '\n', '').replace('コース：', '') for _ in range(len(horse_name_list))]
+
+    # ハンデ
+    handicap_list = [soup.select_one('div.cell.weight').text.replace(
+        '\n', '') for _ in range(len(horse_name_list))]
+
+    # DF変換
+    return pd.DataFrame({
+        'レース日付': [race_date for _ in range(len(horse_name_list))],
+        'レース番号': [race_no for _ in range(len(horse_name_list))],
+        '枠番': waku_list,
+        '馬番': num_list,
+        '馬名': horse_name_list,
+        'オッズ': odds_list,
+        '人気': pop_rank_list,
+        '調教師名': trainer_list,
+        '年齢': age_list,
+        '斤量': weight_list,
+        'ジョッキー': jockey_list,
+        'コース': course_list,
+        'ハンデ': handicap_list,
+    })
+
+
+def measure(func, *args, repeat: int = 1):
+    '''
+    処理時間の最小値を計測する処理
+    '''
+    elapsed_list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func(*args)
+        elapsed_list.append(time.perf_counter() - start)
+
+    return min(elapsed_list), ret
+
+
+def benchmark_parse_entry_horce_info(file_name: str, repeat: int = 20):
+    '''
+    従来の解析処理と、lxmlで行を1度だけ走査する解析処理の処理時間を比較する処理
+    '''
+    with open(os.path.join(TEST_DATA_DIR, file_name), 'rb') as f:
+        content = f.read()
+
+    elapsed_bs, expected = measure(
+        parse_entry_horce_info_bs, content, '2022-12-18', 1, repeat=repeat)
+    elapsed_lxml, result = measure(
+        parse_entry_horce_info, content, '2022-12-18', 1, repeat=repeat)
+
+    print(f'[parse race card] {file_name} ({len(content)} bytes, {len(result)} horses)')
+    print(f'  bs4 html.parser: {elapsed_bs * 1000:8.3f} ms')
+    print(f'  lxml single pass: {elapsed_lxml * 1000:8.3f} ms (x{elapsed_bs / elapsed_lxml:.1f})')
+    print(f'  same result      : {result.equals(expected)}')
+
+
+if __name__ == '__main__':
+    for file_name in SYUTSUBA_PAGE_FILES:
+        benchmark_parse_entry_horce_info(file_name)
@@ -13,12 +13,36 @@ scraping_config = ConfigManager(
 ACCESS_INTERVAL = int(scraping_config.get_config_by_param_name(
     'ACCESS_INTERVAL'))
 
+FETCH_WORKER_COUNT = int(scraping_config.get_config_by_param_name(
+    'FETCH_WORKER_COUNT'))
+
 USER_AGENT = scraping_config.get_config_by_param_name(
     'USER_AGENT')
 
 TIME_OUT = int(scraping_config.get_config_by_param_name(
     'TIME_OUT'))
 
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = [resource_type.strip() for resource_type in scraping_config.get_config_by_param_name(
+    'PLAYWRIGHT_BLOCKED_RESOURCE_TYPES').split(',') if resource_type.strip() != '']
+
+HTTP_RETRY_COUNT = int(scraping_config.get_config_by_param_name(
+    'HTTP_RETRY_COUNT'))
+
+HTTP_BACKOFF_BASE = float(scraping_config.get_config_by_param_name(
+    'HTTP_BACKOFF_BASE'))
+
+HTTP_BACKOFF_MAX = float(scraping_config.get_config_by_param_name(
+    'HTTP_BACKOFF_MAX'))
+
+HTTP_CACHE_DIR = scraping_config.get_config_by_param_name(
+    'HTTP_CACHE_DIR')
+
+HTTP_CACHE_TTL_RACE_CARD = int(scraping_config.get_config_by_param_name(
+    'HTTP_CACHE_TTL_RACE_CARD'))
+
+HTTP_CACHE_TTL_ODDS = int(scraping_config.get_config_by_param_name(
+    'HTTP_CACHE_TTL_ODDS'))
+
 ENCODING = scraping_config.get_config_by_param_name(
     'ENCODING')
 
@@ -44,6 +68,18 @@ GET_WIN5_RACE_DETAIL_SQL = db_config.get_config_by_param_name(
 GET_WIN5_RACE_DETAIL_BY_DATE_ONLY_SQL = db_config.get_config_by_param_name(
     'GET_WIN5_RACE_DETAIL_BY_DATE_ONLY_SQL')
 
+TICKET_STORE_DIR = db_config.get_config_by_param_name(
+    'TICKET_STORE_DIR')
+
+WIN5_TICKET_SETS_TABLE_NAME = db_config.get_config_by_param_name(
+    'WIN5_TICKET_SETS_TABLE_NAME')
+
+CREATE_WIN5_TICKET_SETS_SQL = db_config.get_config_by_param_name(
+    'CREATE_WIN5_TICKET_SETS_SQL')
+
+GET_WIN5_TICKET_SET_SQL = db_config.get_config_by_param_name(
+    'GET_WIN5_TICKET_SET_SQL')
+
 # コンフィグファイル読み込み
 jra_config = ConfigManager(
     CONFIG_FILE_PATH, 'JRA_CONFIG', encoding='utf-8')
@@ -71,3 +107,20 @@ SOKU_PAT_P_ARS_NUM = jra_config.get_config_by_param_name(
 
 BUY_AMOUNT_PER_1TICKET = jra_config.get_config_by_param_name(
     'BUY_AMOUNT_PER_1TICKET')
+
+MAX_PURCHASE_AMOUNT = int(jra_config.get_config_by_param_name(
+    'MAX_PURCHASE_AMOUNT'))
+
+# コンフィグファイル読み込み
+engine_config = ConfigManager(
+    CONFIG_FILE_PATH, 'ENGINE_CONFIG', encoding='utf-8')
+
+# 0の場合はCPUコア数を使用する
+ENGINE_WORKER_COUNT = int(engine_config.get_config_by_param_name(
+    'WORKER_COUNT')) or os.cpu_count()
+
+ENGINE_PARALLEL_MIN_COMBINATIONS = int(engine_config.get_config_by_param_name(
+    'PARALLEL_MIN_COMBINATIONS'))
+
+ENGINE_CACHE_MAX_BYTES = int(engine_config.get_config_by_param_name(
+    'CACHE_MAX_BYTES'))
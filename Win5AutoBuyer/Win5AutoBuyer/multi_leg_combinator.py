@@ -0,0 +1,195 @@
+# 標準モジュール
+import inspect
+import os
+
+# インストールモジュール
+import numpy as np
+import pandas as pd
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+from win5_combination_engine import DEFAULT_CHUNK_SIZE, HORSE_NUM_BITS, FilterFunnel, calc_box_cover, calc_packed_tickets_auto, calc_product_size, count_combinations, expand_boxes, get_box_cover_report, get_leg_arrays, iter_unpacked_chunks, pack_tickets, unpack_tickets  # nopep8
+
+# 定数
+# 1組合せを詰める整数のビット数
+PACKED_BITS = 32
+
+# 1組合せを1つのuint32に詰められるレース数の上限
+MAX_LEG_COUNT = PACKED_BITS // HORSE_NUM_BITS
+
+
+class MultiLegCombinator():
+    '''
+    複数レースの1着を当てる馬券(WIN5など)の組合せを、レース数によらず同じ方法で算出するクラス
+    列挙、抽出条件の適用、フォーメーションへの圧縮は組合せエンジンの関数をそのまま使用し、
+    レース数の確認と並列計算への切替えのみをここで行う
+    '''
+
+    def __init__(self, leg_count: int, worker_cnt: int = 1, parallel_min_combinations: int = 0):
+        '''
+        コンストラクタ
+            Params
+                leg_count: int
+                    対象レース数(1以上MAX_LEG_COUNT以下)
+                worker_cnt: int = 1
+                    全列挙の場合に並列計算に使用するワーカープロセス数
+                parallel_min_combinations: int = 0
+                    並列計算に切り替える組合せ数(抽出条件適用前)の下限
+        '''
+        if leg_count < 1 or leg_count > MAX_LEG_COUNT:
+            raise ValueError(
+                f'レース数は1以上{MAX_LEG_COUNT}以下で指定してください。: {leg_count}')
+
+        self.leg_count = leg_count
+        self.worker_cnt = worker_cnt
+        self.parallel_min_combinations = parallel_min_combinations
+
+    def check_legs(self, legs: list):
+        '''
+        レースごとの配列のlistがレース数と一致することを確認する処理
+            Params
+                legs: list
+                    レースごとの配列が入ったdictのlist
+        '''
+        if len(legs) != self.leg_count:
+            raise ValueError(
+                f'{self.leg_count}レース分の配列が必要です。: {len(legs)}')
+
+    def get_legs(self, df_target_race_details: pd.DataFrame) -> list:
+        '''
+        選択された出走馬のレース詳細から、レースごとの配列を取得する処理
+            Params
+                df_target_race_details: pd.DataFrame
+                    選択された出走馬のレース詳細(レース番号は1始まり)
+            Returns
+                レースごとに{列名: 配列}のdictを格納したlist
+        '''
+        return get_leg_arrays(df_target_race_details, self.leg_count)
+
+    def count(self, legs: list, filter_params: dict) -> int:
+        '''
+        組合せを列挙せずに、人気和と1番人気頭数の抽出条件を満たす組合せ数を算出する処理
+        枠、馬番、オッズ、抽出式の抽出条件は考慮しない
+            Params
+                legs: list
+                    レースごとの配列が入ったdictのlist
+                filter_params: dict
+                    抽出条件ごとの選択値
+            Returns
+                組合せ数
+        '''
+        self.check_legs(legs)
+
+        return count_combinations(legs, filter_params)
+
+    def calc_tickets(self, legs: list, filter_params: dict, funnel: FilterFunnel = None) -> np.ndarray:
+        '''
+        抽出条件を満たす組合せを算出する処理
+        全列挙、枝刈り、半分全列挙のうち見積もり処理時間が最小の方法で算出し、
+        全列挙となった場合、組合せ数が多ければ複数プロセスで並列に算出する
+            Params
+                legs: list
+                    レースごとの配列が入ったdictのlist
+                filter_params: dict
+                    抽出条件ごとの選択値
+                funnel: FilterFunnel = None
+                    抽出条件ごとの除外数の集計先
+            Returns
+                昇順かつ重複なしの組合せを詰めたuint32配列
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        self.check_legs(legs)
+
+        worker_cnt = self.worker_cnt if calc_product_size(
+            legs) >= self.parallel_min_combinations else 1
+        packed = calc_packed_tickets_auto(
+            legs, filter_params, worker_cnt=worker_cnt, funnel=funnel)
+
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+        return packed
+
+    def pack(self, tickets: np.ndarray) -> np.ndarray:
+        '''
+        (組合せ数, レース数)の馬番配列を1組合せ1つのuint32に詰める処理
+            Params
+                tickets: np.ndarray
+                    (組合せ数, レース数)の馬番配列
+            Returns
+                組合せ数分のuint32配列
+        '''
+        if tickets.ndim != 2 or tickets.shape[1] != self.leg_count:
+            raise ValueError(
+                f'(組合せ数, {self.leg_count})の馬番配列が必要です。: {tickets.shape}')
+
+        return pack_tickets(tickets)
+
+    def unpack(self, packed: np.ndarray) -> np.ndarray:
+        '''
+        詰めた組合せを(組合せ数, レース数)の馬番配列に戻す処理
+            Params
+                packed: np.ndarray
+                    組合せを詰めたuint32配列
+            Returns
+                (組合せ数, レース数)のuint8馬番配列
+        '''
+        return unpack_tickets(packed, self.leg_count)
+
+    def iter_unpacked(self, packed: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        '''
+        詰めた組合せをchunk_size件ずつ馬番配列に戻して返すジェネレーター
+            Params
+                packed: np.ndarray
+                    組合せを詰めたuint32配列
+                chunk_size: int = DEFAULT_CHUNK_SIZE
+                    1チャンクあたりの組合せ数
+            Yields
+                (chunk_size, レース数)のuint8馬番配列
+        '''
+        return iter_unpacked_chunks(packed, chunk_size, self.leg_count)
+
+    def compress(self, packed: np.ndarray) -> np.ndarray:
+        '''
+        組合せを過不足なく覆うフォーメーション(レースごとの馬番の集合の直積)に圧縮する処理
+            Params
+                packed: np.ndarray
+                    昇順かつ重複なしの組合せを詰めたuint32配列
+            Returns
+                (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+        '''
+        return calc_box_cover(packed, self.leg_count)
+
+    def expand(self, boxes: np.ndarray) -> np.ndarray:
+        '''
+        フォーメーションを組合せに展開する処理
+            Params
+                boxes: np.ndarray
+                    (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+            Returns
+                昇順かつ重複なしの組合せを詰めたuint32配列
+        '''
+        return expand_boxes(boxes)
+
+    def get_compression_report(self, ticket_cnt: int, boxes: np.ndarray) -> dict:
+        '''
+        フォーメーションへの圧縮による入力操作の削減量を集計する処理
+            Params
+                ticket_cnt: int
+                    組合せ数
+                boxes: np.ndarray
+                    (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+            Returns
+                get_box_cover_reportと同じdict
+        '''
+        return get_box_cover_report(ticket_cnt, boxes)
@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS Win5TicketSets (
+    選択ハッシュ TEXT PRIMARY KEY,
+    レース日付 TEXT,
+    抽出条件 TEXT,
+    オッズハッシュ TEXT,
+    組合せ点数 INTEGER,
+    ファイル名 TEXT,
+    作成日時 TEXT
+);
@@ -0,0 +1,6 @@
+SELECT
+    * 
+FROM
+    Win5TicketSets 
+WHERE
+    選択ハッシュ == :fingerprint;
@@ -0,0 +1,231 @@
+import pytest
+import threading
+import time
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from utilities.browser_session import *
+
+
+class FakeRequest():
+    '''
+    test用のplaywrightのリクエスト(リソースの種類のみ)
+    '''
+
+    def __init__(self, resource_type: str):
+        self.resource_type = resource_type
+
+
+class FakeRoute():
+    '''
+    test用のplaywrightのルート(中止、続行の呼出のみ記録する)
+    '''
+
+    def __init__(self, resource_type: str):
+        self.request = FakeRequest(resource_type)
+        self.result = None
+
+    def abort(self):
+        self.result = 'abort'
+
+    def continue_(self):
+        self.result = 'continue'
+
+
+def test_browser_session_run():
+    '''
+    BrowserSession.runのテスト
+    呼出元のスレッドによらず、同じ専用スレッドで実行され、戻り値と例外が呼出元に返ることを確認する
+    '''
+    session = BrowserSession(USER_AGENT, TIME_OUT)
+
+    def get_thread_id(session, offset):
+        return threading.get_ident() + offset
+
+    def raise_error(session):
+        raise ValueError('error')
+
+    thread_ids = []
+    threads = [threading.Thread(target=lambda: thread_ids.append(session.run(get_thread_id, 0)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    thread_ids.append(session.run(get_thread_id, offset=0))
+
+    result_list = []
+    result_list.append(len(set(thread_ids)) == 1)
+    result_list.append(thread_ids[0] != threading.get_ident())
+    with pytest.raises(ValueError):
+        session.run(raise_error)
+    # 例外の後も同じ専用スレッドで実行できる
+    result_list.append(session.run(get_thread_id, 1) == thread_ids[0] + 1)
+
+    session.close()
+    result_list.append(session.worker is None)
+
+    assert all(result_list)
+
+
+def test_browser_session_handle_route():
+    '''
+    BrowserSession.handle_routeのテスト
+    指定した種類のリソースのみ中止され、中止した件数が数えられることを確認する
+    '''
+    session = BrowserSession(
+        USER_AGENT, TIME_OUT, ['image', 'font', 'stylesheet', 'media'])
+    routes = [FakeRoute(resource_type) for resource_type in
+              ['document', 'image', 'script', 'stylesheet', 'font', 'xhr', 'media']]
+    for route in routes:
+        session.handle_route(route)
+
+    result_list = []
+    result_list.append([route.result for route in routes] == [
+        'continue', 'abort', 'continue', 'abort', 'abort', 'continue', 'abort'])
+    result_list.append(session.blocked_cnt == 4)
+    result_list.append(not BrowserSession(
+        USER_AGENT, TIME_OUT).is_blocked('image'))
+
+    assert all(result_list)
+
+
+def test_browser_session_step():
+    '''
+    BrowserSession.stepのテスト
+    手順ごとに回数と処理時間が集計され、例外が発生した場合も記録されることを確認する
+    '''
+    session = BrowserSession(USER_AGENT, TIME_OUT)
+    for _ in range(3):
+        with session.step('セット'):
+            time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with session.step('ログイン'):
+            raise ValueError('error')
+
+    report = session.get_timing_report()
+
+    result_list = []
+    result_list.append(report['セット']['count'] == 3)
+    result_list.append(report['セット']['total'] >= 0.03)
+    result_list.append(report['セット']['average']
+                       == report['セット']['total'] / 3)
+    result_list.append(report['ログイン']['count'] == 1)
+    session.log_timings()
+    result_list.append(session.get_timing_report() == {})
+
+    assert all(result_list)
+
+
+class FakeContext():
+    '''
+    test用のplaywrightのコンテキスト(ルートの設定のみ記録する)
+    '''
+
+    def __init__(self):
+        self.routes = []
+
+    def set_default_timeout(self, timeout):
+        pass
+
+    def route(self, url, handler):
+        self.routes.append(url)
+
+    def close(self):
+        pass
+
+
+class FakeBrowser():
+    '''
+    test用のplaywrightのブラウザ
+    '''
+
+    def __init__(self, headless: bool):
+        self.headless = headless
+        self.context = FakeContext()
+
+    def is_connected(self):
+        return True
+
+    def new_context(self, user_agent):
+        return self.context
+
+    def close(self):
+        pass
+
+
+class FakeChromium():
+    '''
+    test用のplaywrightのchromium(起動したブラウザを記録する)
+    '''
+
+    def __init__(self):
+        self.browsers = []
+
+    def launch(self, headless):
+        self.browsers.append(FakeBrowser(headless))
+        return self.browsers[-1]
+
+
+class FakePlaywright():
+    '''
+    test用のplaywright
+    '''
+
+    def __init__(self):
+        self.chromium = FakeChromium()
+
+    def stop(self):
+        pass
+
+
+def test_browser_session_get_context():
+    '''
+    BrowserSession.get_contextのテスト
+    リソースを読み込まない設定はヘッドレスのブラウザ(スクレイピング用)のみに適用され、
+    購入に使用するヘッドレスでないブラウザは全て読み込むことを確認する
+    '''
+    session = BrowserSession(
+        USER_AGENT, TIME_OUT, ['image', 'font', 'stylesheet', 'media'])
+    session.playwright = FakePlaywright()
+
+    headless_context = session.get_context(True)
+    headful_context = session.get_context(False)
+
+    result_list = []
+    result_list.append(headless_context.routes == ['**/*'])
+    result_list.append(headful_context.routes == [])
+    # 起動済みのブラウザは使い回す
+    result_list.append(session.get_context(True) is headless_context)
+    result_list.append(len(session.playwright.chromium.browsers) == 2)
+
+    assert all(result_list)
+
+
+def test_browser_session_start():
+    '''
+    BrowserSession.startのテスト
+    呼出元を待たせずに専用スレッドで指定したブラウザが起動され、以降は起動済みのブラウザが使われることを確認する
+    '''
+    session = BrowserSession(USER_AGENT, TIME_OUT, ['image'])
+    session.playwright = FakePlaywright()
+
+    future = session.start([True, False])
+    future.result()
+
+    contexts = session.run(lambda session: [session.get_context(
+        True), session.get_context(False)])
+
+    result_list = []
+    result_list.append(sorted(session.browsers.keys()) == [False, True])
+    result_list.append([browser.headless for browser in session.playwright.chromium.browsers] == [
+                       True, False])
+    result_list.append(contexts == [session.browsers[True][1], session.browsers[False][1]])
+    result_list.append('ブラウザ起動' in session.get_timing_report())
+
+    session.close()
+
+    assert all(result_list)
@@ -0,0 +1,99 @@
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from utilities.http_cache import *
+from utilities.http_client import HttpClient
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    '''
+    test用のHTTPサーバーのハンドラー
+    本文のETagがIf-None-Matchと一致する場合は304を返す
+    '''
+    protocol_version = 'HTTP/1.1'
+    body = b'version1'
+    request_cnt = 0
+
+    def do_GET(self):
+        ETagHandler.request_cnt += 1
+        etag = f'"{ETagHandler.body.decode()}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(ETagHandler.body)))
+        self.end_headers()
+        self.wfile.write(ETagHandler.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def get_server_url():
+    '''
+    test用のHTTPサーバー起動処理
+    '''
+    ETagHandler.body = b'version1'
+    ETagHandler.request_cnt = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_address[1]}/race'
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_cache(get_server_url, tmp_path):
+    '''
+    HttpCacheのテスト
+    有効期限内はリクエストを送らず、期限切れの場合は条件付きリクエストで更新を確認することを確認する
+    '''
+    url = get_server_url
+    cache = HttpCache(str(tmp_path), {'long': 3600, 'short': 0})
+    client = HttpClient('test-agent', 5, cache=cache)
+
+    result_list = []
+    result_list.append(client.get_with_cache(
+        url, 'long') == (b'version1', CACHE_MISS))
+
+    # 有効期限内はリクエストを送らない
+    result_list.append(client.get_with_cache(
+        url, 'long') == (b'version1', CACHE_HIT))
+    result_list.append(ETagHandler.request_cnt == 1)
+
+    # 有効期限が0秒の種類に変えると、条件付きリクエストを送り304が返る
+    cache.set_page_class(url, 'short')
+    result_list.append(client.get_with_cache(
+        url, 'long') == (b'version1', CACHE_REVALIDATED))
+    result_list.append(ETagHandler.request_cnt == 2)
+
+    # 更新された場合は新しい本文を取得する
+    ETagHandler.body = b'version2'
+    result_list.append(client.get_with_cache(
+        url, 'long') == (b'version2', CACHE_MISS))
+
+    # 保存した本文は再起動後(別のインスタンス)でも使用でき、圧縮して保存される
+    cache2 = HttpCache(str(tmp_path), {'long': 3600, 'short': 3600})
+    result_list.append(HttpClient('test-agent', 5, cache=cache2).get_with_cache(
+        url, 'long') == (b'version2', CACHE_HIT))
+    result_list.append(cache.load_body(url) == b'version2')
+
+    result_list.append(cache.counts == {
+                       CACHE_HIT: 1, CACHE_REVALIDATED: 1, CACHE_MISS: 2})
+
+    assert all(result_list)
@@ -0,0 +1,144 @@
+import pytest
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from utilities.http_client import *
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    '''
+    test用のHTTPサーバーのハンドラー
+    /flakyは最初の2回のみ503を返し、/downは常に503を返す
+    '''
+    protocol_version = 'HTTP/1.1'
+    flaky_cnt = 0
+    user_agents = []
+
+    def do_GET(self):
+        FlakyHandler.user_agents.append(self.headers.get('User-Agent'))
+
+        status = 200
+        if self.path == '/down':
+            status = 503
+        elif self.path == '/flaky':
+            FlakyHandler.flaky_cnt += 1
+            status = 503 if FlakyHandler.flaky_cnt <= 2 else 200
+
+        body = b'ok'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def get_server_url():
+    '''
+    test用のHTTPサーバー起動処理
+    '''
+    FlakyHandler.flaky_cnt = 0
+    FlakyHandler.user_agents = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_client(get_server_url):
+    '''
+    HttpClientのテスト
+    5xxの場合は再送され、接続が使い回されることを確認する
+    '''
+    url = get_server_url
+    client = HttpClient('test-agent', 5, retry_cnt=3,
+                        backoff_base=0.01, backoff_max=0.02)
+
+    result_list = []
+    result_list.append(client.get(f'{url}/flaky').status_code == 200)
+    result_list.append(client.get(f'{url}/ok').status_code == 200)
+
+    # 再送回数の上限まで5xxの場合は最後の応答を返す
+    result_list.append(client.get(f'{url}/down').status_code == 503)
+
+    stats = client.get_stats()
+    result_list.append(stats['request_cnt'] == 3 + 1 + 4)
+    result_list.append(stats['retry_cnt'] == 2 + 3)
+    result_list.append(stats['connection_cnt'] == 1)
+    result_list.append(stats['reused_cnt'] == 7)
+    result_list.append(
+        all([agent == 'test-agent' for agent in FlakyHandler.user_agents]))
+
+    assert all(result_list)
+
+
+class CountingRateLimiter():
+    '''
+    test用のレート制限(トークンの取得回数のみ数える)
+    '''
+
+    def __init__(self):
+        self.acquire_cnt = 0
+
+    def acquire(self):
+        self.acquire_cnt += 1
+
+
+def test_http_client_rate_limiter(get_server_url):
+    '''
+    HttpClientのテスト
+    再送の前に毎回レート制限のトークンを取得し、再送しない場合は取得しないことを確認する
+    '''
+    url = get_server_url
+    rate_limiter = CountingRateLimiter()
+    client = HttpClient('test-agent', 5, retry_cnt=3,
+                        backoff_base=0.01, backoff_max=0.02, rate_limiter=rate_limiter)
+
+    result_list = []
+    client.get(f'{url}/ok')
+    result_list.append(rate_limiter.acquire_cnt == 0)
+    client.get(f'{url}/flaky')
+    result_list.append(rate_limiter.acquire_cnt == 2)
+    client.get(f'{url}/down')
+    result_list.append(rate_limiter.acquire_cnt == 2 + 3)
+    result_list.append(client.get_stats()['retry_cnt'] == rate_limiter.acquire_cnt)
+
+    assert all(result_list)
+
+
+def test_http_client_connection_error():
+    '''
+    HttpClientのテスト
+    再送回数の上限まで接続エラーの場合は例外となることを確認する
+    '''
+    client = HttpClient('test-agent', 1, retry_cnt=2,
+                        backoff_base=0.01, backoff_max=0.02)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get('http://127.0.0.1:1/')
+
+    assert client.get_stats()['request_cnt'] == 3
+
+
+@pytest.mark.parametrize('attempt, expected_max', [(1, 2.0), (2, 4.0), (3, 8.0), (6, 30.0)])
+def test_http_client_get_backoff(attempt, expected_max):
+    '''
+    HttpClient.get_backoffのテスト
+    待ち時間は基準値×2^(n-1)(上限あり)の半分から等倍の間になることを確認する
+    '''
+    client = HttpClient('test-agent', 1, backoff_base=2.0, backoff_max=30.0)
+    backoffs = [client.get_backoff(attempt) for _ in range(100)]
+
+    assert all([expected_max / 2 <= backoff <= expected_max for backoff in backoffs])
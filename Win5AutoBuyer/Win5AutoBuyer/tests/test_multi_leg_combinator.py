@@ -0,0 +1,166 @@
+import pytest
+import itertools
+import pandas as pd
+import numpy as np
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_combination_engine import calc_packed_tickets, calc_packed_tickets_branch_and_bound, calc_packed_tickets_meet_in_the_middle
+from multi_leg_combinator import *
+
+
+def create_random_case(seed: int) -> tuple:
+    '''
+    test用のレース数、レース詳細、抽出条件をランダムに作成する処理
+    人気、オッズが未確定の馬も一定の割合で含める
+    '''
+    rng = np.random.default_rng(seed)
+    leg_count = int(rng.integers(1, MAX_LEG_COUNT + 1))
+
+    # 全列挙の参照実装が終わる大きさに抑える
+    max_horse_cnt = {1: 18, 2: 18, 3: 12, 4: 7, 5: 5, 6: 4}[leg_count]
+
+    rows = []
+    for race_no in range(1, leg_count + 1):
+        horse_cnt = int(rng.integers(1, max_horse_cnt + 1))
+        horse_nums = np.sort(rng.choice(
+            np.arange(1, 19), horse_cnt, replace=False))
+        for horse_num, popular in zip(horse_nums, rng.permutation(horse_cnt) + 1):
+            is_undecided = rng.random() < 0.05
+            rows.append({'レース番号': race_no, '馬番': int(horse_num),
+                         '枠番': min((int(horse_num) + 1) // 2, 8),
+                         '人気': -1 if is_undecided else int(popular),
+                         'オッズ': -1.0 if is_undecided else float(popular) * 1.9})
+
+    df = pd.DataFrame(rows)
+
+    filter_params = {'ninkiwa': [], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': []}
+    if rng.random() < 0.7:
+        center = int(rng.integers(leg_count, leg_count * 5 + 1))
+        filter_params['ninkiwa'] = list(range(center - 2, center + 3))
+    if rng.random() < 0.5:
+        filter_params['ninki_tousu'] = sorted(rng.choice(
+            leg_count + 1, int(rng.integers(1, leg_count + 2)), replace=False).tolist())
+    if rng.random() < 0.5:
+        filter_params['waku'] = sorted(rng.choice(
+            2, int(rng.integers(1, 3)), replace=False).tolist())
+    if rng.random() < 0.5:
+        filter_params['horse_num'] = sorted(rng.choice(
+            2, int(rng.integers(1, 3)), replace=False).tolist())
+    if rng.random() < 0.3:
+        filter_params['odds_min'] = [float(1.9 ** leg_count * 2)]
+    if rng.random() < 0.3:
+        filter_params['odds_max'] = [float(1.9 ** leg_count * 200)]
+
+    return leg_count, df, filter_params
+
+
+def calc_tickets_reference(df: pd.DataFrame, leg_count: int, filter_params: dict) -> list:
+    '''
+    1組合せずつ判定する、レース数によらない組合せ算出処理
+    '''
+    legs = [df.loc[df['レース番号'] == race_no].to_dict('records')
+            for race_no in range(1, leg_count + 1)]
+    odds_min = filter_params.get('odds_min', [])
+    odds_max = filter_params.get('odds_max', [])
+
+    ret = []
+    for races in itertools.product(*legs):
+        ninki_list = [race['人気'] for race in races]
+        waku_list = [race['枠番'] for race in races]
+        horse_num_list = [race['馬番'] for race in races]
+        odds = np.prod([race['オッズ'] for race in races])
+
+        if -1 in ninki_list:
+            continue
+        if len(filter_params['ninkiwa']) > 0 and sum(ninki_list) not in filter_params['ninkiwa']:
+            continue
+        if len(filter_params['ninki_tousu']) > 0 and ninki_list.count(1) not in filter_params['ninki_tousu']:
+            continue
+        if 0 in filter_params['waku'] and all(waku >= 7 for waku in waku_list):
+            continue
+        if 1 in filter_params['waku'] and all(waku <= 2 for waku in waku_list):
+            continue
+        if 0 in filter_params['horse_num'] and all(num % 2 != 0 for num in horse_num_list):
+            continue
+        if 1 in filter_params['horse_num'] and all(num % 2 == 0 for num in horse_num_list):
+            continue
+        if len(odds_min) > 0 and odds < odds_min[0] * (1 - 1e-9):
+            continue
+        if len(odds_max) > 0 and odds > odds_max[0] * (1 + 1e-9):
+            continue
+
+        ret.append(horse_num_list)
+
+    return ret
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_multi_leg_combinator(seed):
+    '''
+    MultiLegCombinatorのテスト
+    ランダムなレース数、出走馬、抽出条件について、以下を確認する
+        算出方法によらず、1組合せずつ判定した組合せと一致する
+        列挙せずに数えた組合せ数(人気和、1番人気頭数のみ)が一致する
+        詰めた組合せ、フォーメーションから元の組合せに戻せる
+    '''
+    leg_count, df, filter_params = create_random_case(seed)
+    combinator = MultiLegCombinator(leg_count)
+    legs = combinator.get_legs(df)
+
+    expected_tickets = np.array(calc_tickets_reference(
+        df, leg_count, filter_params), dtype=np.uint8).reshape(-1, leg_count)
+    expected = np.unique(combinator.pack(expected_tickets)).tolist()
+
+    result_list = []
+    result_list.append(combinator.calc_tickets(
+        legs, filter_params).tolist() == expected)
+    result_list.append(calc_packed_tickets(
+        legs, filter_params).tolist() == expected)
+    result_list.append(calc_packed_tickets_branch_and_bound(
+        legs, filter_params).tolist() == expected)
+    # 半分全列挙は前半、後半のどちらが0レースでも同じ結果になる
+    for split_leg_cnt in range(leg_count + 1):
+        result_list.append(calc_packed_tickets_meet_in_the_middle(
+            legs, filter_params, split_leg_cnt).tolist() == expected)
+    # 列挙せずに数えられるのは人気和、1番人気頭数のみ
+    count_params = {'ninkiwa': filter_params['ninkiwa'], 'ninki_tousu': filter_params['ninki_tousu'],
+                    'waku': [], 'horse_num': []}
+    result_list.append(combinator.count(legs, count_params) == len(
+        calc_tickets_reference(df, leg_count, count_params)))
+
+    packed = np.array(expected, dtype=np.uint32)
+    result_list.append(combinator.unpack(packed).tolist()
+                       == sorted(expected_tickets.tolist()))
+
+    # フォーメーションは組合せを重複なく覆う
+    boxes = combinator.compress(packed)
+    box_sizes = [int(np.prod([bin(int(bits)).count('1') for bits in box]))
+                 for box in boxes]
+    result_list.append(combinator.expand(boxes).tolist() == expected)
+    result_list.append(sum(box_sizes) == len(expected))
+
+    assert all(result_list)
+
+
+def test_multi_leg_combinator_leg_count():
+    '''
+    MultiLegCombinatorのテスト
+    レース数が範囲外の場合、配列のレース数が一致しない場合はValueErrorとなることを確認する
+    '''
+    combinator = MultiLegCombinator(3)
+    legs = [{'馬番': np.array([1], dtype=np.int16), '枠番': np.array([1], dtype=np.int16),
+             '人気': np.array([1], dtype=np.int16)}] * 2
+
+    with pytest.raises(ValueError):
+        MultiLegCombinator(0)
+    with pytest.raises(ValueError):
+        MultiLegCombinator(MAX_LEG_COUNT + 1)
+    with pytest.raises(ValueError):
+        combinator.calc_tickets(legs, {})
+    with pytest.raises(ValueError):
+        combinator.pack(np.ones((2, 2), dtype=np.uint8))
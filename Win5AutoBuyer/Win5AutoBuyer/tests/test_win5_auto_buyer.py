@@ -7,7 +7,7 @@ import sys  # nopep8
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
 from config.settings import *  # nopep8
 
-from pywebio.output import Output, span_
+from pywebio.output import span_
 
 from win5_auto_buyer import *
 
@@ -33,20 +33,36 @@ def get_test_data():
     return s_race_detail
 
 
-def test_get_tab_table_vals_chk_lbls(get_test_data):
+class FakeOutput():
+    '''
+    test用の出力オブジェクト
+    pywebioのセッション外でput_checkbox、put_scopeを呼ぶとサーバーが起動してしまうため、呼出内容のみ記録する
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+def test_get_tab_table_vals_chk_lbls(get_test_data, monkeypatch):
     '''
     get_tab_table_vals_chk_lblsのテスト
-    指定した内容で正しく処理できているかどうかを確認する
+    指定した内容で正しく処理できているかどうか、選択済みの馬のチェックボックスが選択状態になるかどうかを確認する
     '''
+    monkeypatch.setattr(sys.modules['win5_auto_buyer'], 'put_checkbox', FakeOutput)
+    monkeypatch.setattr(sys.modules['win5_auto_buyer'], 'put_scope', FakeOutput)
+    monkeypatch.setattr(sys.modules['win5_auto_buyer'], 'put_text', FakeOutput)
 
     s_race_detail = get_test_data
+    selected_key = (s_race_detail['レース番号'], s_race_detail['馬番'])
 
-    result = get_tab_table_vals_chk_lbls(s_race_detail)
+    result = get_tab_table_vals_chk_lbls(s_race_detail, {selected_key})
+    result_not_selected = get_tab_table_vals_chk_lbls(s_race_detail, set())
 
     value_list = result['tab_vals']
     is_equal_waku = value_list[0] == s_race_detail['枠番']
     is_equal_horse_no = value_list[1] == s_race_detail['馬番']
-    is_equal_chk_box = isinstance(value_list[2], Output)
+    is_equal_chk_box = isinstance(value_list[2], FakeOutput)
     is_equal_horse_nm_span = isinstance(value_list[3], span_)
     is_equal_odds = value_list[4] == s_race_detail['オッズ']
     is_equal_popular = value_list[5] == s_race_detail['人気']
@@ -54,15 +70,21 @@ def test_get_tab_table_vals_chk_lbls(get_test_data):
     is_equal_weight = value_list[7] == s_race_detail['斤量']
     is_equal_jockey = isinstance(value_list[8], span_)
     is_equal_trainer = isinstance(value_list[9], span_)
+    is_equal_flag = isinstance(value_list[10], FakeOutput)
 
     check_box_nm = result['chk_box_nms'][0]
     is_equal_chk_box_nm = check_box_nm == f'target_{s_race_detail["レース番号"]}_{s_race_detail["馬番"]}'
 
+    # 選択状態の復元
+    is_selected = value_list[2].kwargs['options'][0]['selected']
+    is_not_selected = not result_not_selected['tab_vals'][2].kwargs['options'][0]['selected']
+
     result_list = (is_equal_waku, is_equal_horse_no,
                    is_equal_chk_box, is_equal_horse_nm_span,
                    is_equal_odds, is_equal_popular, is_equal_age,
                    is_equal_weight, is_equal_jockey, is_equal_trainer,
-                   is_equal_chk_box_nm)
+                   is_equal_flag, is_equal_chk_box_nm,
+                   is_selected, is_not_selected)
 
     assert all(result_list)
 
@@ -104,3 +126,17 @@ def test_is_even_number_all():
     result_mixed = is_even_number_all(test_list_mixed)
 
     assert result_all_even == 1 and result_all_odd == 0 and result_mixed == -1
+
+
+def test_purchase_on_soku_pat_without_page():
+    '''
+    purchase_on_soku_patのテスト
+    即PATのログイン画面を開けなかった場合、例外とならずに購入しないことを確認する
+    '''
+    class FailingSession(BrowserSession):
+        def new_page(self, use_headless: bool = True):
+            raise TimeoutError('timeout')
+
+    session = FailingSession(USER_AGENT, TIME_OUT)
+
+    assert purchase_on_soku_pat(session, np.array([1], dtype=np.uint32)) is False
@@ -0,0 +1,69 @@
+import numpy as np
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_combination_cache import *
+
+
+def test_get_selection_fingerprint():
+    '''
+    get_selection_fingerprintのテスト
+    選択順によらず同じ値になり、入力が異なれば異なる値になることを確認する
+    '''
+    horse_nums = [[1, 3], [2], [5, 4], [1], [7]]
+    filter_params = {'ninkiwa': [10, 12], 'ninki_tousu': [],
+                     'waku': [0], 'horse_num': []}
+    key = get_selection_fingerprint(
+        '2022-12-18', horse_nums, filter_params, 'v1')
+
+    result_list = []
+    result_list.append(key == get_selection_fingerprint('2022-12-18', [[3, 1], [2], [4, 5], [1], [7]], {
+                       'horse_num': [], 'waku': [0], 'ninki_tousu': [], 'ninkiwa': [12, 10]}, 'v1'))
+    result_list.append(key != get_selection_fingerprint(
+        '2022-12-25', horse_nums, filter_params, 'v1'))
+    result_list.append(key != get_selection_fingerprint(
+        '2022-12-18', [[1, 3], [2], [5, 4], [1], [8]], filter_params, 'v1'))
+    result_list.append(key != get_selection_fingerprint(
+        '2022-12-18', horse_nums, dict(filter_params, waku=[1]), 'v1'))
+    result_list.append(key != get_selection_fingerprint(
+        '2022-12-18', horse_nums, filter_params, 'v2'))
+
+    assert all(result_list)
+
+
+def test_combination_cache():
+    '''
+    CombinationCacheのテスト
+    ヒット、ミスが数えられ、上限を超えると最も長く参照されていないものから破棄されることを確認する
+    '''
+    # 1件400バイトの配列を2件まで保持
+    cache = CombinationCache(800)
+    tickets_list = [np.arange(100, dtype=np.uint32) + idx for idx in range(3)]
+
+    result_list = []
+    result_list.append(cache.get('a') is None)
+    cache.put('a', tickets_list[0])
+    cache.put('b', tickets_list[1])
+
+    # aを参照したので、c追加時にはbが破棄される
+    result_list.append(cache.get('a') is tickets_list[0])
+    cache.put('c', tickets_list[2])
+    result_list.append(cache.get('b') is None)
+    result_list.append(cache.get('c') is tickets_list[2])
+    result_list.append(cache.total_bytes == 800)
+    result_list.append(cache.hit_cnt == 2 and cache.miss_cnt == 2)
+
+    # 保持した配列は書き換えられない
+    result_list.append(not tickets_list[0].flags.writeable)
+
+    # 上限を超える配列は保持しない
+    cache.put('d', np.arange(300, dtype=np.uint32))
+    result_list.append(cache.get('d') is None)
+
+    cache.clear()
+    result_list.append(cache.get('a') is None and cache.total_bytes == 0)
+
+    assert all(result_list)
@@ -0,0 +1,718 @@
+import pytest
+import itertools
+from functools import reduce
+from time import perf_counter
+import pandas as pd
+import numpy as np
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_combination_engine import *
+from win5_race_card import RaceCard
+
+
+def create_race_details(horse_cnt_list: list, seed: int = 0) -> pd.DataFrame:
+    '''
+    test用のレース詳細作成処理
+    各レースの人気は馬番をシャッフルしたもの、枠番は馬番から算出する
+    '''
+    rng = np.random.default_rng(seed)
+    rows = []
+    for race_no, horse_cnt in zip(range(1, len(horse_cnt_list)+1), horse_cnt_list):
+        popular_list = rng.permutation(horse_cnt) + 1
+        for horse_num, popular in zip(range(1, horse_cnt+1), popular_list):
+            rows.append({'レース番号': race_no, '馬番': horse_num,
+                         '枠番': (horse_num + 1) // 2 if horse_cnt <= 16 else min((horse_num + 1) // 2, 8),
+                         '人気': popular, 'オッズ': float(popular) * 1.7})
+
+    return pd.DataFrame(rows)
+
+
+def calc_combination_reference(df_target_race_details: pd.DataFrame, filter_params: dict) -> list:
+    '''
+    1組合せずつ判定する、従来の5重ループと同じ判定の組合せ算出処理
+    '''
+    legs = [df_target_race_details.loc[df_target_race_details['レース番号'] == race_no].to_dict('records')
+            for race_no in range(1, LEG_COUNT+1)]
+
+    ret = []
+    for races in itertools.product(*legs):
+        ninki_list = [race['人気'] for race in races]
+        waku_list = [race['枠番'] for race in races]
+        horse_num_list = [race['馬番'] for race in races]
+
+        if -1 in ninki_list:
+            continue
+        if len(filter_params['ninkiwa']) > 0 and not sum(ninki_list) in filter_params['ninkiwa']:
+            continue
+        if len(filter_params['ninki_tousu']) > 0 and not ninki_list.count(1) in filter_params['ninki_tousu']:
+            continue
+        if len(filter_params['waku']) > 0:
+            if -1 in waku_list:
+                continue
+            if 0 in filter_params['waku'] and all([waku >= 7 for waku in waku_list]):
+                continue
+            if 1 in filter_params['waku'] and all([waku <= 2 for waku in waku_list]):
+                continue
+        if len(filter_params['horse_num']) > 0:
+            if 0 in filter_params['horse_num'] and all([num % 2 != 0 for num in horse_num_list]):
+                continue
+            if 1 in filter_params['horse_num'] and all([num % 2 == 0 for num in horse_num_list]):
+                continue
+        if len(filter_params.get('odds_min', [])) > 0 or len(filter_params.get('odds_max', [])) > 0:
+            odds_list = [race['オッズ'] for race in races]
+            if any([odds <= 0 for odds in odds_list]):
+                continue
+            if len(filter_params.get('odds_min', [])) > 0 and np.prod(odds_list) < filter_params['odds_min'][0] * (1 - 1e-9):
+                continue
+            if len(filter_params.get('odds_max', [])) > 0 and np.prod(odds_list) > filter_params['odds_max'][0] * (1 + 1e-9):
+                continue
+
+        ret.append(horse_num_list)
+
+    return ret
+
+
+@pytest.fixture(scope='module')
+def get_test_data():
+    '''
+    test用データ作成処理
+    '''
+    df = create_race_details([6, 5, 7, 4, 6])
+
+    filter_params = {'ninkiwa': [8, 9, 10, 11, 12, 13, 14],
+                     'ninki_tousu': [0, 1, 2],
+                     'waku': [0, 1],
+                     'horse_num': [0, 1]}
+
+    return df, filter_params
+
+
+def test_calc_combination_array(get_test_data):
+    '''
+    calc_combination_arrayのテスト
+    従来の1組合せずつの判定と同じ組合せが同じ順序で算出されることを確認する
+    '''
+    df, filter_params = get_test_data
+
+    result = calc_combination_array(get_leg_arrays(df), filter_params)
+    expected = calc_combination_reference(df, filter_params)
+
+    assert result.shape == (len(expected), LEG_COUNT) and result.tolist() == expected
+
+
+def test_calc_combination_array_no_filter(get_test_data):
+    '''
+    calc_combination_arrayのテスト
+    抽出条件なしの場合は全ての直積が算出されることを確認する
+    '''
+    df, _ = get_test_data
+    filter_params = {'ninkiwa': [], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': []}
+
+    result = calc_combination_array(get_leg_arrays(df), filter_params)
+
+    assert len(result) == 6 * 5 * 7 * 4 * 6
+
+
+def test_calc_combination_array_undecided():
+    '''
+    calc_combination_arrayのテスト
+    人気が決まっていない馬を含む組合せが除かれることを確認する
+    '''
+    df = create_race_details([3, 3, 3, 3, 3])
+    df.loc[0, '人気'] = -1
+    filter_params = {'ninkiwa': [], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': []}
+
+    result = calc_combination_array(get_leg_arrays(df), filter_params)
+
+    assert len(result) == 2 * 3 ** 4 and not (result[:, 0] == 1).any()
+
+
+@pytest.mark.parametrize('odds_min, odds_max', [
+    ([100.0], []),
+    ([], [3000.0]),
+    ([500.0], [20000.0]),
+    # 境界値: 全レース1番人気(1.7倍)の積ちょうど
+    ([1.7 ** 5], [1.7 ** 5]),
+])
+def test_calc_combination_array_odds(get_test_data, odds_min, odds_max):
+    '''
+    calc_combination_arrayのテスト
+    合成オッズの下限、上限を対数の和で判定した結果が、オッズの積での判定と一致し、
+    オッズが未確定の馬を含む組合せが除かれることを確認する
+    '''
+    df, _ = get_test_data
+    df = df.copy()
+    df.loc[3, 'オッズ'] = -1
+    filter_params = {'ninkiwa': [], 'ninki_tousu': [], 'waku': [], 'horse_num': [],
+                     'odds_min': odds_min, 'odds_max': odds_max}
+
+    result = calc_combination_array(get_leg_arrays(df), filter_params)
+    expected = calc_combination_reference(df, filter_params)
+
+    is_equal = result.tolist() == expected
+    is_excluded = not (result[:, 0] == df.loc[3, '馬番']).any()
+
+    assert len(expected) > 0 and is_equal and is_excluded
+
+
+def test_count_combinations_by_ninkiwa(get_test_data):
+    '''
+    count_combinations_by_ninkiwaのテスト
+    人気和、1番人気頭数ごとの点数が列挙した組合せの集計と一致することを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+    filter_params = {'ninkiwa': [], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': []}
+    tickets = calc_combination_reference(df, filter_params)
+
+    expected = {}
+    for popular_list in itertools.product(*[leg['人気'].tolist() for leg in legs]):
+        key = (sum(popular_list), popular_list.count(1))
+        expected[key] = expected.get(key, 0) + 1
+
+    counts = count_combinations_by_ninkiwa(legs)
+    result = {(ninkiwa, first_cnt): counts[ninkiwa, first_cnt]
+              for ninkiwa, first_cnt in zip(*np.nonzero(counts))}
+
+    assert result == expected and counts.sum() == len(tickets)
+
+
+def test_count_combinations(get_test_data):
+    '''
+    count_combinationsのテスト
+    人気和、1番人気頭数の抽出条件での点数が列挙した組合せ数と一致することを確認する
+    '''
+    df, _ = get_test_data
+    filter_params = {'ninkiwa': [10, 12, 14, 40], 'ninki_tousu': [1, 2],
+                     'waku': [], 'horse_num': []}
+
+    result = count_combinations(get_leg_arrays(df), filter_params)
+
+    assert result == len(calc_combination_reference(df, filter_params))
+
+
+def test_iter_combination_chunks(get_test_data):
+    '''
+    iter_combination_chunksのテスト
+    チャンクを連結すると一括算出と同じ組合せになり、最後以外のチャンクが指定サイズであることを確認する
+    '''
+    df, filter_params = get_test_data
+    legs = get_leg_arrays(df)
+    chunk_size = 50
+
+    chunks = list(iter_combination_chunks(legs, filter_params, chunk_size))
+    expected = calc_combination_array(legs, filter_params)
+
+    is_equal_tickets = np.concatenate(chunks).tolist() == expected.tolist()
+    is_fixed_size = all([len(chunk) == chunk_size for chunk in chunks[:-1]])
+    is_less_last = 0 < len(chunks[-1]) <= chunk_size
+
+    assert all((is_equal_tickets, is_fixed_size, is_less_last))
+
+
+def test_pack_tickets():
+    '''
+    pack_tickets、unpack_ticketsのテスト
+    詰めた組合せが元に戻り、大小関係が馬番の辞書順と一致することを確認する
+    '''
+    tickets = np.array([[1, 2, 3, 4, 5], [18, 18, 18, 18, 18],
+                        [1, 2, 3, 5, 4], [2, 1, 1, 1, 1]], dtype=np.uint8)
+
+    packed = pack_tickets(tickets)
+
+    is_equal_unpacked = unpack_tickets(packed).tolist() == tickets.tolist()
+    is_equal_order = np.argsort(packed).tolist() == sorted(
+        range(len(tickets)), key=lambda idx: tickets[idx].tolist())
+
+    assert packed.dtype == np.uint32 and is_equal_unpacked and is_equal_order
+
+
+def test_calc_packed_tickets(get_test_data):
+    '''
+    calc_packed_ticketsのテスト
+    詰めた組合せを戻すと従来の判定と同じ組合せが昇順に並んでいることを確認する
+    '''
+    df, filter_params = get_test_data
+
+    packed = calc_packed_tickets(get_leg_arrays(df), filter_params, 50)
+    expected = sorted(calc_combination_reference(df, filter_params))
+
+    assert unpack_tickets(packed).tolist() == expected
+
+
+def test_ticket_set_operations():
+    '''
+    union_tickets、intersect_tickets、diff_ticketsのテスト
+    集合演算の結果がPythonのsetでの演算結果と一致することを確認する
+    '''
+    rng = np.random.default_rng(1)
+    packed_a = np.unique(pack_tickets(rng.integers(
+        1, 19, (500, LEG_COUNT), dtype=np.uint8)))
+    packed_b = np.unique(np.concatenate(
+        [packed_a[::3], pack_tickets(rng.integers(1, 19, (500, LEG_COUNT), dtype=np.uint8))]))
+    set_a = set(packed_a.tolist())
+    set_b = set(packed_b.tolist())
+
+    is_equal_union = union_tickets(
+        packed_a, packed_b).tolist() == sorted(set_a | set_b)
+    is_equal_intersect = intersect_tickets(
+        packed_a, packed_b).tolist() == sorted(set_a & set_b)
+    is_equal_diff = diff_tickets(
+        packed_a, packed_b).tolist() == sorted(set_a - set_b)
+    is_equal_diff_empty = diff_tickets(
+        packed_a, packed_b[:0]).tolist() == sorted(set_a)
+
+    assert all((is_equal_union, is_equal_intersect,
+               is_equal_diff, is_equal_diff_empty))
+
+
+def test_calc_packed_tickets_parallel(get_test_data):
+    '''
+    calc_packed_ticketsのテスト
+    並列実行した場合も1プロセスで算出した組合せと一致することを確認する
+    '''
+    df, filter_params = get_test_data
+    legs = get_leg_arrays(df)
+
+    expected = calc_packed_tickets(legs, filter_params)
+
+    # 1レース目の頭数(6)より多いワーカー数の場合は1、2レース目の組で分割される
+    result_leg1 = calc_packed_tickets(legs, filter_params, worker_cnt=2)
+    result_leg2 = calc_packed_tickets(legs, filter_params, worker_cnt=8)
+
+    assert result_leg1.tolist() == expected.tolist() and result_leg2.tolist() == expected.tolist()
+
+
+def test_get_shards(get_test_data):
+    '''
+    get_shardsのテスト
+    シャードの組合せ数の合計が直積の大きさと一致することを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+
+    shards_leg1 = get_shards(legs, 2)
+    shards_leg2 = get_shards(legs, 8)
+
+    is_equal_leg1 = len(shards_leg1) == 6 and sum(
+        [calc_product_size(shard) for shard in shards_leg1]) == calc_product_size(legs)
+    is_equal_leg2 = len(shards_leg2) == 6 * 5 and sum(
+        [calc_product_size(shard) for shard in shards_leg2]) == calc_product_size(legs)
+
+    assert is_equal_leg1 and is_equal_leg2
+
+
+@pytest.mark.parametrize('filter_params', [
+    {'ninkiwa': [8, 9, 10, 11, 12, 13, 14], 'ninki_tousu': [0, 1, 2],
+     'waku': [0, 1], 'horse_num': [0, 1]},
+    {'ninkiwa': [10, 15], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+    {'ninkiwa': [], 'ninki_tousu': [3], 'waku': [], 'horse_num': [1]},
+    {'ninkiwa': [3], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+    {'ninkiwa': [], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+    {'ninkiwa': list(range(10, 20)), 'ninki_tousu': [], 'waku': [], 'horse_num': [],
+     'odds_min': [500.0], 'odds_max': [20000.0]},
+])
+def test_calc_packed_tickets_branch_and_bound(get_test_data, filter_params):
+    '''
+    calc_packed_tickets_branch_and_boundのテスト
+    枝刈りした場合も全て列挙した場合と同じ組合せになることを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+
+    result = calc_packed_tickets_branch_and_bound(legs, filter_params)
+    expected = calc_packed_tickets(legs, filter_params)
+
+    assert result.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('filter_params', [
+    {'ninkiwa': [8, 9, 10, 11, 12, 13, 14], 'ninki_tousu': [0, 1, 2],
+     'waku': [0, 1], 'horse_num': [0, 1]},
+    {'ninkiwa': [10, 15], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+    {'ninkiwa': [], 'ninki_tousu': [3], 'waku': [], 'horse_num': [1]},
+    {'ninkiwa': [3], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+    {'ninkiwa': list(range(10, 20)), 'ninki_tousu': [], 'waku': [], 'horse_num': [],
+     'odds_min': [500.0], 'odds_max': [20000.0]},
+])
+def test_calc_packed_tickets_meet_in_the_middle(get_test_data, filter_params):
+    '''
+    calc_packed_tickets_meet_in_the_middleのテスト
+    前半と後半を結合した場合も全て列挙した場合と同じ組合せになることを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+
+    result = calc_packed_tickets_meet_in_the_middle(legs, filter_params)
+    expected = calc_packed_tickets(legs, filter_params)
+
+    assert result.tolist() == expected.tolist()
+
+
+def test_choose_enumeration_method():
+    '''
+    choose_enumeration_methodのテスト
+    抽出条件なしでは全列挙、18頭立てで人気和の範囲が狭い場合は全列挙以外が選択されることを確認する
+    '''
+    legs = get_leg_arrays(create_race_details([18, 18, 18, 18, 18]))
+    no_filter = {'ninkiwa': [], 'ninki_tousu': [], 'waku': [], 'horse_num': []}
+    narrow_filter = {'ninkiwa': [8, 9, 10], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': []}
+
+    is_brute_force = choose_enumeration_method(
+        legs, no_filter) == ENUMERATION_METHODS['brute_force']
+    is_not_brute_force = choose_enumeration_method(
+        legs, narrow_filter) != ENUMERATION_METHODS['brute_force']
+
+    assert is_brute_force and is_not_brute_force
+
+
+def test_calc_packed_tickets_auto(get_test_data):
+    '''
+    calc_packed_tickets_autoのテスト
+    選択された方法によらず全て列挙した場合と同じ組合せになることを確認する
+    '''
+    df, filter_params = get_test_data
+    legs = get_leg_arrays(df)
+
+    result = calc_packed_tickets_auto(legs, filter_params)
+    expected = calc_packed_tickets(legs, filter_params)
+
+    assert result.tolist() == expected.tolist()
+
+
+def test_incremental_combination_engine(get_test_data):
+    '''
+    IncrementalCombinationEngineのテスト
+    1頭ずつの追加、削除および抽出条件の変更後の組合せが、一括で算出した組合せと一致することを確認する
+    '''
+    df, filter_params = get_test_data
+    engine = IncrementalCombinationEngine(RaceCard(df))
+
+    def calc_expected():
+        df_selected = pd.concat([df.loc[(df['レース番号'] == leg_idx + 1) & (df['馬番'].isin(horse_nums))]
+                                 for leg_idx, horse_nums in enumerate(engine.selected_horse_nums)])
+        return calc_packed_tickets(get_leg_arrays(df_selected), engine.filter_params).tolist()
+
+    results = []
+    for _, row in df.iterrows():
+        engine.add_horse(int(row['レース番号']) - 1, int(row['馬番']))
+    results.append(engine.tickets.tolist() == calc_expected())
+
+    engine.set_filter_params(filter_params)
+    results.append(engine.tickets.tolist() == calc_expected())
+
+    engine.remove_horse(0, 1)
+    engine.remove_horse(2, 5)
+    results.append(engine.tickets.tolist() == calc_expected())
+
+    engine.add_horse(0, 1)
+    engine.set_filter_params({'ninkiwa': [10, 11], 'ninki_tousu': [],
+                              'waku': [], 'horse_num': [1]})
+    results.append(engine.tickets.tolist() == calc_expected())
+
+    assert all(results) and len(engine.tickets) > 0
+
+
+def test_incremental_combination_engine_recalc():
+    '''
+    IncrementalCombinationEngine.set_filter_paramsのテスト
+    保持している組合せが多く抽出条件が絞り込まれている場合(算出し直す場合)も、一括で算出した組合せと一致することを確認する
+    '''
+    df = create_race_details([8, 8, 8, 8, 8])
+    engine = IncrementalCombinationEngine(RaceCard(df))
+    for race_no, horse_num in zip(df['レース番号'], df['馬番']):
+        engine.add_horse(race_no - 1, horse_num)
+    filter_params = {'ninkiwa': [8, 9], 'ninki_tousu': [],
+                     'waku': [], 'horse_num': [0]}
+
+    engine.set_filter_params(filter_params)
+    expected = calc_packed_tickets(get_leg_arrays(df), filter_params)
+
+    assert engine.tickets.tolist() == expected.tolist() and len(expected) > 0
+
+
+def test_get_implied_log_probs():
+    '''
+    get_implied_log_probsのテスト
+    推定勝率の合計が1になり、オッズが低いほど勝率が高く、未確定はnanとなることを確認する
+    '''
+    odds = np.array([2.0, 4.0, 8.0, -1])
+    probs = np.exp(get_implied_log_probs(odds))
+
+    is_normalized = np.isclose(probs[:3].sum(), 1.0)
+    is_ordered = probs[0] > probs[1] > probs[2]
+    is_undecided_nan = np.isnan(probs[3])
+
+    assert all((is_normalized, is_ordered, is_undecided_nan))
+
+
+def test_select_top_k_tickets(get_test_data):
+    '''
+    select_top_k_ticketsのテスト
+    チャンクごとに選択した上位k件の確率が、全件を推定的中確率で並べ替えた上位k件と一致することを確認する
+    '''
+    df, filter_params = get_test_data
+    df = df.copy()
+    df.loc[3, 'オッズ'] = -1
+    race_card = RaceCard(df)
+    packed = calc_packed_tickets(get_leg_arrays(df), filter_params)
+    k = 20
+
+    top_tickets, top_log_probs = select_top_k_tickets(
+        packed, race_card.lookups, k, chunk_size=7)
+
+    # 全件の推定的中確率を算出して並べ替えた結果と比較
+    log_probs = reduce(np.add, partial_lookup_values(
+        race_card.lookups, packed)(IMPLIED_LOG_PROB_COLUMN))
+    is_known = ~np.isnan(log_probs)
+    order = np.lexsort((packed[is_known], -log_probs[is_known]))[:k]
+
+    # 同じ確率の組合せはどれが選ばれるか決まらないため、確率と組合せの対応のみ確認する
+    is_equal_probs = np.allclose(top_log_probs, log_probs[is_known][order])
+    is_matched_probs = np.allclose(
+        top_log_probs, log_probs[np.searchsorted(packed, top_tickets)])
+    is_unique = len(np.unique(top_tickets)) == k
+    is_excluded = not (unpack_tickets(top_tickets)[:, 0] == df.loc[3, '馬番']).any()
+
+    assert all((len(top_tickets) == k, is_equal_probs,
+               is_matched_probs, is_unique, is_excluded))
+
+
+def test_select_budget_tickets(get_test_data):
+    '''
+    select_budget_ticketsのテスト
+    予算で買える点数まで推定的中確率の高い順に選択され、確率と金額が正しく算出されることを確認する
+    '''
+    df, filter_params = get_test_data
+    race_card = RaceCard(df)
+    packed = calc_packed_tickets(get_leg_arrays(df), filter_params)
+
+    tickets, hit_prob, cost = select_budget_tickets(
+        packed, race_card.lookups, 2550, 100)
+
+    log_probs = reduce(np.add, partial_lookup_values(
+        race_card.lookups, packed)(IMPLIED_LOG_PROB_COLUMN))
+    expected_prob = np.exp(np.sort(log_probs)[::-1][:25]).sum()
+
+    is_sorted = (tickets[1:] > tickets[:-1]).all()
+    is_equal_prob = np.isclose(hit_prob, expected_prob)
+
+    assert all((len(tickets) == 25, cost == 2500, is_sorted, is_equal_prob))
+
+
+def test_select_budget_tickets_invalid_price(get_test_data):
+    '''
+    select_budget_ticketsのテスト
+    1組合せあたりの金額が0円以下、予算が負の場合はValueErrorとなり、予算0円の場合は何も選択しないことを確認する
+    '''
+    df, filter_params = get_test_data
+    race_card = RaceCard(df)
+    packed = calc_packed_tickets(get_leg_arrays(df), filter_params)
+
+    with pytest.raises(ValueError):
+        select_budget_tickets(packed, race_card.lookups, 1000, 0)
+    with pytest.raises(ValueError):
+        select_budget_tickets(packed, race_card.lookups, 1000, -100)
+    with pytest.raises(ValueError):
+        select_budget_tickets(packed, race_card.lookups, -100, 100)
+
+    tickets, hit_prob, cost = select_budget_tickets(
+        packed, race_card.lookups, 0, 100)
+
+    assert all((len(tickets) == 0, hit_prob == 0.0, cost == 0))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_calc_box_cover(seed):
+    '''
+    calc_box_coverのテスト
+    フォーメーションが互いに重ならず、展開すると元の組合せと一致することを確認する
+    '''
+    rng = np.random.default_rng(seed)
+    tickets = np.array(list(itertools.product(
+        *[range(1, horse_cnt + 1) for horse_cnt in rng.integers(1, 7, LEG_COUNT)])))
+    packed = pack_tickets(
+        tickets[rng.random(len(tickets)) < rng.random()])
+
+    boxes = calc_box_cover(packed)
+    box_sizes = [np.prod([len(nums) for nums in get_box_horse_nums(box)])
+                 for box in boxes]
+
+    result_list = []
+    result_list.append(expand_boxes(boxes).tolist() == packed.tolist())
+    # 展開した組合せ数の合計が元の組合せ数と一致すれば重なりはない
+    result_list.append(sum(box_sizes) == len(packed))
+
+    assert all(result_list)
+
+
+def test_get_box_cover_report():
+    '''
+    get_box_cover_reportのテスト
+    直積の組合せは1つのフォーメーションにまとまり、入力操作数が正しく算出されることを確認する
+    '''
+    packed = pack_tickets(np.array(list(itertools.product(
+        [1, 2], [3], [1, 4, 5], [2], [6, 7]))))
+
+    boxes = calc_box_cover(packed)
+    report = get_box_cover_report(len(packed), boxes)
+
+    result_list = []
+    result_list.append(get_box_horse_nums(boxes[0]) == [
+                       [1, 2], [3], [1, 4, 5], [2], [6, 7]])
+    result_list.append(report['box_cnt'] == 1)
+    result_list.append(report['compression_ratio'] == 12)
+    result_list.append(report['ticket_operations'] == 12 * 7)
+    result_list.append(report['box_operations'] == 9 + 2)
+
+    assert all(result_list)
+
+
+@pytest.mark.parametrize('filter_params', [
+    {'ninkiwa': [8, 9, 10, 11, 12, 13, 14], 'ninki_tousu': [0, 1],
+     'waku': [0, 1], 'horse_num': [0, 1], 'odds_min': [300.0]},
+    {'ninkiwa': [12, 13], 'ninki_tousu': [], 'waku': [0], 'horse_num': []},
+])
+def test_filter_funnel(get_test_data, filter_params):
+    '''
+    FilterFunnelのテスト
+    算出方法によらず除外数の合計が一致し、残った組合せ数が算出結果と一致することを確認する
+    抽出条件の順序を固定した場合は、get_filter_stagesの順に除外数が集計されることを確認する
+    '''
+    df, _ = get_test_data
+    df = df.copy()
+    # 人気未確定の馬を含める
+    df.loc[0, '人気'] = UNDECIDED_VAL
+    legs = get_leg_arrays(df)
+
+    funnels = [FilterFunnel() for _ in range(5)]
+    results = [calc_packed_tickets(legs, filter_params, chunk_size=50, funnel=funnels[0], adaptive=False),
+               calc_packed_tickets(legs, filter_params,
+                                   chunk_size=50, funnel=funnels[1]),
+               calc_packed_tickets(
+                   legs, filter_params, worker_cnt=2, funnel=funnels[2]),
+               calc_packed_tickets_branch_and_bound(
+                   legs, filter_params, funnels[3]),
+               calc_packed_tickets_meet_in_the_middle(legs, filter_params, funnel=funnels[4])]
+
+    removed_list = [{name: stage['removed_cnt'] for name, stage in funnel.stages.items()}
+                    for funnel in funnels]
+
+    result_list = []
+    for funnel, result, removed in zip(funnels, results, removed_list):
+        result_list.append(funnel.candidate_cnt == calc_product_size(legs))
+        result_list.append(funnel.final_cnt == len(result))
+        result_list.append(removed.keys() == removed_list[0].keys())
+    result_list.append(list(removed_list[0]) == [
+                       name for name, _ in get_filter_stages(filter_params)])
+    result_list.append(removed_list[0]['undecided'] > 0)
+
+    # 枝刈り、結合では人気和、1番人気頭数を先に適用する
+    for removed in removed_list[3:]:
+        result_list.append(all(removed[name] == removed_list[0][name]
+                           for name in ('undecided', 'ninkiwa', 'ninki_tousu') if name in removed))
+
+    assert all(result_list)
+
+
+def test_order_filter_stages(get_test_data):
+    '''
+    order_filter_stagesのテスト
+    除外率の高い抽出条件が先、全ての組合せが満たす抽出条件が最後に並び、
+    並べ替えても算出結果が変わらないことを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+    filter_params = {'ninkiwa': [12], 'waku': [0]}
+
+    stages = get_ordered_filter_stages(legs, filter_params)
+
+    result_list = []
+    result_list.append([name for name, _ in stages][0] == 'ninkiwa')
+    result_list.append([name for name, _ in stages][-1] == 'undecided')
+    result_list.append(calc_packed_tickets(legs, filter_params).tolist() ==
+                       calc_packed_tickets(legs, filter_params, adaptive=False).tolist())
+
+    assert all(result_list)
+
+
+@pytest.mark.parametrize('filter_params', [
+    {'ninkiwa': [8, 9, 10], 'ninki_tousu': []},
+    {'ninkiwa': [], 'ninki_tousu': [3]},
+    {'ninkiwa': list(range(10, 20)), 'ninki_tousu': [0, 1],
+     'waku': [0, 1], 'horse_num': [0, 1], 'odds_min': [200.0], 'odds_max': [3000.0]},
+    {'ninkiwa': [60]},
+])
+def test_calc_alive_horses(get_test_data, filter_params):
+    '''
+    calc_alive_horsesのテスト
+    除いた馬はどの組合せにも含まれず、除いた後の配列から同じ組合せが算出されることを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+
+    packed = calc_packed_tickets(legs, filter_params)
+    tickets = unpack_tickets(packed)
+    alive_list = calc_alive_horses(legs, filter_params)
+
+    result_list = []
+    for leg_idx, (leg, alive) in enumerate(zip(legs, alive_list)):
+        result_list.append(np.isin(tickets[:, leg_idx], leg['馬番'][alive]).all())
+    result_list.append(calc_packed_tickets(drop_dead_horses(
+        legs, filter_params), filter_params).tolist() == packed.tolist())
+
+    assert all(result_list)
+
+
+def test_calc_alive_horses_bounds():
+    '''
+    calc_alive_horsesのテスト
+    人気和の上限から他のレースの人気の最小値の合計を引いた人気より下位の馬が除かれることを確認する
+    '''
+    legs = get_leg_arrays(create_race_details([8, 8, 8, 8, 8]))
+
+    # 他の4レースの人気の最小値の合計は4なので、人気和10以下なら7番人気以下は組合せに含まれない
+    alive_list = calc_alive_horses(legs, {'ninkiwa': [9, 10]})
+
+    assert all((leg['人気'][alive] <= 6).all() and (leg['人気'][~alive] >= 7).all()
+               for leg, alive in zip(legs, alive_list))
+
+
+@pytest.mark.parametrize('filter_params', [
+    {'ninkiwa': [8, 9, 10, 11, 12, 13, 14], 'ninki_tousu': [0, 1],
+     'waku': [0, 1], 'horse_num': [0, 1], 'odds_min': [300.0]},
+    {'ninkiwa': [30], 'ninki_tousu': [], 'waku': [], 'horse_num': []},
+])
+def test_filter_funnel_elapsed(get_test_data, filter_params):
+    '''
+    FilterFunnelのテスト
+    1プロセスで算出する場合、抽出条件ごとの処理時間が0以上かつ呼出全体の処理時間以下となることを確認する
+    '''
+    df, _ = get_test_data
+    legs = get_leg_arrays(df)
+
+    calc_funcs = [lambda funnel: calc_packed_tickets(legs, filter_params, chunk_size=50, funnel=funnel),
+                  lambda funnel: calc_packed_tickets_branch_and_bound(
+                      legs, filter_params, funnel),
+                  lambda funnel: calc_packed_tickets_meet_in_the_middle(legs, filter_params, funnel=funnel)]
+
+    result_list = []
+    for calc_func in calc_funcs:
+        funnel = FilterFunnel()
+        start = perf_counter()
+        calc_func(funnel)
+        wall_time = perf_counter() - start
+
+        result_list.append(len(funnel.stages) > 0)
+        result_list.append(all(0 <= stage['elapsed'] <= wall_time
+                               for stage in funnel.stages.values()))
+
+    assert all(result_list)
@@ -1,27 +1,120 @@
 import pytest
 import datetime
+import threading
+import time
 import pandas as pd
+from bs4 import BeautifulSoup as bs
 
 import os
 import sys  # nopep8
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
 from config.settings import *  # nopep8
-from playwright.sync_api import sync_playwright
 
 from win5_data_getter import *
 from utilities.common_functions import is_empty_DataFrame
 
+# 保存済みの出馬表のページ
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+SYUTSUBA_PAGE_FILES = ['syutsuba_odds.html',
+                       'syutsuba_entry.html', 'syutsuba_undecided.html']
+
+
+def parse_entry_horce_info_bs(content: bytes, race_date: str, race_no: str) -> pd.DataFrame:
+    '''
+    従来のBeautifulSoup(html.parser)で列ごとにCSSセレクタで検索する出馬表の解析処理
+    '''
+    soup = bs(content, 'html.parser')
+
+    tbody = soup.select_one('#syutsuba > table > tbody')
+
+    # 枠番
+    if tbody.select_one('tr > td.waku > img') is not None:
+        waku_list = [int(waku_img.attrs['alt'][1:-1])
+                     for waku_img in tbody.select('tr > td.waku > img')]
+    else:
+        waku_list = [int(waku.text.replace('\n', '')) if waku.text.replace('\n', '') != '' else -1
+                     for waku in tbody.select('tr > td.waku')]
+
+    # 馬番
+    num_list = [int(num.text.replace('\n', '')) if num.text.replace('\n', '') != '' else -1
+                for num in tbody.select('tr > td.num')]
+
+    # 馬名
+    horse_name_list = [hourse_name.text.replace('\n', '').replace('\r', '') for hourse_name in tbody.select(
+        'tr > td.horse > div.name_line > div.name > a')]
+
+    # オッズ
+    if tbody.select_one(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong') is not None:
+        odds_list = [float(odds_num.text) for odds_num in tbody.select(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong')]
+    else:
+        odds_list = [-1 for rg in range(len(horse_name_list))]
+
+    # 人気
+    if tbody.select_one(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank') is not None:
+        pop_rank_list = [int(pop_rank.text.replace('(', '').replace('番人気)', '')) for pop_rank in tbody.select(
+            'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank')]
+    else:
+        pop_rank_list = [-1 for rg in range(len(horse_name_list))]
+
+    # 調教師名
+    trainer_list = [trainer.text for trainer in tbody.select(
+        'tr > td.horse > p.trainer')]
+
+    # 年齢
+    age_list = [age.text for age in tbody.select('tr > td.jockey > p.age')]
+
+    # 斤量
+    weight_list = [float(weight.next.text.replace('\r\n', '')) if weight.next.text.replace('\r\n', '') != '' else -1
+                   for weight in tbody.select('tr > td.jockey > p.weight')]
+
+    # ジョッキー
+    jockey_list = [jockey.text for jockey in tbody.select(
+        'tr > td.jockey > p.jockey > a')]
+
+    # コース
+    course_list = [soup.select_one('div.cell.course').text.replace(
+        '\n', '').replace('コース：', '') for _ in range(len(horse_name_list))]
+
+    # ハンデ
+    handicap_list = [soup.select_one('div.cell.weight').text.replace(
+        '\n', '') for _ in range(len(horse_name_list))]
+
+    # DF変換
+    return pd.DataFrame({
+        'レース日付': [race_date for _ in range(len(horse_name_list))],
+        'レース番号': [race_no for _ in range(len(horse_name_list))],
+        '枠番': waku_list,
+        '馬番': num_list,
+        '馬名': horse_name_list,
+        'オッズ': odds_list,
+        '人気': pop_rank_list,
+        '調教師名': trainer_list,
+        '年齢': age_list,
+        '斤量': weight_list,
+        'ジョッキー': jockey_list,
+        'コース': course_list,
+        'ハンデ': handicap_list,
+    })
+
 
 def test_get_playwright_page():
     '''
     get_playwright_pageのテスト
-    playwrightで正常に該当URLのページオブジェクトが取得できているかどうか判定する
+    起動済みのブラウザで正常に該当URLのページオブジェクトが取得できているかどうか判定する
     '''
-    with sync_playwright() as playwright:
-        page = get_playwright_page(
-            playwright, 'https://www.yahoo.co.jp/', False)
+    def get_page_url(session, target_url):
+        page = get_playwright_page(session, target_url)
+        url = page.url if page is not None else None
+        if page is not None:
+            page.close()
+        return url
+
+    url = browser_session.run(get_page_url, 'https://www.yahoo.co.jp/')
 
-    assert page is not None
+    assert url is not None
 
 
 def test_get_win5_races_page():
@@ -29,9 +122,7 @@ def test_get_win5_races_page():
     get_win5_races_pageのテスト
     WIN5対象レース一覧が取得できているかどうか判定
     '''
-    with sync_playwright() as playwright:
-        soup = get_win5_races_page(
-            playwright, JRA_TOP_URL)
+    soup = browser_session.run(get_win5_races_page, JRA_TOP_URL)
 
     assert soup is not None and len(soup.text) > 0
 
@@ -58,3 +149,69 @@ def test_get_entry_horce_info():
     df = get_entry_horce_info(target_url, race_date, race_no)
 
     assert not is_empty_DataFrame(df) and df.loc[0, :'馬名'] == 'メイショウイジゲン'
+
+
+def test_token_bucket():
+    '''
+    TokenBucketのテスト
+    複数スレッドから呼び出しても、トークンの補充間隔以上空けて取得できることを確認する
+    '''
+    rate_limiter = TokenBucket(0.05)
+    acquired_times = []
+
+    def acquire():
+        rate_limiter.acquire()
+        acquired_times.append(time.monotonic())
+
+    threads = [threading.Thread(target=acquire) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    acquired_times.sort()
+    intervals = [later - earlier for earlier,
+                 later in zip(acquired_times, acquired_times[1:])]
+
+    assert all([interval >= 0.05 * 0.9 for interval in intervals])
+
+
+def test_fetch_concurrently():
+    '''
+    fetch_concurrentlyのテスト
+    引数の順に結果が返り、応答待ちが重なるため逐次取得より短時間で終わることを確認する
+    '''
+    def fetch(val):
+        time.sleep(0.2)
+        return val * 2
+
+    results, report = fetch_concurrently(
+        fetch, [(val,) for val in range(5)], TokenBucket(0.02), 5)
+
+    result_list = []
+    result_list.append(results == [0, 2, 4, 6, 8])
+    result_list.append(report['sequential_time'] >= 0.2 * 5)
+    result_list.append(report['wall_time'] < report['sequential_time'] / 2)
+
+    assert all(result_list)
+
+
+@pytest.mark.parametrize('file_name', SYUTSUBA_PAGE_FILES)
+def test_parse_entry_horce_info(file_name):
+    '''
+    parse_entry_horce_infoのテスト
+    オッズ発表後、枠順確定前後の出馬表について、従来の解析処理と値、型が一致することを確認する
+    '''
+    with open(os.path.join(TEST_DATA_DIR, file_name), 'rb') as f:
+        content = f.read()
+
+    df = parse_entry_horce_info(content, '2022-12-18', 1)
+    df_expected = parse_entry_horce_info_bs(content, '2022-12-18', 1)
+
+    result_list = []
+    result_list.append(len(df) > 0)
+    result_list.append(df.equals(df_expected))
+    result_list.append(df.dtypes.tolist() == df_expected.dtypes.tolist())
+    result_list.append(df.columns.tolist() == df_expected.columns.tolist())
+
+    assert all(result_list)
@@ -0,0 +1,96 @@
+import pytest
+import itertools
+import pandas as pd
+import numpy as np
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_combination_engine import calc_combination_array, calc_packed_tickets_branch_and_bound, get_leg_arrays, pack_tickets
+from win5_filter_expression import *
+
+
+@pytest.fixture(scope='module')
+def get_test_data():
+    '''
+    test用データ作成処理
+    各レースの人気は馬番をシャッフルしたもの、枠番は馬番から算出する
+    '''
+    rng = np.random.default_rng(0)
+    rows = []
+    for race_no, horse_cnt in zip(range(1, 6), [6, 5, 7, 4, 6]):
+        for horse_num, popular in zip(range(1, horse_cnt+1), rng.permutation(horse_cnt) + 1):
+            rows.append({'レース番号': race_no, '馬番': horse_num, '枠番': (horse_num + 1) // 2,
+                         '人気': popular, 'オッズ': float(popular) * 1.7})
+
+    return pd.DataFrame(rows)
+
+
+def calc_expression_reference(df: pd.DataFrame, predicate) -> list:
+    '''
+    1組合せずつpythonの式で判定する組合せ算出処理
+    '''
+    legs = [df.loc[df['レース番号'] == race_no].to_dict('records')
+            for race_no in range(1, 6)]
+
+    ret = []
+    for races in itertools.product(*legs):
+        values = {name: [race[col] for race in races]
+                  for name, col in VARIABLE_COLUMNS.items()}
+        if predicate(**values):
+            ret.append(values['num'])
+
+    return ret
+
+
+@pytest.mark.parametrize('expression, predicate', [
+    ('sum(pop) between 10 and 16 and count(pop<=3) >= 3 and not all(waku>=3)',
+     lambda pop, waku, num, odds: 10 <= sum(pop) <= 16 and sum(p <= 3 for p in pop) >= 3 and not all(w >= 3 for w in waku)),
+    ('pop[1] + pop[5] == 3 or max(num) - min(num) < 2',
+     lambda pop, waku, num, odds: pop[0] + pop[4] == 3 or max(num) - min(num) < 2),
+    ('any(num % 2 == 0 and pop == 1) and sum(odds * 2) / 5 > 10.5',
+     lambda pop, waku, num, odds: any(n % 2 == 0 and p == 1 for n, p in zip(num, pop)) and sum(o * 2 for o in odds) / 5 > 10.5),
+    ('not (count(waku == 1) >= 1) and -sum(pop) >= -12',
+     lambda pop, waku, num, odds: not sum(w == 1 for w in waku) >= 1 and -sum(pop) >= -12),
+    ('1 < 2', lambda pop, waku, num, odds: True),
+])
+def test_compile_filter_expression(get_test_data, expression, predicate):
+    '''
+    compile_filter_expressionのテスト
+    抽出式で算出した組合せが、1組合せずつpythonの式で判定した組合せと一致することを確認する
+    '''
+    df = get_test_data
+    legs = get_leg_arrays(df)
+    filter_params = {'expression': [expression]}
+
+    expected = calc_expression_reference(df, predicate)
+
+    result_list = []
+    result_list.append(calc_combination_array(
+        legs, filter_params).tolist() == expected)
+    # 枝刈りで算出した場合も、生き残った組合せに抽出式を適用して同じ結果になる
+    result_list.append(calc_packed_tickets_branch_and_bound(
+        legs, filter_params).tolist() == np.sort(pack_tickets(np.array(expected).reshape(-1, 5))).tolist())
+
+    assert all(result_list)
+
+
+@pytest.mark.parametrize('expression', [
+    'sum(pop',
+    'pop > 1',
+    'sum(1) > 1',
+    'pop[0] > 1',
+    'foo(pop) > 1',
+    'sum(pop) @ 3',
+    'sum(pop) between 1',
+    'sum(pop) > 1 2',
+])
+def test_compile_filter_expression_error(expression):
+    '''
+    compile_filter_expressionのテスト
+    構文や型が正しくない抽出式はFilterExpressionErrorとなることを確認する
+    '''
+    with pytest.raises(FilterExpressionError):
+        compile_filter_expression(expression)
@@ -0,0 +1,136 @@
+import pytest
+import pandas as pd
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_combination_engine import LEG_COLUMNS, get_leg_arrays
+from win5_race_card import *
+
+
+@pytest.fixture(scope='module')
+def get_test_data():
+    '''
+    test用データ作成処理
+    2レース目は馬番未確定の馬を含み、人気とオッズは未確定
+    '''
+    rows = []
+    for race_no, horse_cnt in zip(range(1, 6), [6, 5, 7, 4, 6]):
+        for horse_num in range(1, horse_cnt+1):
+            rows.append({'レース番号': race_no, '馬番': horse_num, '枠番': (horse_num + 1) // 2,
+                         '人気': horse_cnt - horse_num + 1, 'オッズ': float(horse_cnt - horse_num + 1) * 1.7,
+                         '馬名': f'テストホース{race_no}{horse_num}', 'コース': f'芝{race_no}000m'})
+    df = pd.DataFrame(rows)
+    df.loc[df['レース番号'] == 2, ['人気', 'オッズ']] = -1
+    df = pd.concat([df, pd.DataFrame([{'レース番号': 2, '馬番': -1, '枠番': -1,
+                                       '人気': -1, 'オッズ': -1, '馬名': 'テスト未確定', 'コース': '芝2000m'}])], ignore_index=True)
+
+    # 画面の並び順と同じく人気順に並べ替えておく
+    return df.sort_values('人気').reset_index(drop=True)
+
+
+def test_race_card_lookup(get_test_data):
+    '''
+    RaceCardのテスト
+    馬番を添字として各出走馬の値を取得でき、出走しない馬番は未確定の値になることを確認する
+    '''
+    df = get_test_data
+    race_card = RaceCard(df)
+
+    result_list = []
+    for _, row in df.loc[df['馬番'] != -1].iterrows():
+        horse = race_card.get_horse(int(row['レース番号']) - 1, int(row['馬番']))
+        result_list.extend([horse[col] == row[col]
+                           for col in RACE_CARD_COLUMNS])
+        result_list.append(horse['馬名'] == row['馬名'])
+
+    # 馬番0と出走頭数より大きい馬番は出走しない
+    horse = race_card.get_horse(0, 0)
+    result_list.append(all(horse[col] == -1 for col in RACE_CARD_COLUMNS))
+    horse = race_card.get_horse(1, 6)
+    result_list.append(all(horse[col] == -1 for col in RACE_CARD_COLUMNS))
+
+    result_list.append(race_card.get_entry_horse_nums(
+        1).tolist() == [1, 2, 3, 4, 5])
+    result_list.append(race_card.is_entry.sum() == 28)
+
+    assert all(result_list)
+
+
+def test_race_card_get_legs(get_test_data):
+    '''
+    RaceCard.get_legsのテスト
+    選択した馬番から作成した配列が、レース詳細から作成した配列と一致することを確認する
+    '''
+    df = get_test_data
+    race_card = RaceCard(df)
+
+    selected_horse_nums = [[1, 3], [2], [1, 4, 7], [4], [2, 5, 6]]
+    legs = race_card.get_legs(selected_horse_nums)
+
+    df_selected = pd.concat([df.loc[(df['レース番号'] == idx + 1) & (df['馬番'].isin(horse_nums))]
+                             for idx, horse_nums in zip(range(5), selected_horse_nums)]).sort_values(['レース番号', '馬番'])
+    expected = get_leg_arrays(df_selected)
+
+    result_list = []
+    for leg, expected_leg, horse_nums in zip(legs, expected, selected_horse_nums):
+        for col in LEG_COLUMNS:
+            result_list.append(leg[col].tolist() == expected_leg[col].tolist())
+        result_list.append(leg['馬番'].tolist() == horse_nums)
+
+    assert all(result_list)
+
+
+def test_race_card_flags_and_sort(get_test_data):
+    '''
+    RaceCardのフラグと並び替えのテスト
+    1番人気と未確定のフラグが立ち、人気が未確定のレースは馬番順のまま並ぶことを確認する
+    '''
+    race_card = RaceCard(get_test_data)
+
+    result_list = []
+    result_list.append(race_card.get_horse(0, 6)['フラグ'] == FLAG_FAVORITE)
+    result_list.append(race_card.get_horse(0, 1)['フラグ'] == 0)
+    result_list.append(all(race_card.get_horse(1, num)['フラグ'] == FLAG_UNDECIDED
+                           for num in range(1, 6)))
+    result_list.append(get_flag_label(FLAG_FAVORITE | FLAG_UNDECIDED) == '1人気/未確定')
+
+    # 馬番未確定の馬は配列に格納せず、別に保持する
+    result_list.append(len(race_card.undecided_horses[1]) == 1)
+    result_list.append(
+        race_card.undecided_horses[1][0]['馬名'] == 'テスト未確定')
+
+    result_list.append(race_card.get_sorted_horse_nums(
+        0, '人気').tolist() == [6, 5, 4, 3, 2, 1])
+    result_list.append(race_card.get_sorted_horse_nums(
+        0, '馬番', False).tolist() == [6, 5, 4, 3, 2, 1])
+    result_list.append(race_card.get_sorted_horse_nums(
+        1, '人気').tolist() == [1, 2, 3, 4, 5])
+    result_list.append(race_card.course_list == [
+                       f'芝{race_no}000m' for race_no in range(1, 6)])
+
+    assert all(result_list)
+
+
+def test_race_card_set_dead_horses(get_test_data):
+    '''
+    RaceCard.set_dead_horsesのテスト
+    対象外のフラグが立て直され、フラグが変わった馬のみ返されることを確認する
+    '''
+    race_card = RaceCard(get_test_data)
+
+    result_list = []
+    result_list.append(race_card.set_dead_horses(
+        [[1, 6], [], [2], [], []]) == [(0, 1), (0, 6), (2, 2)])
+    result_list.append(race_card.get_horse(0, 6)['フラグ'] == FLAG_FAVORITE | FLAG_DEAD)
+    result_list.append(get_flag_label(race_card.get_horse(0, 6)['フラグ']) == '1人気/対象外')
+
+    # 対象外でなくなった馬のフラグは元に戻る
+    result_list.append(race_card.set_dead_horses(
+        [[1], [], [], [], []]) == [(0, 6), (2, 2)])
+    result_list.append(race_card.get_horse(0, 6)['フラグ'] == FLAG_FAVORITE)
+    result_list.append(race_card.get_horse(0, 1)['フラグ'] == FLAG_DEAD)
+
+    assert all(result_list)
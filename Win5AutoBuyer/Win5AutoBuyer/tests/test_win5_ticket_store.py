@@ -0,0 +1,108 @@
+import pytest
+import numpy as np
+
+import os
+import sys  # nopep8
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))  # nopep8
+from config.settings import *  # nopep8
+
+from win5_ticket_store import *
+
+
+@pytest.fixture
+def get_ticket_store(tmp_path):
+    '''
+    test用の保存先(一時ディレクトリ)を使用するストア作成処理
+    '''
+    return TicketStore(str(tmp_path / 'test.db3'), str(tmp_path / 'tickets'), WIN5_TICKET_SETS_TABLE_NAME,
+                       CREATE_WIN5_TICKET_SETS_SQL, GET_WIN5_TICKET_SET_SQL)
+
+
+def test_ticket_store(get_ticket_store):
+    '''
+    TicketStoreのテスト
+    保存した組合せがメモリマップで読み込まれ、保存していないものはNoneとなることを確認する
+    '''
+    store = get_ticket_store
+    tickets = np.sort(np.random.default_rng(0).choice(
+        1 << 25, 1000, replace=False)).astype(np.uint32)
+    filter_params = {'ninkiwa': [10, 12], 'expression': ['sum(pop) < 20']}
+
+    result_list = []
+    result_list.append(store.load('a') is None)
+    result_list.append(store.save('a', '2022-12-18',
+                       filter_params, 'v1', tickets))
+
+    loaded = store.load('a')
+    result_list.append(np.array_equal(loaded, tickets))
+    result_list.append(loaded.dtype == np.uint32)
+    # コピーせずファイルを参照し、書き換えられない
+    result_list.append(isinstance(loaded.base, np.memmap))
+    result_list.append(not loaded.flags.writeable)
+    # Windowsではメモリマップ中のファイルを置き換えられないため、参照を外しておく
+    del loaded
+
+    # 同じキーで保存し直すと置き換わる
+    result_list.append(store.save('a', '2022-12-18',
+                       filter_params, 'v1', tickets[:10]))
+    result_list.append(np.array_equal(store.load('a'), tickets[:10]))
+
+    # 0点の組合せも保存できる
+    store.save('b', '2022-12-18', filter_params, 'v1',
+               np.empty(0, dtype=np.uint32))
+    result_list.append(len(store.load('b')) == 0)
+
+    # ファイルが消えた場合は保存していないものとして扱う
+    os.remove(store.get_ticket_path('b'))
+    result_list.append(store.load('b') is None)
+
+    assert all(result_list)
+
+
+def test_ticket_store_save_failed(get_ticket_store):
+    '''
+    TicketStore.saveのテスト
+    記録に失敗した場合はFalseとなり、記録のない.npyファイルが残らず、以前の記録も残ることを確認する
+    '''
+    store = get_ticket_store
+    tickets = np.arange(10, dtype=np.uint32)
+    store.save('a', '2022-12-18', {}, 'v1', tickets)
+
+    # 記録先のテーブルが存在しない場合は記録に失敗する
+    store.table_name = 'NotExistTable'
+    is_saved = store.save('b', '2022-12-18', {}, 'v1', tickets)
+    store.table_name = WIN5_TICKET_SETS_TABLE_NAME
+
+    result_list = []
+    result_list.append(not is_saved)
+    result_list.append(not os.path.exists(store.get_ticket_path('b')))
+    result_list.append(np.array_equal(store.load('a'), tickets))
+
+    assert all(result_list)
+
+
+def test_ticket_store_prune(get_ticket_store):
+    '''
+    TicketStore.pruneのテスト
+    指定したレース日付より前の組合せと、記録のない.npyファイルのみ削除されることを確認する
+    '''
+    store = get_ticket_store
+    tickets = np.arange(10, dtype=np.uint32)
+    store.save('old', '2022-12-11', {}, 'v1', tickets)
+    store.save('current', '2022-12-18', {}, 'v1', tickets)
+    store.save('next', '2022-12-25', {}, 'v1', tickets)
+    # 記録のないファイル(記録前に終了した場合など)
+    with open(store.get_ticket_path('orphan'), 'wb') as f:
+        np.save(f, tickets)
+
+    removed_cnt = store.prune('2022-12-18')
+
+    result_list = []
+    result_list.append(removed_cnt == 2)
+    result_list.append(store.load('old') is None)
+    result_list.append(not os.path.exists(store.get_ticket_path('old')))
+    result_list.append(not os.path.exists(store.get_ticket_path('orphan')))
+    result_list.append(np.array_equal(store.load('current'), tickets))
+    result_list.append(np.array_equal(store.load('next'), tickets))
+
+    assert all(result_list)
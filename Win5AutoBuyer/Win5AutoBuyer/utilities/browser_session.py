@@ -0,0 +1,284 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+import queue
+import threading
+import time
+from playwright.sync_api import BrowserContext, Page, Route, sync_playwright
+from .common_log_manager import log_manager
+from .log_manager import LogManager
+import os
+LOG_CONFIG_FILE_PATH = f'config{os.sep}log_config.json'
+
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, LOG_CONFIG_FILE_PATH)
+else:
+    log_manager = log_manager
+
+
+class BrowserSession():
+    '''
+    playwrightのブラウザとコンテキストを起動したまま保持し、アプリ終了まで使い回すクラス
+    playwrightの同期APIは起動したスレッドからしか操作できないため、
+    ブラウザの操作はrunで専用スレッドに渡して実行する
+    ヘッドレスのブラウザ(スクレイピング用)では、画像、フォントなど画面操作に不要なリソースは読み込まない
+    即PATでの購入に使用するヘッドレスでないブラウザは、実際の画面と同じ表示で要素を判定するため全て読み込む
+    起動していないブラウザは初回使用時に起動するため、startで事前に起動しておく
+    '''
+
+    def __init__(self, user_agent: str, timeout: float, blocked_resource_types: list = None):
+        '''
+        コンストラクタ
+            Params
+                user_agent: str
+                    ブラウザのUser-Agent
+                timeout: float
+                    ページ操作のタイムアウト(ミリ秒)
+                blocked_resource_types: list = None
+                    ヘッドレスのブラウザで読み込まないリソースの種類(image, font, stylesheet, mediaなど)
+        '''
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.blocked_resource_types = set(blocked_resource_types or [])
+
+        self.playwright = None
+        # ヘッドレスかどうかごとの(ブラウザ, コンテキスト)
+        self.browsers = {}
+
+        # 読み込まなかったリソース数
+        self.blocked_cnt = 0
+
+        # 手順ごとの[回数, 合計処理時間(秒)]
+        self.timings = {}
+
+        self.tasks = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        '''
+        ブラウザを操作する処理を専用スレッドに渡す処理(終了は待たない)
+            Params
+                func
+                    ブラウザを操作する処理(第1引数にこのセッションを受け取る)
+                args, kwargs
+                    funcに渡す引数
+            Returns
+                funcの戻り値、例外を受け取るFuture
+        '''
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(
+                    target=self.work, name='browser_session', daemon=True)
+                self.worker.start()
+
+        future = Future()
+        self.tasks.put((func, args, kwargs, future))
+
+        return future
+
+    def run(self, func, *args, **kwargs):
+        '''
+        ブラウザを操作する処理を専用スレッドで実行し、終了まで待つ処理
+            Params
+                func
+                    ブラウザを操作する処理(第1引数にこのセッションを受け取る)
+                args, kwargs
+                    funcに渡す引数
+            Returns
+                funcの戻り値
+                funcで例外が発生した場合は呼出元に送出する
+        '''
+        return self.submit(func, *args, **kwargs).result()
+
+    def start(self, use_headless_list: list) -> Future:
+        '''
+        指定したブラウザを専用スレッドで事前に起動する処理(起動の終了は待たない)
+        初回のスクレイピング、購入でブラウザの起動を待たないよう、アプリ起動時に呼び出す
+        起動に失敗した場合はログに出力し、初回使用時に改めて起動する
+            Params
+                use_headless_list: list
+                    起動するブラウザがヘッドレスかどうかのlist
+            Returns
+                起動の終了を待つ場合に使用するFuture
+        '''
+        return self.submit(BrowserSession.launch_browsers, use_headless_list)
+
+    def launch_browsers(self, use_headless_list: list):
+        '''
+        指定したブラウザを起動する処理(runで実行する処理から呼び出す)
+            Params
+                use_headless_list: list
+                    起動するブラウザがヘッドレスかどうかのlist
+        '''
+        for use_headless in use_headless_list:
+            try:
+                self.get_context(use_headless)
+            except Exception as e:
+                log_manager.logging_error_traceback()
+
+    def work(self):
+        '''
+        runで渡された処理を順に実行する専用スレッドの処理
+        Noneを受け取ったら終了する
+        '''
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            func, args, kwargs, future = task
+            try:
+                future.set_result(func(self, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def get_context(self, use_headless: bool = True) -> BrowserContext:
+        '''
+        起動済みのコンテキストを取得する処理(runで実行する処理から呼び出す)
+        未起動、またはブラウザが終了していた場合は起動する
+            Params
+                use_headless: bool = True
+                    ヘッドレスで起動するかどうか
+            Returns
+                コンテキスト
+        '''
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+
+        browser, context = self.browsers.get(use_headless, (None, None))
+        if browser is None or not browser.is_connected():
+            start = time.perf_counter()
+
+            browser = self.playwright.chromium.launch(headless=use_headless)
+            context = browser.new_context(user_agent=self.user_agent)
+            context.set_default_timeout(self.timeout)
+            # 購入に使用するヘッドレスでないブラウザは、表示が変わらないよう全て読み込む
+            if use_headless and len(self.blocked_resource_types) > 0:
+                context.route('**/*', self.handle_route)
+            self.browsers[use_headless] = (browser, context)
+
+            self.add_timing('ブラウザ起動', time.perf_counter() - start)
+
+        return context
+
+    def new_page(self, use_headless: bool = True) -> Page:
+        '''
+        起動済みのコンテキストで新しいページを開く処理(runで実行する処理から呼び出す)
+            Params
+                use_headless: bool = True
+                    ヘッドレスのブラウザで開くかどうか
+            Returns
+                ページオブジェクト
+        '''
+        return self.get_context(use_headless).new_page()
+
+    def is_blocked(self, resource_type: str) -> bool:
+        '''
+        読み込まないリソースかどうかを判定する処理
+            Params
+                resource_type: str
+                    リソースの種類
+            Returns
+                読み込まない場合はTrue
+        '''
+        return resource_type in self.blocked_resource_types
+
+    def handle_route(self, route: Route):
+        '''
+        リクエストごとに、読み込まないリソースであれば中止する処理
+            Params
+                route: Route
+                    playwrightのルート
+        '''
+        if self.is_blocked(route.request.resource_type):
+            self.blocked_cnt += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    def add_timing(self, step_name: str, elapsed: float):
+        '''
+        手順の処理時間を記録する処理
+            Params
+                step_name: str
+                    手順名
+                elapsed: float
+                    処理時間(秒)
+        '''
+        with self.lock:
+            timing = self.timings.setdefault(step_name, [0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+
+    @contextmanager
+    def step(self, step_name: str):
+        '''
+        withブロック内の処理時間を手順ごとに記録する処理
+            Params
+                step_name: str
+                    手順名
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(step_name, time.perf_counter() - start)
+
+    def get_timing_report(self) -> dict:
+        '''
+        手順ごとの処理時間を集計する処理
+            Returns
+                {手順名: {'count': 回数, 'total': 合計処理時間(秒), 'average': 平均処理時間(秒)}}のdict
+        '''
+        with self.lock:
+            return {step_name: {'count': cnt, 'total': total, 'average': total / cnt}
+                    for step_name, (cnt, total) in self.timings.items()}
+
+    def log_timings(self):
+        '''
+        手順ごとの処理時間と、読み込まなかったリソース数をログに出力し、記録をクリアする処理
+        '''
+        for step_name, timing in self.get_timing_report().items():
+            log_manager.info(
+                f'{step_name}: {timing["count"]}回 合計: {timing["total"]:.2f}秒 平均: {timing["average"]:.2f}秒')
+        log_manager.info(f'読み込まなかったリソース: {self.blocked_cnt}件')
+
+        with self.lock:
+            self.timings = {}
+            self.blocked_cnt = 0
+
+    def close_browsers(self):
+        '''
+        起動済みのブラウザとplaywrightを終了する処理(runで実行する処理から呼び出す)
+        '''
+        for browser, context in self.browsers.values():
+            if browser.is_connected():
+                context.close()
+                browser.close()
+        self.browsers = {}
+
+        if self.playwright is not None:
+            self.playwright.stop()
+            self.playwright = None
+
+    def close(self):
+        '''
+        ブラウザを終了し、専用スレッドを停止する処理
+        '''
+        with self.lock:
+            worker = self.worker
+            self.worker = None
+
+        if worker is None or not worker.is_alive():
+            return
+
+        future = Future()
+        self.tasks.put((BrowserSession.close_browsers, (), {}, future))
+        self.tasks.put(None)
+        try:
+            future.result()
+        except Exception as e:
+            log_manager.logging_error_traceback()
+        worker.join()
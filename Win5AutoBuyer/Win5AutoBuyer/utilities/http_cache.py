@@ -0,0 +1,214 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+from .common_log_manager import log_manager
+from .log_manager import LogManager
+import os
+LOG_CONFIG_FILE_PATH = f'config{os.sep}log_config.json'
+
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, LOG_CONFIG_FILE_PATH)
+else:
+    log_manager = log_manager
+
+# 取得結果の種類
+# 有効期限内のため、リクエストを送らずに保存済みの本文を使用した
+CACHE_HIT = 'hit'
+# 有効期限切れのため条件付きリクエストを送り、304が返ったので保存済みの本文を使用した
+CACHE_REVALIDATED = 'revalidated'
+# 保存していない、または更新されていたため本文を取得した
+CACHE_MISS = 'miss'
+
+
+class HttpCache():
+    '''
+    URLごとに応答の本文(圧縮)と、ETag、Last-Modifiedをファイルに保存するクラス
+    ページの種類ごとの有効期限内は保存済みの本文を使用し、期限切れの場合は条件付きリクエストで更新を確認する
+    '''
+
+    def __init__(self, cache_dir: str, ttls: dict):
+        '''
+        コンストラクタ
+            Params
+                cache_dir: str
+                    保存先ディレクトリ
+                ttls: dict
+                    {ページの種類: 有効期限(秒)}のdict
+        '''
+        self.cache_dir = cache_dir
+        self.ttls = ttls
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # 取得結果の種類ごとの件数
+        self.counts = {CACHE_HIT: 0, CACHE_REVALIDATED: 0, CACHE_MISS: 0}
+        self.lock = threading.Lock()
+
+    def get_paths(self, url: str) -> tuple:
+        '''
+        URLから保存先のファイルパスを取得する処理
+            Params
+                url: str
+                    URL
+            Returns
+                (ヘッダ情報のjsonのパス, 圧縮した本文のパス)
+        '''
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.cache_dir, f'{key}.json'), os.path.join(self.cache_dir, f'{key}.bin')
+
+    def load(self, url: str) -> dict:
+        '''
+        保存済みのヘッダ情報を取得する処理
+            Params
+                url: str
+                    URL
+            Returns
+                url, page_class, etag, last_modified, stored_atのdict
+                保存していない場合、読めない場合はNone
+        '''
+        meta_path, body_path = self.get_paths(url)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            log_manager.logging_error_traceback()
+            return None
+
+        # ハッシュ値が衝突した場合は別のURLのため使用しない
+        return entry if entry.get('url') == url else None
+
+    def load_body(self, url: str) -> bytes:
+        '''
+        保存済みの本文を取得する処理
+            Params
+                url: str
+                    URL
+            Returns
+                展開した本文
+        '''
+        _, body_path = self.get_paths(url)
+        with open(body_path, 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def is_fresh(self, entry: dict) -> bool:
+        '''
+        保存済みの本文が有効期限内かどうかを判定する処理
+            Params
+                entry: dict
+                    loadで取得したヘッダ情報
+            Returns
+                有効期限内の場合はTrue
+        '''
+        ttl = self.ttls.get(entry['page_class'], 0)
+
+        return time.time() - entry['stored_at'] < ttl
+
+    def get_conditional_headers(self, entry: dict) -> dict:
+        '''
+        更新を確認する条件付きリクエストのヘッダを作成する処理
+            Params
+                entry: dict
+                    loadで取得したヘッダ情報
+            Returns
+                If-None-Match、If-Modified-Sinceのdict(保存していない項目は含めない)
+        '''
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def store(self, url: str, page_class: str, body: bytes, etag: str = None, last_modified: str = None):
+        '''
+        本文とヘッダ情報を保存する処理
+        書込途中で終了しても壊れたファイルを読まないよう、一時ファイルに書いてから置き換える
+            Params
+                url: str
+                    URL
+                page_class: str
+                    ページの種類(有効期限の判定に使用)
+                body: bytes
+                    本文
+                etag: str = None
+                    ETagヘッダの値
+                last_modified: str = None
+                    Last-Modifiedヘッダの値
+        '''
+        _, body_path = self.get_paths(url)
+
+        if body is not None:
+            with open(f'{body_path}.tmp', 'wb') as f:
+                f.write(zlib.compress(body))
+            os.replace(f'{body_path}.tmp', body_path)
+
+        self.write_entry({
+            'url': url,
+            'page_class': page_class,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': time.time(),
+        })
+
+    def write_entry(self, entry: dict):
+        '''
+        ヘッダ情報を保存する処理
+            Params
+                entry: dict
+                    url, page_class, etag, last_modified, stored_atのdict
+        '''
+        meta_path, _ = self.get_paths(entry['url'])
+        with open(f'{meta_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(f'{meta_path}.tmp', meta_path)
+
+    def touch(self, entry: dict):
+        '''
+        304が返った場合に、本文はそのまま有効期限のみ延長する処理
+            Params
+                entry: dict
+                    loadで取得したヘッダ情報
+        '''
+        self.store(entry['url'], entry['page_class'], None,
+                   entry.get('etag'), entry.get('last_modified'))
+
+    def set_page_class(self, url: str, page_class: str):
+        '''
+        保存済みのページの種類を変更する処理
+        出馬表にオッズが掲載された場合など、解析後にわかった種類で有効期限を判定させる
+            Params
+                url: str
+                    URL
+                page_class: str
+                    ページの種類
+        '''
+        entry = self.load(url)
+        if entry is not None and entry['page_class'] != page_class:
+            entry['page_class'] = page_class
+            self.write_entry(entry)
+
+    def count(self, result: str):
+        '''
+        取得結果の種類ごとの件数を数える処理
+            Params
+                result: str
+                    CACHE_HIT、CACHE_REVALIDATED、CACHE_MISSのいずれか
+        '''
+        with self.lock:
+            self.counts[result] += 1
+
+    def log_stats(self):
+        '''
+        取得結果の種類ごとの件数をログに出力する処理
+        '''
+        log_manager.info(
+            f'HTTPキャッシュ hit: {self.counts[CACHE_HIT]} revalidate: {self.counts[CACHE_REVALIDATED]} miss: {self.counts[CACHE_MISS]}')
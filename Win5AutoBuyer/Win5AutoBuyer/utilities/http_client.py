@@ -0,0 +1,198 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .common_log_manager import log_manager
+from .http_cache import CACHE_HIT, CACHE_MISS, CACHE_REVALIDATED, HttpCache
+from .log_manager import LogManager
+import os
+LOG_CONFIG_FILE_PATH = f'config{os.sep}log_config.json'
+
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, LOG_CONFIG_FILE_PATH)
+else:
+    log_manager = log_manager
+
+
+class HttpClient():
+    '''
+    接続を使い回すrequests.Sessionで、GETリクエストを送るクラス
+    5xxの応答や接続エラーの場合は、待ち時間を指数的に増やし、ゆらぎを加えて再送する
+    再送もリクエストの間隔の制限(rate_limiter)を守る
+    '''
+
+    def __init__(self, user_agent: str, timeout: float, pool_size: int = 10, retry_cnt: int = 3,
+                 backoff_base: float = 2.0, backoff_max: float = 30.0, cache: HttpCache = None, rate_limiter=None):
+        '''
+        コンストラクタ
+            Params
+                user_agent: str
+                    リクエストに付与するUser-Agent
+                timeout: float
+                    接続、応答待ちのタイムアウト(秒)
+                pool_size: int = 10
+                    同じホストに保持する接続数の上限(並行に送るリクエスト数以上にする)
+                retry_cnt: int = 3
+                    再送する回数の上限
+                backoff_base: float = 2.0
+                    1回目の再送までの待ち時間(秒)の基準値
+                    n回目の再送までは基準値×2^(n-1)の半分から等倍の間でランダムに待つ
+                backoff_max: float = 30.0
+                    再送までの待ち時間(秒)の上限
+                cache: HttpCache = None
+                    get_with_cacheで使用する応答のキャッシュ
+                rate_limiter = None
+                    再送の前にacquireでトークンを取得するリクエストの間隔の制限(TokenBucketなど)
+                    1回目のリクエストは呼出元で取得する(fetch_concurrentlyなど)
+        '''
+        self.timeout = timeout
+        self.cache = cache
+        self.retry_cnt = retry_cnt
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': user_agent})
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        # 送信したリクエスト数(再送を含む)、再送数
+        self.request_cnt = 0
+        self.retry_total = 0
+        self.lock = threading.Lock()
+
+    def get_backoff(self, attempt: int) -> float:
+        '''
+        再送までの待ち時間を算出する処理
+            Params
+                attempt: int
+                    何回目の再送か(1始まり)
+            Returns
+                待ち時間(秒)
+        '''
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+
+        return backoff * random.uniform(0.5, 1.0)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        '''
+        GETリクエストを送る処理
+        5xxの応答や接続エラーの場合は、再送回数の上限まで待ってから再送する
+        rate_limiterが指定されている場合は、待った後にトークンを取得してから再送する
+            Params
+                url: str
+                    リクエスト先のURL
+                kwargs
+                    requests.Session.getに渡す引数(headersなど)
+            Returns
+                応答
+                再送回数の上限まで5xxの場合は最後の応答
+                再送回数の上限まで接続エラーの場合は例外を送出する
+        '''
+        for attempt in range(self.retry_cnt + 1):
+            with self.lock:
+                self.request_cnt += 1
+                if attempt > 0:
+                    self.retry_total += 1
+
+            try:
+                response = self.session.get(
+                    url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retry_cnt:
+                    raise
+                log_manager.info(f'接続エラーのため再送します: {url} {e}')
+            else:
+                if response.status_code < 500 or attempt >= self.retry_cnt:
+                    return response
+                log_manager.info(
+                    f'サーバーエラーのため再送します: {url} {response.status_code}')
+
+            time.sleep(self.get_backoff(attempt + 1))
+
+            # 並行に取得している他のスレッドの再送と合わせても、リクエストの間隔の制限を超えないようにする
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+    def get_with_cache(self, url: str, page_class: str) -> tuple:
+        '''
+        キャッシュを使用してGETリクエストを送る処理
+        有効期限内はリクエストを送らず、期限切れの場合は条件付きリクエストで更新を確認する
+            Params
+                url: str
+                    リクエスト先のURL
+                page_class: str
+                    ページの種類(初回取得時の有効期限の判定に使用)
+                    保存済みの場合は保存時またはset_page_classで設定した種類を使用する
+            Returns
+                content: bytes
+                    本文
+                result: str
+                    CACHE_HIT、CACHE_REVALIDATED、CACHE_MISSのいずれか
+                    CACHE_MISS以外は前回取得時と同じ本文
+        '''
+        if self.cache is None:
+            response = self.get(url)
+            response.raise_for_status()
+            return response.content, CACHE_MISS
+
+        entry = self.cache.load(url)
+
+        if entry is not None and self.cache.is_fresh(entry):
+            result = CACHE_HIT
+            content = self.cache.load_body(url)
+        else:
+            headers = {} if entry is None else self.cache.get_conditional_headers(
+                entry)
+            response = self.get(url, headers=headers)
+
+            if response.status_code == 304 and entry is not None:
+                result = CACHE_REVALIDATED
+                content = self.cache.load_body(url)
+                self.cache.touch(entry)
+            else:
+                response.raise_for_status()
+                result = CACHE_MISS
+                content = response.content
+                self.cache.store(url, page_class if entry is None else entry['page_class'], content,
+                                 response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+        self.cache.count(result)
+
+        return content, result
+
+    def get_stats(self) -> dict:
+        '''
+        リクエスト数、接続数、接続の再利用数を取得する処理
+            Returns
+                request_cnt: 送信したリクエスト数(再送を含む)
+                retry_cnt: 再送したリクエスト数
+                connection_cnt: 新たに確立した接続数
+                reused_cnt: 確立済みの接続を再利用したリクエスト数
+        '''
+        pools = self.adapter.poolmanager.pools
+        connection_cnt = sum(pools[key].num_connections for key in pools.keys())
+
+        return {
+            'request_cnt': self.request_cnt,
+            'retry_cnt': self.retry_total,
+            'connection_cnt': connection_cnt,
+            'reused_cnt': max(0, self.request_cnt - connection_cnt),
+        }
+
+    def log_stats(self):
+        '''
+        リクエスト数、接続数、接続の再利用数をログに出力する処理
+        '''
+        stats = self.get_stats()
+        log_manager.info(
+            f'HTTP リクエスト: {stats["request_cnt"]} 再送: {stats["retry_cnt"]} 接続: {stats["connection_cnt"]} 接続の再利用: {stats["reused_cnt"]}')
+
+        if self.cache is not None:
+            self.cache.log_stats()
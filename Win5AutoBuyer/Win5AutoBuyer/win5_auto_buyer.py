@@ -1,7 +1,6 @@
 # 標準モジュール
 from functools import partial
 import inspect
-from time import sleep
 import datetime
 import sqlite3
 from typing import Tuple
@@ -9,10 +8,10 @@ import os
 
 # インストールモジュール
 import pandas as pd
-from playwright.sync_api import sync_playwright
 from utilities.common_functions import is_empty_DataFrame
-from pywebio.output import put_table, use_scope, put_tabs, put_buttons, span, put_row, clear, put_loading, toast
-from pywebio.pin import put_input, put_checkbox, pin_wait_change, put_select
+from pywebio.output import put_table, use_scope, put_tabs, put_buttons, span, put_row, clear, put_loading, toast, put_scope, put_text
+from pywebio.input import FLOAT, NUMBER
+from pywebio.pin import put_input, put_checkbox, pin_wait_change, put_select, pin
 import pywebio.session as psession
 import numpy as np
 
@@ -27,7 +26,14 @@ set_common_log_manager(log_manager)
 
 from config.settings import *  # nopep8
 from utilities.sqlite_utils import execute_select_sql_with_param, execute_select_sql_with_param_query, get_query  # nopep8
-from win5_data_getter import get_entry_horce_info, get_playwright_page, get_win5_races, get_win5_races_page  # nopep8
+from win5_data_getter import browser_session, get_entry_horce_infos, get_playwright_page, get_win5_races, get_win5_races_page  # nopep8
+from win5_combination_engine import LEG_COUNT, FilterFunnel, IncrementalCombinationEngine, calc_alive_horses, count_combinations_by_ninkiwa, partial_lookup_values, select_budget_tickets, select_top_k_tickets  # nopep8
+from multi_leg_combinator import MultiLegCombinator  # nopep8
+from win5_race_card import RaceCard, get_flag_label  # nopep8
+from win5_combination_cache import CombinationCache, get_selection_fingerprint  # nopep8
+from win5_filter_expression import FilterExpressionError, compile_filter_expression  # nopep8
+from win5_ticket_store import TicketStore  # nopep8
+from utilities.browser_session import BrowserSession  # nopep8
 
 
 # WIN5対象レース一覧
@@ -41,9 +47,41 @@ selected_values = []
 is_need_init = True
 
 # 現在購入対象となる馬券組み合わせ
-combination_list = []
+# 1組合せを馬番5ビット×5レースのuint32に詰めた配列
+combination_tickets = np.empty(0, dtype=np.uint32)
+
+# 選択変更のたびに差分のみ組合せを再計算するエンジン
+incremental_engine = None
+
+# 全出走馬の情報を馬番で直接参照できる出馬表
+# レース詳細の取得時に作成し、画面と組合せ計算の両方で使用する
+race_card = None
+
+# WIN5(5レース)の組合せを算出、圧縮するカーネル
+win5_combinator = MultiLegCombinator(
+    LEG_COUNT, ENGINE_WORKER_COUNT, ENGINE_PARALLEL_MIN_COMBINATIONS)
+
+# 同じ選択内容で組合せ計算を繰り返さないための計算結果のキャッシュ
+combination_cache = CombinationCache(ENGINE_CACHE_MAX_BYTES)
+
+# 再起動後も計算済みの組合せを再利用するため、計算結果を保存するストア
+ticket_store = TicketStore(DB_PATH, TICKET_STORE_DIR, WIN5_TICKET_SETS_TABLE_NAME,
+                           CREATE_WIN5_TICKET_SETS_SQL, GET_WIN5_TICKET_SET_SQL)
+
+# 組合せ計算ボタンで算出した際の抽出条件ごとの除外数
+# 差分再計算や絞り込みで組合せが変わった場合はNone
+combination_funnel = None
 
 # 定数
+# 即PATの投票メニューのWIN5(画面上のtitle)
+WIN5_MENU_TITLE = '指定された5レースの1着を予想する投票方式です。'
+
+# 即PATの完全セレクトの各レースの馬番選択ボタン
+RACE_BUTTONS_SELECTOR = 'div.race-buttons'
+
+# 即PATの完全セレクトでチェック済みの馬番
+CHECKED_HORSE_NUM_SELECTOR = 'div.race-buttons input:checked'
+
 # レース詳細の並び順
 SORT_SELECT_VALS = {
     'horse_num_asc': 0,
@@ -55,6 +93,14 @@ SORT_SELECT_VALS = {
 # 初期ソート順
 DEFAULT_SORT = SORT_SELECT_VALS['popular_asc']
 
+# 並び順ごとの並び替えに使用する列名と昇順かどうか
+SORT_SELECT_KEYS = {
+    SORT_SELECT_VALS['horse_num_asc']: ('馬番', True),
+    SORT_SELECT_VALS['horse_num_desc']: ('馬番', False),
+    SORT_SELECT_VALS['popular_asc']: ('人気', True),
+    SORT_SELECT_VALS['popular_desc']: ('人気', False),
+}
+
 # スコープ名
 # 組み合わせ計算エリアスコープ名
 COMBINATION_SCOPE_NM = 'combination_disp'
@@ -65,6 +111,51 @@ TAB_SCOPE_NM = 'tab_area'
 # 対象レース一覧エリアスコープ名
 RACE_SUMMARY_SCOPE_NM = 'race_summary'
 
+# 人気和ごとの組合せ点数スコープ名
+NINKIWA_CNT_SCOPE_NM = 'ninkiwa_cnt'
+
+# 1人気頭数ごとの組合せ点数スコープ名
+NINKI_TOUSU_CNT_SCOPE_NM = 'ninki_tousu_cnt'
+
+# 人気和パラメーターの範囲
+NINKIWA_RANGE = range(5, 29)
+
+# 1人気頭数パラメーターの範囲
+NINKI_TOUSU_RANGE = range(6)
+
+# 的中確率上位の点数入力欄のname
+TOP_K_INPUT_NM = 'top_k_cnt'
+
+# 予算入力欄のname
+BUDGET_INPUT_NM = 'budget'
+
+# 合成オッズの下限、上限入力欄のnameとラベル
+ODDS_INPUT_LABELS = {
+    'odds_min': '下限',
+    'odds_max': '上限',
+}
+
+# レース詳細タブの各馬の状態(フラグ)を表示するスコープ名の接頭辞
+HORSE_STATUS_SCOPE_NM = 'horse_status'
+
+# 抽出式入力欄のname
+EXPRESSION_INPUT_NM = 'expression'
+
+# 抽出式の入力エラーを表示するスコープ名
+EXPRESSION_STATUS_SCOPE_NM = 'expression_status'
+
+# 抽出条件ごとの除外数を表示する際の抽出条件名
+FUNNEL_STAGE_LABELS = {
+    'dead_horses': '対象外の馬',
+    'undecided': '未確定',
+    'ninkiwa': '人気和',
+    'ninki_tousu': '1人気頭数',
+    'waku': '枠',
+    'horse_num': '馬番',
+    'odds': '合成オッズ',
+    'expression': '抽出式',
+}
+
 # ローディングスタイル
 LOADING_STYLE = 'grow'
 
@@ -75,14 +166,41 @@ LOADING_COLOR = 'primary'
 LOADING_CSS = 'position: fixed; top: 50%; left: 50%;'
 
 
-def get_tab_table_vals_chk_lbls(s_race_detail: pd.Series, param_selected: list):
+def get_selected_horse_keys(param_selected: list) -> set:
     '''
-    レース詳細を出力するチェックボックス付テーブルとチェックボックスのラベルのリストを取得する処理
+    各tabコントロール内の選択リストから、選択済みの(レース番号, 馬番)のsetを作成する処理
         Params
-            s_race_detail: pd.Series
-                レース詳細のSeries
             param_selected: list
                 各tabコントロール内の選択リスト
+        Returns
+            選択済みの(レース番号, 馬番)のset
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    selected_horse_keys = set()
+    if not param_selected is None:
+        for tmp_selected_data in param_selected:
+
+            # 選択済みコントロールのnameがlistとstrの場合があり、各レース詳細情報はlist
+            # チェックボックスのnameの先頭にはtargetがついているので、パラメーターと混同しないように判定
+            if isinstance(tmp_selected_data['name'], list) and 'target' in tmp_selected_data['name'][0]:
+                # 各レース詳細情報のvalueは[<レース番号>,<馬番>]になっている
+                selected_horse_keys.add(
+                    (tmp_selected_data['value'][0][0], tmp_selected_data['value'][0][1]))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return selected_horse_keys
+
+
+def get_tab_table_vals_chk_lbls(s_race_detail, selected_horse_keys: set = None):
+    '''
+    レース詳細を出力するチェックボックス付テーブルとチェックボックスのラベルのリストを取得する処理
+        Params
+            s_race_detail
+                1頭分のレース詳細(RaceCard.get_horseで取得したdictまたはSeries)
+            selected_horse_keys: set = None
+                選択済みの(レース番号, 馬番)のset
         Return
             テーブルとチェックボックスのラベルのリストが入ったSeries
     '''
@@ -101,19 +219,9 @@ def get_tab_table_vals_chk_lbls(s_race_detail: pd.Series, param_selected: list):
         value_list.append('')
     else:
 
-        # 対象レースの選択済みの値を取得
-        is_selected = False
-        if not param_selected is None:
-            # 選択状態復元のため、選択済みの値から、現在のレース番号と馬番に合致するものを取得
-            for tmp_selected_data in param_selected:
-
-                # 選択済みコントロールのnameがlistとstrの場合があり、各レース詳細情報はlist
-                # チェックボックスのnameの先頭にはtargetがついているので、パラメーターと混同しないように判定
-                if isinstance(tmp_selected_data['name'], list) and 'target' in tmp_selected_data['name'][0]:
-                    # 各レース詳細情報のvalueは[<レース番号>,<馬番>]になっているので、現在処理中のものと合致するかどうか判定
-                    if tmp_selected_data['value'][0][0] == s_race_detail['レース番号'] and tmp_selected_data['value'][0][1] == s_race_detail['馬番']:
-                        is_selected = True
-                        break
+        # 選択状態復元のため、現在のレース番号と馬番が選択済みかどうか判定
+        is_selected = not selected_horse_keys is None and (
+            s_race_detail['レース番号'], s_race_detail['馬番']) in selected_horse_keys
 
         value_list.append(s_race_detail['馬番'])
         check_box_name = f'target_{s_race_detail["レース番号"]}_{s_race_detail["馬番"]}'
@@ -138,6 +246,15 @@ def get_tab_table_vals_chk_lbls(s_race_detail: pd.Series, param_selected: list):
     value_list.append(span(s_race_detail['ジョッキー'],  col=3))
     value_list.append(span(s_race_detail['調教師名'], col=3))
 
+    # 1番人気、未確定などのフラグ
+    # 対象外のフラグは選択変更のたびに変わるため、馬番が決まっている馬はスコープに出力する
+    flag_label = get_flag_label(s_race_detail.get('フラグ', 0))
+    if s_race_detail['馬番'] == -1:
+        value_list.append(flag_label)
+    else:
+        value_list.append(put_scope(f'{HORSE_STATUS_SCOPE_NM}_{s_race_detail["レース番号"]}_{s_race_detail["馬番"]}',
+                                    content=put_text(flag_label)))
+
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
     return pd.Series({'tab_vals': value_list, 'chk_box_nms': check_box_label_list})
@@ -180,74 +297,113 @@ def get_race_detail_from_db(race_date: str, race_no: int, sort_select_val: int):
     return df_race_detail
 
 
-def output_race_detail_for_table_with_checkbox(row: pd.Series, sort_select_val: int, param_selected: list):
+def load_race_card(df_win5_races: pd.DataFrame):
+    '''
+    WIN5対象レースのレース詳細を取得し、出馬表を作成する処理
+    レース詳細の読込時に1度だけ実行し、並び順の変更時は作成済みの出馬表を使用する
+        Params
+            df_win5_races: pd.DataFrame
+                WIN5対象レース一覧のDataFrame
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    global is_need_init
+    global race_card
+
+    df_list = []
+    fetch_targets = {}
+    for idx, (_, row) in enumerate(df_win5_races.iterrows()):
+
+        # すでにWIN5対象レース一覧データが存在している場合は、スクレイピング不要
+        df_tmp = get_race_detail_from_db(
+            row['レース日付'], row['レース番号'], SORT_SELECT_VALS['horse_num_asc'])
+
+        # 起動時は必ずレース詳細をJRAから取得するため、is_need_initがTrueの場合は必ず取得しに行く
+        if is_need_init or is_empty_DataFrame(df_tmp):
+            fetch_targets[idx] = (row['対象レースURL'],
+                                  row['レース日付'], row['レース番号'])
+
+        df_list.append(df_tmp)
+
+    # 取得が必要なレースはまとめて並行に取得する(開始間隔はACCESS_INTERVAL秒以上空ける)
+    if len(fetch_targets) > 0:
+        fetched_list = get_entry_horce_infos(list(fetch_targets.values()))
+        for idx, df_tmp in zip(fetch_targets, fetched_list):
+            df_list[idx] = df_tmp
+
+    # 再送しても取得できなかったレースは空となるため、除いて出馬表を作成する
+    for df_tmp, (_, row) in zip(df_list, df_win5_races.iterrows()):
+        if is_empty_DataFrame(df_tmp):
+            log_manager.info(f'{row["レース番号"]}レースの出馬表を取得できませんでした。')
+
+    df_list = [df_tmp for df_tmp in df_list if not is_empty_DataFrame(df_tmp)]
+    df_race_detail = pd.concat(df_list) if len(
+        df_list) > 0 else pd.DataFrame()
+
+    is_need_init = False
+
+    # DBに対象レース詳細を保存
+    with sqlite3.connect(DB_PATH) as conn:
+        df_race_detail.to_sql(WIN5_TARGET_RACE_DETAIL_TABLE_NAME, conn,
+                              if_exists='replace', index=None)
+
+    # 画面と組合せ計算で馬番から直接参照するため、出馬表を作成
+    race_card = None if is_empty_DataFrame(
+        df_race_detail) else RaceCard(df_race_detail)
+
+    # レース詳細を保存し直したので、以前のレース詳細で計算した組合せは破棄する
+    combination_cache.clear()
+
+    # 過去のレースの組合せは再利用しないため、保存先から削除する
+    if race_card is not None:
+        ticket_store.prune(race_card.race_date)
+
+    # 差分再計算用のエンジンも新しい出馬表を参照するように作り直す
+    init_incremental_engine()
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def output_race_detail_for_table_with_checkbox(leg_idx: int, sort_select_val: int, selected_horse_keys: set):
     '''
     各レースの出馬表をチェックボックス付テーブルとして出力する処理
         Params
-            row: pd.Series
-                対象レース情報
+            leg_idx: int
+                対象レースのインデックス(0始まり)
             sort_select_val
                 レース詳細の並び順
-            param_selected: list
-                各tabコントロール内の選択リスト
+            selected_horse_keys: set
+                選択済みの(レース番号, 馬番)のset
         Returns
             出力したチェックボックス付テーブル
     '''
     log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
-    global is_need_init
-
-    # すでにWIN5対象レース一覧データが存在している場合は、スクレイピング不要
-    df_race_detail = get_race_detail_from_db(
-        row['レース日付'], row['レース番号'], sort_select_val)
-
-    # 起動時は必ずレース詳細をJRAから取得するため、is_need_initがTrueの場合は必ず取得しに行く
-    if is_need_init or is_empty_DataFrame(df_race_detail):
-        # 各レース詳細を取得し、コントロールを出力
-        df_race_detail = get_entry_horce_info(
-            row['対象レースURL'], row['レース日付'], row['レース番号'])
-
-        # ソート順の設定
-        # いずれも仮番号が振られている場合はソートしない
-        if sort_select_val == SORT_SELECT_VALS['horse_num_asc']:
-            if (df_race_detail['馬番'] != -1).all():
-                df_race_detail = df_race_detail.sort_values(
-                    '馬番', ascending=True)
-
-        elif sort_select_val == SORT_SELECT_VALS['horse_num_desc']:
-            if (df_race_detail['馬番'] != -1).all():
-                df_race_detail = df_race_detail.sort_values(
-                    '馬番', ascending=False)
-
-        elif sort_select_val == SORT_SELECT_VALS['popular_asc']:
-            if (df_race_detail['人気'] != -1).all():
-                df_race_detail = df_race_detail.sort_values(
-                    '人気', ascending=True)
-
-        elif sort_select_val == SORT_SELECT_VALS['popular_desc']:
-            if (df_race_detail['人気'] != -1).all():
-                df_race_detail = df_race_detail.sort_values(
-                    '人気', ascending=False)
-
     header = ['枠番', '馬番', '選択',
-              span('馬名', col=3), 'オッズ', '人気', '年齢', '斤量', span('騎手', col=3), span('厩屋', col=3), ]
+              span('馬名', col=3), 'オッズ', '人気', '年齢', '斤量', span('騎手', col=3), span('厩屋', col=3), '状態']
 
     value_list = []
     # 値を取得するために、チェックボックスのlabelが必要なので格納する
     check_box_label_list = []
 
-    # dfの行(対象レース)ごとにチェックボックス付きテーブルを出力
-    tmp = df_race_detail.apply(
-        get_tab_table_vals_chk_lbls, param_selected=param_selected, axis=1)
-
-    value_list.extend(tmp['tab_vals'].values)
-    check_box_label_list.extend(tmp['chk_box_nms'].values)
-
-    del tmp
+    # 出馬表から並び順どおりに馬番を取得し、1頭ずつチェックボックス付きテーブルの行を作成
+    # 馬番が未確定の馬は並び替えられないので末尾に出力
+    # 出馬表が取得できなかった場合は空のテーブルにする
+    sort_col, ascending = SORT_SELECT_KEYS[sort_select_val]
+    horses = []
+    if race_card is not None:
+        horses = [race_card.get_horse(leg_idx, horse_num)
+                  for horse_num in race_card.get_sorted_horse_nums(leg_idx, sort_col, ascending)]
+        horses.extend(race_card.undecided_horses[leg_idx])
+
+    for horse in horses:
+        tmp = get_tab_table_vals_chk_lbls(horse, selected_horse_keys)
+        value_list.append(tmp['tab_vals'])
+        check_box_label_list.extend(tmp['chk_box_nms'])
 
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
-    return put_table(value_list, header=header), check_box_label_list, df_race_detail
+    return put_table(value_list, header=header), check_box_label_list
 
 
 def output_params_for_table_with_checkbox(param_selected: list = None):
@@ -262,14 +418,16 @@ def output_params_for_table_with_checkbox(param_selected: list = None):
     log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
     # パラメーターtableのヘッダ
-    header = ['人気和', '1人気頭数', '枠', '馬番']
+    # 人気和、1人気頭数ごとの点数は度数分布の畳み込みで算出しており、枠、馬番、合成オッズ、抽出式の条件は反映されない
+    header = ['人気和', '点数(枠・馬番・オッズ・抽出式除く)', '1人気頭数',
+              '点数(枠・馬番・オッズ・抽出式除く)', '枠', '馬番', '合成オッズ', '抽出式']
 
     # 値を取得するためにチェックボックスのlabelが必要なので取得するためのlist
     check_box_label_list = []
 
     # 人気和チェックボックス
     ninkiwa = []
-    for rg in range(5, 29):
+    for rg in NINKIWA_RANGE:
         is_selected = False
         ctl_nm = f'ninkiwa_{rg}'
         check_box_label_list.append(ctl_nm)
@@ -287,7 +445,7 @@ def output_params_for_table_with_checkbox(param_selected: list = None):
 
     # 1人気頭数チェックボックス
     ninki_tousu = []
-    for rg in range(6):
+    for rg in NINKI_TOUSU_RANGE:
         is_selected = False
         ctl_nm = f'ninki_tousu_{rg}'
         check_box_label_list.append(ctl_nm)
@@ -340,16 +498,43 @@ def output_params_for_table_with_checkbox(param_selected: list = None):
         horse_num.append(put_checkbox(ctl_nm, options=[
             {'label': odd_even_labels[rg], 'value': rg, 'selected': is_selected}], inline=True))
 
+    # 合成オッズ(各レースの単勝オッズの積)の下限、上限入力欄
+    odds = []
+    for ctl_nm, label in ODDS_INPUT_LABELS.items():
+        check_box_label_list.append(ctl_nm)
+
+        # 選択状態が存在しない場合は空欄
+        value = None
+        if param_selected is not None:
+            values = get_param_list_by_name(ctl_nm, param_selected)
+            value = values[0] if len(values) > 0 else None
+
+        odds.append(put_input(ctl_nm, type=FLOAT,
+                    label=label, value=value))
+
+    # 抽出式入力欄(例: sum(pop) between 10 and 16 and count(pop<=3) >= 3)と入力エラーの表示欄
+    check_box_label_list.append(EXPRESSION_INPUT_NM)
+    expressions = get_param_list_by_name(
+        EXPRESSION_INPUT_NM, param_selected) if param_selected is not None else []
+    expression = [put_input(EXPRESSION_INPUT_NM, label='pop, waku, num, odds / sum, count, all, any, min, max',
+                            value=expressions[0] if len(expressions) > 0 else None),
+                  put_scope(EXPRESSION_STATUS_SCOPE_NM)]
+
     # 表示用に値を行ごとに並べ替える
     value_list = []
     for idx, nikiwa_el in zip(range(len(ninkiwa)), ninkiwa):
         row_list = []
         row_list.append(nikiwa_el)
 
+        # 人気和ごとの組合せ点数は選択変更時に更新するため、スコープを出力しておく
+        row_list.append(put_scope(f'{NINKIWA_CNT_SCOPE_NM}_{NINKIWA_RANGE[idx]}'))
+
         if len(ninki_tousu) <= idx:
             row_list.append('')
+            row_list.append('')
         else:
             row_list.append(ninki_tousu[idx])
+            row_list.append(put_scope(f'{NINKI_TOUSU_CNT_SCOPE_NM}_{idx}'))
 
         if len(waku) <= idx:
             row_list.append('')
@@ -361,6 +546,16 @@ def output_params_for_table_with_checkbox(param_selected: list = None):
         else:
             row_list.append(horse_num[idx])
 
+        if len(odds) <= idx:
+            row_list.append('')
+        else:
+            row_list.append(odds[idx])
+
+        if len(expression) <= idx:
+            row_list.append('')
+        else:
+            row_list.append(expression[idx])
+
         value_list.append(row_list)
 
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
@@ -433,6 +628,70 @@ def get_param_list_by_name(name: str, selected_params: list) -> list:
     return ret
 
 
+def get_selected_horse_nums(selected_params: list, leg_count: int = LEG_COUNT) -> list:
+    '''
+    選択された出走馬の馬番をレースごとに抽出する処理
+        Params
+            selected_params: list
+                入力値に変更のあったコントロールのlist
+            leg_count: int = LEG_COUNT
+                対象レース数
+        Returns
+            レースごとの選択された馬番のlist
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    selected_horse_nums = [[] for _ in range(leg_count)]
+    for selected_param in selected_params:
+        # 選択済みコントロールのnameがlistとstrの場合がある
+        name = selected_param['name'][0] if isinstance(
+            selected_param['name'], list) else selected_param['name']
+
+        # 馬番選択チェックボックスのnameには「target」が含まれているはずなので、判定
+        if not 'target' in name:
+            continue
+
+        # 各レース詳細情報のvalueは[<レース番号>,<馬番>]になっている
+        race_no, horse_num = selected_param['value'][0]
+        selected_horse_nums[int(race_no) - 1].append(int(horse_num))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return selected_horse_nums
+
+
+def get_filter_params(selected_params: list) -> dict:
+    '''
+    画面で選択された組合せ抽出パラメーターを抽出条件ごとのdictにまとめる処理
+        Params
+            selected_params: list
+                入力値に変更のあったコントロールのlist
+        Returns
+            抽出条件の種類ごとに選択値のlistを格納したdict
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    filter_params = {
+        # 人気和の選択状況を抽出
+        'ninkiwa': get_param_list_by_name('ninkiwa', selected_params),
+        # 1番人気頭数チェック
+        'ninki_tousu': get_param_list_by_name('ninki_tousu', selected_params),
+        # 枠の条件を抽出
+        'waku': get_param_list_by_name('waku', selected_params),
+        # 馬番の条件を抽出
+        'horse_num': get_param_list_by_name('horse_num', selected_params),
+        # 合成オッズの下限、上限を抽出
+        'odds_min': get_param_list_by_name('odds_min', selected_params),
+        'odds_max': get_param_list_by_name('odds_max', selected_params),
+        # 抽出式を抽出
+        'expression': get_param_list_by_name(EXPRESSION_INPUT_NM, selected_params),
+    }
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return filter_params
+
+
 def calc_ticket_combination(selected_params: list):
     '''
     選択した条件および出走馬から購入組合せを計算する処理
@@ -448,145 +707,54 @@ def calc_ticket_combination(selected_params: list):
         log_manager.info('何も選択されていないため、処理を終了します。')
         return
 
-    global combination_list
-
-    # 組み合わせ計算のため、対象レース詳細をDBから取得
-    # すでにWIN5対象レース一覧データが存在している場合は、スクレイピング不要
-    df_win5_race_detail = execute_select_sql_with_param(
-        DB_PATH, GET_WIN5_RACE_DETAIL_BY_DATE_ONLY_SQL, {'race_date': datetime.datetime.now().strftime('%Y-%m-%d')})
+    global combination_tickets
+    global combination_funnel
 
     # 選択された馬のみの組み合わせを作成する
+    selected_horse_nums = get_selected_horse_nums(selected_params)
 
-    # 選択された各レースの馬番を抽出し、list化
-    race_detail_selected_params = []
-    for selected_param in selected_params:
-        # 馬番選択チェックボックスのnameには「target」が含まれているはずなので、判定
-        if not 'target' in selected_param['name'][0]:
-            continue
-
-        race_detail_selected_params.append(selected_param['value'][0])
-
-    if race_detail_selected_params is None or len(race_detail_selected_params) == 0:
+    if race_card is None or all(len(horse_nums) == 0 for horse_nums in selected_horse_nums):
         toast('馬番の選択は必須です。', position='center',
               color='info', duration=3)
         log_manager.info('馬番が選択されていないため、処理を終了します。')
         return
 
-    # 各レース詳細DFから選択された馬番の情報のみ抽出
-    target_race_details = []
-    for selected_val in race_detail_selected_params:
-        target_race_details.append(
-            df_win5_race_detail.loc[(df_win5_race_detail.loc[:, 'レース番号'] == selected_val[0]) & (df_win5_race_detail.loc[:, '馬番'] == selected_val[1])])
-
-    if len(target_race_details) > 0:
-        df_target_race_details = pd.concat(target_race_details)
-
-        df_target_race_details.reset_index(drop=True, inplace=True)
-
-    # 人気和の選択状況を抽出
-    ninkiwa_selected_params = get_param_list_by_name(
-        'ninkiwa', selected_params)
-
-    # 1番人気頭数チェック
-    ninki_tousu_selected_params = get_param_list_by_name(
-        'ninki_tousu', selected_params)
-
-    # 枠の条件を抽出
-    waku_selected_params = get_param_list_by_name('waku', selected_params)
-
-    # 枠の条件を抽出
-    odd_even_selected_params = get_param_list_by_name(
-        'horse_num', selected_params)
-
-    # 各組合せの直積を算出し、リスト化
-    product_list = []
-
-    # 必ず5レース分存在しているので、5重ループする
-    for _, first_race in df_target_race_details.loc[df_target_race_details['レース番号'] == 1].iterrows():
-        for _, second_race in df_target_race_details.loc[df_target_race_details['レース番号'] == 2].iterrows():
-            for _, third_race in df_target_race_details.loc[df_target_race_details['レース番号'] == 3].iterrows():
-                for _, fourth_race in df_target_race_details.loc[df_target_race_details['レース番号'] == 4].iterrows():
-                    for _, fifth_race in df_target_race_details.loc[df_target_race_details['レース番号'] == 5].iterrows():
-
-                        tmp_ninki_list = [first_race.loc['人気'], second_race.loc['人気'],
-                                          third_race.loc['人気'], fourth_race.loc['人気'], fifth_race.loc['人気']]
-
-                        # 人気がまだ決定していない馬が含まれている場合は組み合わせに含めない
-                        if -1 in tmp_ninki_list:
-                            continue
-
-                        # 組み合わせ内の人気の合計が選択された人気和になるものだけを抽出
-                        if len(ninkiwa_selected_params) > 0:
-                            tmp_ninkiwa = (sum(tmp_ninki_list))
-
-                            if not tmp_ninkiwa in ninkiwa_selected_params:
-                                continue
-
-                        # 一番人気が指定の数になっているものだけを抽出
-                        if len(ninki_tousu_selected_params) > 0:
-                            ninki_1st_cnt = tmp_ninki_list.count(1)
-                            if not ninki_1st_cnt in ninki_tousu_selected_params:
-                                continue
-
-                        # 内枠のみまたは外枠のみを除く
-                        if len(waku_selected_params) > 0:
-                            tmp_waku_list = [first_race.loc['枠番'], second_race.loc['枠番'],
-                                             third_race.loc['枠番'], fourth_race.loc['枠番'], fifth_race.loc['枠番']]
-                            tmp_waku_list = np.array(tmp_waku_list)
-
-                            # 枠番がまだ決定していない馬が含まれている場合は組み合わせに含めない
-                            if -1 in tmp_waku_list:
-                                continue
-
-                            for waku_selected_param in waku_selected_params:
-                                is_continue = False
-                                # 外枠のみを除く
-                                if waku_selected_param == 0:
-                                    if all(tmp_waku_list >= 7):
-                                        is_continue = True
-                                        break
-                                elif waku_selected_param == 1:
-                                    # 内枠のみを除く
-                                    if all(tmp_waku_list <= 2):
-                                        is_continue = True
-                                        break
-
-                            if is_continue:
-                                continue
-
-                        # 馬番は組み合わせの生成に使用するので、抽出条件の判定前に作成すること
-                        tmp_horse_num_list = [first_race.loc['馬番'], second_race.loc['馬番'],
-                                              third_race.loc['馬番'], fourth_race.loc['馬番'], fifth_race.loc['馬番']]
-
-                        # 馬番が奇数のみまたは偶数のみを除く
-                        if len(odd_even_selected_params) > 0:
-
-                            # 馬番がまだ決定していない馬が含まれている場合は組み合わせに含めない
-                            if -1 in tmp_horse_num_list:
-                                continue
-
-                            for odd_even_selected_param in odd_even_selected_params:
-                                even_or_odd = is_even_number_all(
-                                    tmp_horse_num_list)
-                                is_continue = False
-                                # 奇数のみを除く
-                                if odd_even_selected_param == 0:
-                                    if even_or_odd == 0:
-                                        is_continue = True
-                                        break
-                                elif odd_even_selected_param == 1:
-                                    # 偶数のみを除く
-                                    if even_or_odd == 1:
-                                        is_continue = True
-                                        break
-
-                            if is_continue:
-                                continue
-
-                        product_list.append(tmp_horse_num_list)
-
-    # メンバ変数に算出した組み合わせをセット
-    combination_list = product_list
+    # 出馬表から各レースの人気、枠番、馬番を配列で取得し、直積と抽出条件をまとめてマスク演算する
+    legs = race_card.get_legs(selected_horse_nums)
+    filter_params = get_filter_params(selected_params)
+
+    # 同じ選択内容で計算済みの場合はキャッシュの組合せをそのまま使用する
+    cache_key = get_selection_fingerprint(
+        race_card.race_date, selected_horse_nums, filter_params, race_card.odds_version)
+    tickets = combination_cache.get(cache_key)
+    funnel = None
+
+    # 再起動前に計算済みの場合は保存した組合せをメモリマップで読み込む
+    if tickets is None:
+        tickets = ticket_store.load(cache_key)
+        if tickets is not None:
+            combination_cache.put(cache_key, tickets)
+
+    if tickets is None:
+        # 全列挙、枝刈り、半分全列挙のうち見積もり処理時間が最小の方法で算出
+        # 0点や点数過多の原因がわかるよう、抽出条件ごとの除外数も集計する
+        funnel = FilterFunnel()
+        tickets = win5_combinator.calc_tickets(
+            legs, filter_params, funnel=funnel)
+        combination_cache.put(cache_key, tickets)
+        if not ticket_store.save(cache_key, race_card.race_date,
+                                 filter_params, race_card.odds_version, tickets):
+            log_manager.info('組合せを保存できなかったため、再起動後は再計算します。')
+
+        log_manager.info(f'組合せ候補: {funnel.candidate_cnt}')
+        for name, stage in funnel.stages.items():
+            log_manager.info(
+                f'  {name}: -{stage["removed_cnt"]} ({stage["elapsed"] * 1000:.1f} ms)')
+        log_manager.info(f'組合せ点数: {funnel.final_cnt}')
+
+    # メンバ変数にセット
+    combination_tickets = tickets
+    combination_funnel = funnel
 
     # 組み合わせ点数を画面に表示
     set_calc_buy_buttons_area()
@@ -594,131 +762,428 @@ def calc_ticket_combination(selected_params: list):
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
 
-def buy_tickets(buy_target_list: list):
+def get_ticket_price() -> int:
+    '''
+    1組合せあたりの購入金額(円)を取得する処理
+        Returns
+            1組合せあたりの購入金額(円)
+    '''
+    # 購入金額の設定は100円単位
+    return int(BUY_AMOUNT_PER_1TICKET) * 100
+
+
+def buy_tickets(buy_target_tickets: np.ndarray):
     '''
     JRAの即PATから指定した組合せのWIN5馬券を購入する処理
         Params
-            buy_target_list: list
-                購入対象の組合せlist
+            buy_target_tickets: np.ndarray
+                購入対象の組合せを詰めたuint32配列
     '''
     try:
         log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
         # 購入対象が存在しない場合は処理不要
-        if buy_target_list is None or len(buy_target_list) == 0:
+        if buy_target_tickets is None or len(buy_target_tickets) == 0:
             toast('組合せが存在しません。', position='center',
                   color='info', duration=3)
             return
 
-        # 即patログイン
-        with sync_playwright() as playwright:
-            page = get_playwright_page(playwright, SOKU_PAT_LOGIN_URL, False)
+        # 合計金額が上限を超えると購入時にエラーとなるため、購入しない
+        if len(buy_target_tickets) * get_ticket_price() > MAX_PURCHASE_AMOUNT:
+            toast(f'合計金額が{MAX_PURCHASE_AMOUNT:,}円を超えています。予算内に絞ってください。', position='center',
+                  color='warn', duration=3)
+            log_manager.info('合計金額が上限を超えているため、購入しません。')
+            return
 
-            # INET iID 入力
+        # フォーメーションで入力した場合に削減できる操作数を記録する
+        report = win5_combinator.get_compression_report(
+            len(buy_target_tickets), win5_combinator.compress(buy_target_tickets))
+        log_manager.info(
+            f'組合せ{report["ticket_cnt"]}点 フォーメーション{report["box_cnt"]}件 圧縮率: {report["compression_ratio"]:.1f} 削減可能な入力操作数: {report["saved_operations"]}')
 
-            # nameはHTMLのname属性ではないことに注意！（まぎらわしい！）
-            # ここでいうnameは画面上に表示されている名前(文字列)のことで、例えばボタンに表示されている名称など
-            # page.get_by_role("textbox", exact=False,
-            #                  name='inetid').fill(SOKU_PAT_INET_ID)
+        # 即patログインから購入まで(起動済みのブラウザで操作する)
+        is_complete = browser_session.run(
+            purchase_on_soku_pat, buy_target_tickets)
+        browser_session.log_timings()
 
-            # ログイン画面はテキストボックス一つしかないのでこれで通る
-            page.get_by_role('textbox').fill(SOKU_PAT_INET_ID)
+        if is_complete:
+            toast('購入完了', position='center',
+                  color='success', duration=3)
+        else:
+            toast('即PATを開けなかったため、購入できませんでした。', position='center',
+                  color='error', duration=3)
 
-            # ログインボタンをクリック
-            page.get_by_title('ログイン').click()
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    except Exception as e:
+        log_manager.logging_error_traceback()
 
-            page.wait_for_load_state('networkidle')
 
-            # 加入者番号入力
-            page.get_by_role('row').filter(
-                has_text='加入者番号').get_by_role('textbox').fill(SOKU_PAT_KANYU_NUM)
+def purchase_on_soku_pat(session: BrowserSession, buy_target_tickets: np.ndarray) -> bool:
+    '''
+    即PATにログインし、指定した組合せのWIN5馬券を入力して購入する処理(BrowserSession.runで実行する)
+    画面遷移後は次に操作する要素が表示されるまで待つ
+        Params
+            session: BrowserSession
+                ブラウザのセッション
+            buy_target_tickets: np.ndarray
+                購入対象の組合せを詰めたuint32配列
+        Returns
+            購入を受け付けた場合はTrue
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
-            # 暗証番号入力
-            page.get_by_role('row').filter(
-                has_text='暗証番号').get_by_role('textbox').fill(SOKU_PAT_PASSWORD)
+    page = get_playwright_page(session, SOKU_PAT_LOGIN_URL, False)
+
+    # ログイン画面を開けなかった場合は購入しない(原因はget_playwright_pageでログに出力済み)
+    if page is None:
+        log_manager.info('即PATのログイン画面を開けなかったため、購入しません。')
+        return False
 
-            # P-ARS番号入力
+    try:
+        # INET iID 入力
+
+        # nameはHTMLのname属性ではないことに注意！（まぎらわしい！）
+        # ここでいうnameは画面上に表示されている名前(文字列)のことで、例えばボタンに表示されている名称など
+        # page.get_by_role("textbox", exact=False,
+        #                  name='inetid').fill(SOKU_PAT_INET_ID)
+
+        # ログイン画面はテキストボックス一つしかないのでこれで通る
+        page.get_by_role('textbox').fill(SOKU_PAT_INET_ID)
+
+        # ログインボタンをクリック
+        with session.step('ログイン'):
+            page.get_by_title('ログイン').click()
             page.get_by_role('row').filter(
-                has_text='P-ARS番号').get_by_role('textbox').fill(SOKU_PAT_P_ARS_NUM)
+                has_text='加入者番号').get_by_role('textbox').wait_for()
 
-            # ネット投票メニューへクリック
-            page.get_by_title('ネット投票メニューへ').click()
+        # 加入者番号入力
+        page.get_by_role('row').filter(
+            has_text='加入者番号').get_by_role('textbox').fill(SOKU_PAT_KANYU_NUM)
+
+        # 暗証番号入力
+        page.get_by_role('row').filter(
+            has_text='暗証番号').get_by_role('textbox').fill(SOKU_PAT_PASSWORD)
 
-            page.wait_for_load_state('networkidle')
+        # P-ARS番号入力
+        page.get_by_role('row').filter(
+            has_text='P-ARS番号').get_by_role('textbox').fill(SOKU_PAT_P_ARS_NUM)
 
-            # WIN5を選択
-            page.get_by_title('指定された5レースの1着を予想する投票方式です。').click()
-            page.wait_for_load_state('networkidle')
+        # ネット投票メニューへクリック
+        with session.step('ネット投票メニュー'):
+            page.get_by_title('ネット投票メニューへ').click()
+            page.get_by_title(WIN5_MENU_TITLE).wait_for()
+
+        # WIN5を選択
+        with session.step('WIN5'):
+            page.get_by_title(WIN5_MENU_TITLE).click()
+            page.get_by_role('link').filter(
+                has=page.get_by_text('完全セレクト')).wait_for()
 
-            # このまま進むを選択
-            # 残高が足りていない場合のみ、以下のコントロールが表示される
-            # page.get_by_role('button').filter(has_text='このまま進む').click()
-            # page.wait_for_load_state('networkidle')
+        # このまま進むを選択
+        # 残高が足りていない場合のみ、以下のコントロールが表示される
+        # page.get_by_role('button').filter(has_text='このまま進む').click()
 
-            # 完全セレクトを選択
+        # 完全セレクトを選択
+        with session.step('完全セレクト'):
             page.get_by_role('link').filter(
                 has=page.get_by_text('完全セレクト')).click()
-            page.wait_for_load_state('networkidle')
+            page.locator(RACE_BUTTONS_SELECTOR).first.wait_for()
 
-            # 組み合わせに応じて各レースの馬番を選択
-            for horse_nums in buy_target_list:
-                for idx, num in zip(range(len(horse_nums)),  horse_nums):
-                    # 各レースのロケーターを取得
-                    race_locator = page.locator(
-                        'div.race-buttons').nth(idx)
+        # 組み合わせに応じて各レースの馬番を選択
+        for chunk in win5_combinator.iter_unpacked(buy_target_tickets):
+            for horse_nums in chunk:
+                with session.step('組合せ入力'):
+                    for idx, num in zip(range(len(horse_nums)),  horse_nums):
+                        # 各レースのロケーターを取得
+                        race_locator = page.locator(
+                            RACE_BUTTONS_SELECTOR).nth(idx)
 
-                    # 各レースの馬番選択ボタンの順序とhorse_numの馬番は対応しているので、これでチェックボックスを取得し、チェック
-                    race_locator.get_by_text(
-                        str(num), exact=True).check()
+                        # 各レースの馬番選択ボタンの順序とhorse_numの馬番は対応しているので、これでチェックボックスを取得し、チェック
+                        race_locator.get_by_text(
+                            str(num), exact=True).check()
 
-                # 金額入力
-                page.fill(
-                    '#win5-all-amount', BUY_AMOUNT_PER_1TICKET)
+                    # 金額入力
+                    page.fill(
+                        '#win5-all-amount', BUY_AMOUNT_PER_1TICKET)
 
                 # セットボタンをクリック
-                page.get_by_role('button').filter(has_text='セット').click()
-                page.wait_for_load_state('networkidle')
-
-            # 入力終了
+                # セットされると選択がクリアされるため、チェック済みの馬番がなくなるまで待つ
+                with session.step('セット'):
+                    page.get_by_role('button').filter(has_text='セット').click()
+                    page.locator(CHECKED_HORSE_NUM_SELECTOR).first.wait_for(
+                        state='detached')
+
+        # 入力終了
+        with session.step('入力終了'):
             page.get_by_role('button').filter(has_text='入力終了').click()
+            page.get_by_role('row').filter(
+                has_text='合計金額入力').get_by_role('textbox').wait_for()
 
-            page.wait_for_load_state('networkidle')
+        # ★★★★★★★★★注意！！★★★★★★★★★
+        # ★★★★★★★★★ここから下のコメントアウトを外すと実際に購入する★★★★★★★★★
 
-            # ★★★★★★★★★注意！！★★★★★★★★★
-            # ★★★★★★★★★ここから下のコメントアウトを外すと実際に購入する★★★★★★★★★
+        # 合計金額入力
+        total_amount = len(buy_target_tickets) * get_ticket_price()
+        page.get_by_role('row').filter(
+            has_text='合計金額入力').get_by_role('textbox').fill(str(total_amount))
 
-            # 合計金額入力
-            total_amount = (len(buy_target_list) *
-                            (int(BUY_AMOUNT_PER_1TICKET)*100))
-            page.get_by_role('row').filter(
-                has_text='合計金額入力').get_by_role('textbox').fill(str(total_amount))
-
-            # 購入するボタンクリック
+        # 購入するボタンクリック
+        with session.step('購入する'):
             page.get_by_role('button').filter(has_text='購入する').click()
+            page.get_by_role('button').filter(has_text='OK').wait_for()
 
-            page.wait_for_load_state('networkidle')
-
-            # OKボタンクリック
+        # OKボタンクリック
+        # 購入完了まで待機
+        with session.step('購入完了'):
             page.get_by_role('button').filter(has_text='OK').click()
-            page.wait_for_load_state('networkidle')
+            page.get_by_text('お客様の投票を受け付けました。').first.wait_for()
 
-            # 購入完了まで待機
-            is_complete = False
-            while not is_complete:
-                tmp = page.get_by_text(
-                    'お客様の投票を受け付けました。').all_inner_texts()
+    finally:
+        if page is not None:
+            page.close()
 
-                if tmp is not None:
-                    is_complete = len(tmp) > 0
-                sleep(ACCESS_INTERVAL)
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
-            toast('購入完了', position='center',
-                  color='success', duration=3)
+    return True
 
-            log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
-    except Exception as e:
-        log_manager.logging_error_traceback()
+def set_ninkiwa_count_area(selected_params: list):
+    '''
+    パラメータータブの人気和、1人気頭数ごとの組合せ点数を更新する処理
+    組合せを列挙せず、人気の度数分布の畳み込みで点数を算出する
+        Params
+            selected_params: list
+                入力値に変更のあったコントロールのlist
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    selected_horse_nums = get_selected_horse_nums(selected_params)
+
+    if race_card is None or all(len(horse_nums) == 0 for horse_nums in selected_horse_nums):
+        counts = np.zeros((1, 1), dtype=np.int64)
+    else:
+        counts = count_combinations_by_ninkiwa(
+            race_card.get_legs(selected_horse_nums))
+
+    filter_params = get_filter_params(selected_params)
+
+    # 人気和の点数は選択済みの1人気頭数で、1人気頭数の点数は選択済みの人気和で絞り込んだ点数を表示する
+    ninkiwa_counts = counts
+    if len(filter_params['ninki_tousu']) > 0:
+        ninkiwa_counts = counts[:, [val for val in filter_params['ninki_tousu']
+                                    if val < counts.shape[1]]]
+    ninkiwa_counts = ninkiwa_counts.sum(axis=1)
+
+    ninki_tousu_counts = counts
+    if len(filter_params['ninkiwa']) > 0:
+        ninki_tousu_counts = counts[[val for val in filter_params['ninkiwa']
+                                     if val < counts.shape[0]], :]
+    ninki_tousu_counts = ninki_tousu_counts.sum(axis=0)
+
+    for rg in NINKIWA_RANGE:
+        with use_scope(f'{NINKIWA_CNT_SCOPE_NM}_{rg}', clear=True):
+            put_text(ninkiwa_counts[rg] if rg < len(ninkiwa_counts) else 0)
+
+    for rg in NINKI_TOUSU_RANGE:
+        with use_scope(f'{NINKI_TOUSU_CNT_SCOPE_NM}_{rg}', clear=True):
+            put_text(ninki_tousu_counts[rg]
+                     if rg < len(ninki_tousu_counts) else 0)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def init_incremental_engine():
+    '''
+    全出走馬の出馬表から差分再計算用のエンジンを作成する処理
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    global incremental_engine
+
+    if race_card is None:
+        incremental_engine = None
+    else:
+        incremental_engine = IncrementalCombinationEngine(race_card)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def update_incremental_combination(ctl_name: str, is_selected: bool):
+    '''
+    チェックボックスの変更に応じて影響する組合せのみ再計算し、組合せ点数を更新する処理
+        Params
+            ctl_name: str
+                変更のあったコントロールのname
+            is_selected: bool
+                選択されたかどうか
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    global combination_tickets
+    global combination_funnel
+
+    # 出馬表が存在しない場合は組合せなし
+    if incremental_engine is None:
+        combination_tickets = np.empty(0, dtype=np.uint32)
+    else:
+        if ctl_name.startswith('target_'):
+            # 馬番選択チェックボックスのnameは「target_<レース番号>_<馬番>」
+            _, race_no, horse_num = ctl_name.split('_')
+            if is_selected:
+                incremental_engine.add_horse(int(race_no) - 1, int(horse_num))
+            else:
+                incremental_engine.remove_horse(
+                    int(race_no) - 1, int(horse_num))
+        else:
+            # パラメーター変更時は保持している組合せにマスクを適用し直す
+            incremental_engine.set_filter_params(
+                get_filter_params(selected_values))
+
+        combination_tickets = incremental_engine.tickets
+
+    # 差分再計算では抽出条件ごとの除外数を集計しない
+    combination_funnel = None
+
+    # メンバ変数に算出した組み合わせをセットし、組み合わせ点数を画面に表示
+    set_calc_buy_buttons_area()
+
+    # 選択中の馬のうち、どの組合せにも含まれない馬をレース詳細タブに表示
+    set_dead_horse_flags(selected_values)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def set_dead_horse_flags(selected_params: list):
+    '''
+    選択中の馬と抽出条件から、どの購入組合せにも含まれない馬を判定し、レース詳細タブの状態を更新する処理
+        Params
+            selected_params: list
+                入力値に変更のあったコントロールのlist
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    selected_horse_nums = get_selected_horse_nums(selected_params)
+    dead_horse_nums = [[] for _ in selected_horse_nums]
+
+    # 全レースで馬が選択されている場合のみ判定する
+    if race_card is not None and all(len(horse_nums) > 0 for horse_nums in selected_horse_nums):
+        alive_list = calc_alive_horses(race_card.get_legs(
+            selected_horse_nums), get_filter_params(selected_params))
+        dead_horse_nums = [np.array(horse_nums)[~alive].tolist()
+                           for horse_nums, alive in zip(selected_horse_nums, alive_list)]
+
+    if race_card is not None:
+        # フラグが変わった馬のみ表示を更新する
+        for leg_idx, horse_num in race_card.set_dead_horses(dead_horse_nums):
+            with use_scope(f'{HORSE_STATUS_SCOPE_NM}_{leg_idx + 1}_{horse_num}', clear=True):
+                put_text(get_flag_label(
+                    race_card.get_horse(leg_idx, horse_num)['フラグ']))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def narrow_to_top_k_tickets():
+    '''
+    現在の購入組合せを、オッズから推定した的中確率の高い順に指定点数まで絞り込む処理
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    global combination_tickets
+    global combination_funnel
+
+    top_k_cnt = pin[TOP_K_INPUT_NM]
+
+    if race_card is None or top_k_cnt is None or top_k_cnt <= 0 or len(combination_tickets) == 0:
+        toast('組合せと点数の入力は必須です。', position='center',
+              color='info', duration=3)
+        log_manager.info('組合せまたは点数が存在しないため、絞り込みを行いません。')
+    else:
+        top_tickets, top_log_probs = select_top_k_tickets(
+            combination_tickets, race_card.lookups, top_k_cnt)
+
+        # 購入組合せは昇順で保持する
+        combination_tickets = np.sort(top_tickets)
+        combination_funnel = None
+
+        hit_prob = float(np.exp(top_log_probs).sum())
+        toast(f'推定的中確率: {hit_prob:.2%}', position='center',
+              color='success', duration=3)
+        log_manager.info(
+            f'的中確率上位{len(top_tickets)}点に絞り込み 推定的中確率: {hit_prob:.4%}')
+
+        set_calc_buy_buttons_area()
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def narrow_to_budget_tickets():
+    '''
+    現在の購入組合せを、予算内で推定的中確率の合計が最大となる組合せに絞り込む処理
+    予算は購入金額の上限を超えないように丸める
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    global combination_tickets
+    global combination_funnel
+
+    budget = pin[BUDGET_INPUT_NM]
+
+    if race_card is None or budget is None or budget <= 0 or len(combination_tickets) == 0:
+        toast('組合せと予算の入力は必須です。', position='center',
+              color='info', duration=3)
+        log_manager.info('組合せまたは予算が存在しないため、絞り込みを行いません。')
+    elif get_ticket_price() <= 0:
+        toast('1組合せあたりの購入金額の設定が正しくありません。', position='center',
+              color='warn', duration=3)
+        log_manager.info(
+            f'1組合せあたりの購入金額が{get_ticket_price()}円のため、絞り込みを行いません。')
+    else:
+        combination_tickets, hit_prob, cost = select_budget_tickets(
+            combination_tickets, race_card.lookups, min(budget, MAX_PURCHASE_AMOUNT), get_ticket_price())
+        combination_funnel = None
+
+        toast(f'推定的中確率: {hit_prob:.2%} 金額: {cost:,}円', position='center',
+              color='success', duration=3)
+        log_manager.info(
+            f'予算内の{len(combination_tickets)}点に絞り込み 推定的中確率: {hit_prob:.4%} 金額: {cost}円')
+
+        set_calc_buy_buttons_area()
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def validate_filter_expression(expression: str) -> bool:
+    '''
+    入力された抽出式を変換し、出馬表の配列に適用できるか検証する処理
+    エラーの場合は抽出式入力欄の下にエラー内容を表示する
+        Params
+            expression: str
+                抽出式
+        Returns
+            適用できる場合はTrue(空欄の場合はFalse)
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    message = ''
+    if not expression:
+        is_valid = False
+    else:
+        try:
+            # レース番号の範囲など、適用時にしか判定できないエラーもあるため空の組合せに適用してみる
+            mask_func = compile_filter_expression(expression)
+            mask_func(partial_lookup_values(
+                race_card.lookups, np.empty(0, dtype=np.uint32)))
+        except FilterExpressionError as e:
+            message = str(e)
+        is_valid = message == ''
+
+    with use_scope(EXPRESSION_STATUS_SCOPE_NM, clear=True):
+        put_text(message)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return is_valid
 
 
 def set_calc_buy_buttons_area():
@@ -729,14 +1194,29 @@ def set_calc_buy_buttons_area():
 
     with use_scope(COMBINATION_SCOPE_NM, clear=True):
         put_row([put_input(name='combination_cnt', label='組合せ点数',
-                           value=f'{len(combination_list)}', readonly=True), ], size='100px')
-
-        put_buttons(['組合せ計算', '購入'],
+                           value=f'{len(combination_tickets)}', readonly=True), None,
+                 put_input(name=TOP_K_INPUT_NM, type=NUMBER, label='的中確率上位の点数'), None,
+                 put_input(name=BUDGET_INPUT_NM, type=NUMBER, label='予算(円)'), ], size='100px 10px 150px 10px 150px')
+
+        # 組合せ計算ボタンで算出した場合は、抽出条件ごとの除外数と処理時間を表示
+        if combination_funnel is not None:
+            funnel_rows = [['候補', f'{combination_funnel.candidate_cnt:,}', '']]
+            for name, stage in combination_funnel.stages.items():
+                funnel_rows.append([FUNNEL_STAGE_LABELS.get(name, name), f'-{stage["removed_cnt"]:,}',
+                                    f'{stage["elapsed"] * 1000:.1f}'])
+            funnel_rows.append(
+                ['組合せ点数', f'{combination_funnel.final_cnt:,}', ''])
+            put_table(funnel_rows, header=[
+                      '抽出条件', '点数', '処理時間(ms)']).style('width:fit-content;')
+
+        put_buttons(['組合せ計算', '購入', '的中確率上位に絞る', '予算内に絞る'],
                     onclick=[
                         partial(calc_ticket_combination,
                                 selected_params=selected_values),
                         partial(buy_tickets,
-                                buy_target_list=combination_list)
+                                buy_target_tickets=combination_tickets),
+                        narrow_to_top_k_tickets,
+                        narrow_to_budget_tickets,
         ]
         )
 
@@ -760,12 +1240,11 @@ def get_win5_races_proc() -> pd.DataFrame:
 
     if is_empty_DataFrame(df_win5_races):
         # WIN5対象レース一覧を取得
-        with sync_playwright() as playwright:
-            soup = get_win5_races_page(
-                playwright, JRA_TOP_URL)
+        soup = browser_session.run(get_win5_races_page, JRA_TOP_URL)
+        browser_session.log_timings()
 
-            if soup is None:
-                return pd.DataFrame()
+        if soup is None:
+            return pd.DataFrame()
 
         df_win5_races = get_win5_races(soup)
 
@@ -800,8 +1279,6 @@ def get_win5_race_detail_ctls(df_win5_races: pd.DataFrame, sort_select_val: int,
     '''
     log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
-    global is_need_init
-
     # 選択状況を取得するために必要なチェックボックスのlabelを格納するlist
     chk_label_list = []
 
@@ -809,19 +1286,20 @@ def get_win5_race_detail_ctls(df_win5_races: pd.DataFrame, sort_select_val: int,
     # 詳細はタブで区切ってチェックボックス付きテーブルへ
     race_round_list = []
     race_name_list = []
-    course_info_list = []
-    handicap_info_list = []
     tabs_list = []
-    df_race_detail = pd.DataFrame()
+
+    # 行ごとに選択リストを走査しないよう、選択済みの馬番はsetにしておく
+    selected_horse_keys = get_selected_horse_keys(param_selected)
+
     for idx, row in df_win5_races.iterrows():
 
         # race_round_list.append(put_text(row.loc['対象レース']))
         race_round_list.append(row.loc['対象レース'])
         race_name_list.append(row.loc['レース名'])
 
-        # レースデータから各レースの詳細情報を取得し、チェックボックス付table出力
-        content, tmp_label_list, df_tmp = output_race_detail_for_table_with_checkbox(
-            row, sort_select_val, param_selected)
+        # 出馬表から各レースの詳細情報を取得し、チェックボックス付table出力
+        content, tmp_label_list = output_race_detail_for_table_with_checkbox(
+            idx, sort_select_val, selected_horse_keys)
 
         # 各レースの詳細をタブでひとまとめにするため、レース詳細情報にタイトルをつけて格納
         tabs_list.append({'title': f'{(idx+1)}レース',
@@ -830,25 +1308,12 @@ def get_win5_race_detail_ctls(df_win5_races: pd.DataFrame, sort_select_val: int,
         # チェック状態を取得するために必要なlabelを格納
         chk_label_list.extend(tmp_label_list)
 
-        # 各レースのコース情報をlistに格納
-        course_info_list.append(df_tmp.loc[0, 'コース'])
-
-        # 各レースのハンデ情報をlistに格納
-        handicap_info_list.append(df_tmp.loc[0, 'ハンデ'])
-
-        if len(df_race_detail) == 0:
-            df_race_detail = df_tmp
-        else:
-            df_race_detail = pd.concat([df_race_detail, df_tmp])
-
-        sleep(ACCESS_INTERVAL)
-
-    is_need_init = False
-
-    # DBに対象レース詳細を保存
-    with sqlite3.connect(DB_PATH) as conn:
-        df_race_detail.to_sql(WIN5_TARGET_RACE_DETAIL_TABLE_NAME, conn,
-                              if_exists='replace', index=None)
+    # 各レースのコース情報、ハンデ情報は出馬表に保持済み
+    # 全レースの出馬表が取得できなかった場合は空欄にする
+    course_info_list = race_card.course_list if race_card is not None else [
+        '' for _ in range(len(df_win5_races))]
+    handicap_info_list = race_card.handicap_list if race_card is not None else [
+        '' for _ in range(len(df_win5_races))]
 
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
@@ -913,6 +1378,9 @@ def set_sorted_tab_area_ctls(df_win5_races: pd.DataFrame, sort_selected_val: int
 
     put_tabs(tabs_list, scope=TAB_SCOPE_NM).style('width:fit-content;')
 
+    # 再出力したパラメータータブに組合せ点数を表示
+    set_ninkiwa_count_area(selected_values)
+
     log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
 
@@ -920,6 +1388,9 @@ def main():
 
     log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
+    # 初回のスクレイピング、購入で起動を待たないよう、スクレイピング用(ヘッドレス)と購入用のブラウザを裏で起動しておく
+    browser_session.start([True, False])
+
     # ローディング画面表示
     with put_loading(LOADING_STYLE, LOADING_COLOR).style(LOADING_CSS):
 
@@ -933,6 +1404,16 @@ def main():
             log_manager.info('対象レース一覧が存在しないため、処理を終了します。')
             exit()
 
+        # WIN5の各レース詳細を取得し、出馬表と差分再計算用のエンジンを作成
+        load_race_card(df_win5_races)
+
+        if race_card is None:
+
+            toast('レース詳細が存在しないため、処理を終了します。', position='center',
+                  color='info', duration=3)
+            log_manager.info('レース詳細が存在しないため、処理を終了します。')
+            exit()
+
         # WIN5の各レース詳細からタブ出力するチェックボックス付きテーブルを作成
         # デフォルトの並び淳は人気昇順
         chk_label_list, tabs_list, race_round_list, race_name_list, course_info_list, handicap_info_list = get_tab_area_ctls(
@@ -974,12 +1455,31 @@ def main():
             # 各レース詳細とパラメーターをタブに出力
             put_tabs(tabs_list).style('width:fit-content;')
 
+        # 人気和、1人気頭数ごとの組合せ点数を表示
+        set_ninkiwa_count_area(selected_values)
+
     # pinオブジェクトの変更のあったものを取得(メインループ処理)
     while True:
         new_selection = pin_wait_change(chk_label_list)
 
+        # 入力欄は値が数値、文字列のみなので、チェックボックスと同じ形にして前回の入力値と置き換える
+        if new_selection['name'] in ODDS_INPUT_LABELS or new_selection['name'] == EXPRESSION_INPUT_NM:
+            for selected_val in [val for val in selected_values if val['name'] == new_selection['name']]:
+                selected_values.remove(selected_val)
+
+            # 抽出式は入力途中も変更が通知されるため、空欄または適用できない場合は抽出条件に含めない
+            if new_selection['name'] == EXPRESSION_INPUT_NM and not validate_filter_expression(new_selection['value']):
+                new_selection['value'] = None
+
+            if new_selection['value'] is not None:
+                selected_values.append(
+                    {'name': new_selection['name'], 'value': [new_selection['value']]})
+
+            # 組合せ点数を更新
+            update_incremental_combination(new_selection['name'], True)
+
         # 選択解除された場合は、すでに格納済みのlabelと比較し、一致したものを削除
-        if new_selection['value'] is None or len(new_selection['value']) == 0:
+        elif new_selection['value'] is None or len(new_selection['value']) == 0:
             del_target_val = None
             for selected_val in selected_values:
                 if selected_val['name'] == new_selection['name']:
@@ -989,6 +1489,12 @@ def main():
             if not del_target_val is None:
                 selected_values.remove(del_target_val)
 
+            # 人気和、1人気頭数ごとの組合せ点数を更新
+            set_ninkiwa_count_area(selected_values)
+
+            # 組合せ点数を更新
+            update_incremental_combination(new_selection['name'], False)
+
         elif not new_selection in selected_values:
             # 並び順変更時は選択状態を保持する
             if new_selection['name'] == sort_select_name:
@@ -1001,6 +1507,12 @@ def main():
                 # 選択結果一覧に値が格納されていなければ追加
                 selected_values.append(new_selection)
 
+                # 人気和、1人気頭数ごとの組合せ点数を更新
+                set_ninkiwa_count_area(selected_values)
+
+                # 組合せ点数を更新
+                update_incremental_combination(new_selection['name'], True)
+
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,130 @@
+# 標準モジュール
+from collections import OrderedDict
+import hashlib
+import inspect
+import json
+import os
+
+# インストールモジュール
+import numpy as np
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+
+def get_selection_fingerprint(race_date: str, selected_horse_nums: list, filter_params: dict, odds_version: str) -> str:
+    '''
+    組合せ計算の入力から、キャッシュのキーとなるハッシュ値を算出する処理
+    馬番、抽出条件の選択順によらず同じ値になるよう、並べ替えてからハッシュ化する
+        Params
+            race_date: str
+                レース日付
+            selected_horse_nums: list
+                レースごとの選択された馬番のlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            odds_version: str
+                オッズのハッシュ値
+        Returns
+            16進数文字列のハッシュ値
+    '''
+    selection = {
+        'race_date': race_date,
+        'horse_nums': [sorted(int(num) for num in horse_nums) for horse_nums in selected_horse_nums],
+        'filter_params': {name: sorted(vals) for name, vals in sorted(filter_params.items())},
+        'odds_version': odds_version,
+    }
+
+    return hashlib.sha1(json.dumps(selection, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class CombinationCache():
+    '''
+    組合せ計算の結果(詰めた組合せの配列)を入力のハッシュ値ごとに保持するLRUキャッシュ
+    保持する配列の合計バイト数が上限を超えた場合は、最も長く参照されていないものから破棄する
+    '''
+
+    def __init__(self, max_bytes: int):
+        '''
+        コンストラクタ
+            Params
+                max_bytes: int
+                    保持する配列の合計バイト数の上限
+        '''
+        self.max_bytes = max_bytes
+
+        # {ハッシュ値: 詰めた組合せの配列}(参照された順)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        # ヒット数、ミス数
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+
+    def get(self, key: str) -> np.ndarray:
+        '''
+        キャッシュから組合せを取得する処理
+            Params
+                key: str
+                    get_selection_fingerprintで算出したハッシュ値
+            Returns
+                詰めた組合せの配列(読み取り専用)
+                保持していない場合はNone
+        '''
+        tickets = self.entries.get(key)
+
+        if tickets is None:
+            self.miss_cnt += 1
+        else:
+            self.hit_cnt += 1
+            self.entries.move_to_end(key)
+
+        log_manager.info(
+            f'組合せキャッシュ{"ミス" if tickets is None else "ヒット"}: hit={self.hit_cnt}, miss={self.miss_cnt}, entries={len(self.entries)}, bytes={self.total_bytes}')
+
+        return tickets
+
+    def put(self, key: str, tickets: np.ndarray):
+        '''
+        キャッシュに組合せを格納する処理
+        キャッシュ内の配列が書き換えられないよう、読み取り専用にして保持する
+            Params
+                key: str
+                    get_selection_fingerprintで算出したハッシュ値
+                tickets: np.ndarray
+                    詰めた組合せの配列
+        '''
+        # 1件で上限を超える場合は保持しない
+        if tickets.nbytes > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key).nbytes
+
+        tickets.flags.writeable = False
+        self.entries[key] = tickets
+        self.total_bytes += tickets.nbytes
+
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        '''
+        キャッシュを全て破棄する処理
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        self.entries.clear()
+        self.total_bytes = 0
+
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
@@ -0,0 +1,1984 @@
+# 標準モジュール
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import inspect
+import os
+from time import perf_counter
+
+# インストールモジュール
+import numpy as np
+import pandas as pd
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+from win5_filter_expression import compile_filter_expression  # nopep8
+
+# 定数
+# WIN5の対象レース数
+LEG_COUNT = 5
+
+# 組合せ計算に使用するレース詳細の列名
+LEG_COLUMNS = ['馬番', '枠番', '人気']
+
+# 合成オッズの判定に使用する、オッズの対数の列名
+LOG_ODDS_COLUMN = '対数オッズ'
+
+# 合成オッズの上限、下限の判定に許容する誤差(対数)
+LOG_ODDS_TOLERANCE = 1e-9
+
+# オッズから推定した勝率(控除率を除くよう正規化)の対数の列名
+IMPLIED_LOG_PROB_COLUMN = '対数推定勝率'
+
+# 枠番、馬番、人気が決まっていない場合の値
+UNDECIDED_VAL = -1
+
+# 外枠とみなす枠番の下限
+OUTER_WAKU_MIN = 7
+
+# 内枠とみなす枠番の上限
+INNER_WAKU_MAX = 2
+
+# 組合せを逐次出力する際の1チャンクあたりの組合せ数
+DEFAULT_CHUNK_SIZE = 65536
+
+# 組合せを1つの整数に詰める際の1レースあたりのビット数(馬番は最大18なので5ビットに収まる)
+HORSE_NUM_BITS = 5
+
+# 1レース分の馬番を取り出すためのビットマスク
+HORSE_NUM_MASK = (1 << HORSE_NUM_BITS) - 1
+
+# 組合せの算出方法
+ENUMERATION_METHODS = {
+    'brute_force': 'brute_force',
+    'branch_and_bound': 'branch_and_bound',
+    'meet_in_the_middle': 'meet_in_the_middle',
+}
+
+# 算出方法を選択するためのコストモデルの係数(ナノ秒)
+# 18頭立て5レースのベンチマーク結果から概算した値
+# 全列挙: 固定費 + 直積の大きさ比例 + 条件を満たす組合せ数比例
+BRUTE_FORCE_COST = {'fixed': 400000, 'product': 30, 'survivor': 50}
+# 枝刈り: 固定費 + 条件を満たす組合せ数比例(途中の組合せの展開を含む)
+BRANCH_AND_BOUND_COST = {'fixed': 700000, 'survivor': 400}
+# 半分全列挙: 固定費 + 前半、後半の部分組合せ数比例 + 条件を満たす組合せ数比例
+MEET_IN_THE_MIDDLE_COST = {'fixed': 1000000, 'partial': 20, 'survivor': 100}
+# 保持している組合せへのマスクの再適用: 保持している組合せ数比例
+REMASK_COST = {'candidate': 100}
+
+# 抽出条件の選択率と処理時間を見積もるために抽出する組合せ数
+STAGE_SAMPLE_SIZE = 4096
+
+# 残った組合せの割合がこれ以下になった後の抽出条件は、残った組合せのみに詰め直して適用する
+COMPACT_SURVIVOR_RATE = 0.25
+
+# 購入画面で1回のセットごとに馬番のチェック以外に必要な入力操作数(金額入力、セットボタン)
+ENTRY_EXTRA_OPERATIONS = 2
+
+
+def get_leg_arrays(df_target_race_details: pd.DataFrame, leg_count: int = LEG_COUNT) -> list:
+    '''
+    選択された出走馬のレース詳細から、レースごとの馬番、枠番、人気の配列を取得する処理
+        Params
+            df_target_race_details: pd.DataFrame
+                選択された出走馬のレース詳細
+            leg_count: int = LEG_COUNT
+                対象レース数
+        Returns
+            レースごとに{列名: 配列}のdictを格納したlist
+    '''
+    legs = []
+    for race_no in range(1, leg_count+1):
+        df_leg = df_target_race_details.loc[df_target_race_details['レース番号'] == race_no]
+        leg = {col: df_leg[col].to_numpy(dtype=np.int16)
+               for col in LEG_COLUMNS}
+
+        # オッズが存在する場合は合成オッズの判定用に対数も保持する
+        if 'オッズ' in df_leg:
+            leg['オッズ'] = df_leg['オッズ'].to_numpy(dtype=np.float64)
+            leg[LOG_ODDS_COLUMN] = get_log_odds(leg['オッズ'])
+        legs.append(leg)
+
+    return legs
+
+
+def get_log_odds(odds: np.ndarray) -> np.ndarray:
+    '''
+    オッズの対数を算出する処理
+    オッズが未確定(UNDECIDED_VAL)の馬はnanとし、合成オッズの判定で必ず除外されるようにする
+        Params
+            odds: np.ndarray
+                単勝オッズの配列
+        Returns
+            オッズの対数の配列
+    '''
+    is_known = odds > 0
+    log_odds = np.full(len(odds), np.nan)
+    log_odds[is_known] = np.log(odds[is_known])
+
+    return log_odds
+
+
+def get_implied_log_probs(odds: np.ndarray) -> np.ndarray:
+    '''
+    1レースの全出走馬の単勝オッズから、各馬の推定勝率の対数を算出する処理
+    オッズの逆数の合計は控除率の分だけ1を超えるため、合計が1になるよう正規化する
+    オッズが未確定(UNDECIDED_VAL)の馬はnanとする
+        Params
+            odds: np.ndarray
+                1レースの全出走馬の単勝オッズの配列
+        Returns
+            推定勝率の対数の配列
+    '''
+    is_known = odds > 0
+    log_probs = np.full(len(odds), np.nan)
+    if is_known.any():
+        inverse_odds = 1 / odds[is_known]
+        log_probs[is_known] = np.log(inverse_odds / inverse_odds.sum())
+
+    return log_probs
+
+
+def get_broadcast_values(legs: list, col: str) -> list:
+    '''
+    各レースの配列を直積の次元に合わせてbroadcast可能な形に変形する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            col: str
+                取得する列名
+        Returns
+            レースごとに変形した配列のlist
+    '''
+    leg_count = len(legs)
+    values = []
+    for idx, leg in enumerate(legs):
+        shape = [1] * leg_count
+        shape[idx] = -1
+        values.append(leg[col].reshape(shape))
+
+    return values
+
+
+def get_filter_stages(filter_params: dict) -> list:
+    '''
+    選択された抽出条件から、組合せに適用するマスク関数のlistを取得する処理
+        Params
+            filter_params: dict
+                抽出条件の種類(チェックボックスのnameの接頭辞)ごとに選択値のlistを格納したdict
+        Returns
+            (抽出条件名, マスク関数)のlist
+            マスク関数は列名を受け取りレースごとの配列のlistを返す関数を引数にとる
+    '''
+    ninkiwa_params = filter_params.get('ninkiwa', [])
+    ninki_tousu_params = filter_params.get('ninki_tousu', [])
+    waku_params = filter_params.get('waku', [])
+    odd_even_params = filter_params.get('horse_num', [])
+    odds_min_params = filter_params.get('odds_min', [])
+    odds_max_params = filter_params.get('odds_max', [])
+    expression_params = filter_params.get('expression', [])
+
+    stages = []
+
+    # 人気、馬番がまだ決定していない馬が含まれている場合は組み合わせに含めない
+    def mask_undecided(get_values):
+        return reduce(np.logical_and, [(vals != UNDECIDED_VAL) for vals in get_values('人気') + get_values('馬番')])
+    stages.append(('undecided', mask_undecided))
+
+    # 組み合わせ内の人気の合計が選択された人気和になるものだけを抽出
+    if len(ninkiwa_params) > 0:
+        def mask_ninkiwa(get_values):
+            return np.isin(reduce(np.add, get_values('人気')), ninkiwa_params)
+        stages.append(('ninkiwa', mask_ninkiwa))
+
+    # 一番人気が指定の数になっているものだけを抽出
+    if len(ninki_tousu_params) > 0:
+        def mask_ninki_tousu(get_values):
+            ninki_1st_cnt = reduce(
+                np.add, [(vals == 1).astype(np.int8) for vals in get_values('人気')])
+            return np.isin(ninki_1st_cnt, ninki_tousu_params)
+        stages.append(('ninki_tousu', mask_ninki_tousu))
+
+    # 内枠のみまたは外枠のみを除く
+    if len(waku_params) > 0:
+        def mask_waku(get_values):
+            waku_values = get_values('枠番')
+
+            # 枠番がまだ決定していない馬が含まれている場合は組み合わせに含めない
+            mask = reduce(np.logical_and, [
+                          (vals != UNDECIDED_VAL) for vals in waku_values])
+
+            # 外枠のみを除く
+            if 0 in waku_params:
+                mask = mask & ~reduce(np.logical_and, [
+                                      (vals >= OUTER_WAKU_MIN) for vals in waku_values])
+
+            # 内枠のみを除く
+            if 1 in waku_params:
+                mask = mask & ~reduce(np.logical_and, [
+                                      (vals <= INNER_WAKU_MAX) for vals in waku_values])
+            return mask
+        stages.append(('waku', mask_waku))
+
+    # 馬番が奇数のみまたは偶数のみを除く
+    if len(odd_even_params) > 0:
+        def mask_odd_even(get_values):
+            odd_values = [(vals % 2 != 0) for vals in get_values('馬番')]
+            mask = None
+
+            # 奇数のみを除く
+            if 0 in odd_even_params:
+                mask = ~reduce(np.logical_and, odd_values)
+
+            # 偶数のみを除く
+            if 1 in odd_even_params:
+                tmp = reduce(np.logical_or, odd_values)
+                mask = tmp if mask is None else mask & tmp
+            return mask
+        stages.append(('horse_num', mask_odd_even))
+
+    # 合成オッズ(各レースの単勝オッズの積)が下限以上、上限以下のものだけを抽出
+    # 積は桁あふれするため、オッズの対数の和を下限、上限の対数と比較する
+    if len(odds_min_params) > 0 or len(odds_max_params) > 0:
+        def mask_odds(get_values):
+            log_odds_sum = reduce(np.add, get_values(LOG_ODDS_COLUMN))
+
+            # オッズが未確定の馬を含む組合せは対数の和がnanとなるため、明示的に除く
+            mask = ~np.isnan(log_odds_sum)
+            if len(odds_min_params) > 0:
+                mask &= log_odds_sum >= np.log(
+                    max(odds_min_params)) - LOG_ODDS_TOLERANCE
+            if len(odds_max_params) > 0:
+                mask &= log_odds_sum <= np.log(
+                    min(odds_max_params)) + LOG_ODDS_TOLERANCE
+            return mask
+        stages.append(('odds', mask_odds))
+
+    # 入力された抽出式を満たすものだけを抽出
+    for expression in expression_params:
+        stages.append(('expression', compile_filter_expression(expression)))
+
+    return stages
+
+
+class FilterFunnel():
+    '''
+    抽出条件ごとに除外した組合せ数と処理時間を集計するクラス
+    抽出条件の適用時に算出済みのマスクから数えるため、組合せの列挙は増えない
+    '''
+
+    def __init__(self):
+        '''
+        コンストラクタ
+        '''
+        # 抽出条件を適用する前の組合せ数
+        self.candidate_cnt = 0
+
+        # {抽出条件名: {'removed_cnt': 除外した組合せ数, 'elapsed': 処理時間(秒)}}(適用した順)
+        self.stages = {}
+
+    def add_candidates(self, candidate_cnt: int):
+        '''
+        抽出条件を適用する前の組合せ数を加算する処理
+            Params
+                candidate_cnt: int
+                    組合せ数
+        '''
+        self.candidate_cnt += candidate_cnt
+
+    def record(self, name: str, removed_cnt: int, elapsed: float):
+        '''
+        抽出条件で除外した組合せ数と処理時間を加算する処理
+            Params
+                name: str
+                    抽出条件名
+                removed_cnt: int
+                    除外した組合せ数
+                elapsed: float
+                    処理時間(秒)
+        '''
+        stage = self.stages.setdefault(name, {'removed_cnt': 0, 'elapsed': 0.0})
+        stage['removed_cnt'] += int(removed_cnt)
+        stage['elapsed'] += elapsed
+
+    def merge(self, other):
+        '''
+        別に集計した結果(並列実行したシャードなど)を加算する処理
+            Params
+                other: FilterFunnel
+                    加算する集計結果
+        '''
+        self.add_candidates(other.candidate_cnt)
+        for name, stage in other.stages.items():
+            self.record(name, stage['removed_cnt'], stage['elapsed'])
+
+    @property
+    def final_cnt(self) -> int:
+        '''
+        全ての抽出条件を適用した後に残った組合せ数
+        '''
+        return self.candidate_cnt - sum(stage['removed_cnt'] for stage in self.stages.values())
+
+
+def apply_filter_stages(stages: list, get_values, mask: np.ndarray, funnel: FilterFunnel = None) -> np.ndarray:
+    '''
+    マスク関数を順に適用する処理
+    funnelを指定した場合は、抽出条件ごとに除外した組合せ数と処理時間を集計する
+        Params
+            stages: list
+                get_filter_stagesで取得した(抽出条件名, マスク関数)のlist
+            get_values
+                列名を受け取りレースごとの配列のlistを返す関数
+            mask: np.ndarray
+                適用前のマスク(その場で更新する)
+            funnel: FilterFunnel = None
+                集計先
+        Returns
+            全てのマスク関数を適用したマスク
+    '''
+    if funnel is None:
+        for _, mask_func in stages:
+            mask &= mask_func(get_values)
+        return mask
+
+    remaining_cnt = np.count_nonzero(mask)
+    for name, mask_func in stages:
+        start = perf_counter()
+        mask &= mask_func(get_values)
+        elapsed = perf_counter() - start
+
+        survivor_cnt = np.count_nonzero(mask)
+        funnel.record(name, remaining_cnt - survivor_cnt, elapsed)
+        remaining_cnt = survivor_cnt
+
+    return mask
+
+
+def apply_filter_stages_compacted(stages: list, legs: list, indexes: list, funnel: FilterFunnel = None) -> list:
+    '''
+    マスク関数を順に適用し、抽出条件ごとに残った組合せのみに詰め直す処理
+    後の抽出条件は残った組合せの値のみ参照するため、除外の多い抽出条件を先に適用するほど処理量が減る
+        Params
+            stages: list
+                (抽出条件名, マスク関数)のlist
+            legs: list
+                レースごとの配列が入ったdictのlist
+            indexes: list
+                レースごとの、組合せ数分の馬のインデックス配列のlist
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            全ての抽出条件を満たした組合せのレースごとのインデックス配列のlist
+    '''
+    for name, mask_func in stages:
+        start = perf_counter()
+        mask = mask_func(partial_gathered_values(legs, indexes))
+        indexes = [idx[mask] for idx in indexes]
+        elapsed = perf_counter() - start
+
+        if funnel is not None:
+            funnel.record(name, len(mask) - len(indexes[0]), elapsed)
+
+    return indexes
+
+
+def order_filter_stages(stages: list, get_sample_values, sample_cnt: int) -> list:
+    '''
+    抽出条件を、標本に適用して計測した選択率と1組合せあたりの処理時間から効率のよい順に並べる処理
+    1組合せあたりの処理時間/除外率の昇順(安く多く除外するものから)に並べる
+    全ての組合せを満たす抽出条件は除外率が0のため最後になる
+        Params
+            stages: list
+                (抽出条件名, マスク関数)のlist
+            get_sample_values
+                列名を受け取り、標本の組合せのレースごとの配列のlistを返す関数
+            sample_cnt: int
+                標本の組合せ数
+        Returns
+            並べ替えた(抽出条件名, マスク関数)のlist
+    '''
+    if len(stages) <= 1 or sample_cnt == 0:
+        return stages
+
+    ranks = []
+    for _, mask_func in stages:
+        start = perf_counter()
+        mask = mask_func(get_sample_values)
+        elapsed = perf_counter() - start
+
+        removed_rate = 1 - np.count_nonzero(mask) / sample_cnt
+        ranks.append(elapsed / sample_cnt / max(removed_rate, 1 / sample_cnt))
+
+    order = sorted(range(len(stages)), key=lambda idx: ranks[idx])
+
+    return [stages[idx] for idx in order]
+
+
+def get_ordered_filter_stages(legs: list, filter_params: dict, excluded_names: tuple = ()) -> list:
+    '''
+    選択された抽出条件のマスク関数を、選択された出走馬の直積からの標本で計測した効率のよい順に取得する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            excluded_names: tuple = ()
+                枝刈り等で適用済みのため除く抽出条件名
+        Returns
+            並べ替えた(抽出条件名, マスク関数)のlist
+    '''
+    stages = [(name, mask_func) for name, mask_func in get_filter_stages(filter_params)
+              if not name in excluded_names]
+
+    sample_cnt = min(STAGE_SAMPLE_SIZE, calc_product_size(legs))
+    if sample_cnt == 0:
+        return stages
+
+    # 抽出条件の並びが毎回変わらないよう、乱数のシードは固定する
+    rng = np.random.default_rng(0)
+    indexes = [rng.integers(0, len(leg['馬番']), sample_cnt) for leg in legs]
+
+    return order_filter_stages(stages, partial_gathered_values(legs, indexes), sample_cnt)
+
+
+def calc_combination_indexes(legs: list, stages: list, funnel: FilterFunnel = None) -> list:
+    '''
+    各レースの直積に抽出条件を適用し、残った組合せのレースごとのインデックスを算出する処理
+    最初の抽出条件のみ直積全体にbroadcastで適用し、以降は残った組合せのみに適用する
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            stages: list
+                適用する順に並べた(抽出条件名, マスク関数)のlist
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            レースごとの、組合せ数分の馬のインデックス配列のlist(直積の順序)
+    '''
+    shape = tuple(len(leg['馬番']) for leg in legs)
+    mask = np.ones(shape, dtype=bool)
+
+    if funnel is not None:
+        funnel.add_candidates(mask.size)
+
+    # 残った組合せが少なくなるまではbroadcastのまま適用する
+    get_values = partial_broadcast_values(legs)
+    stage_idx = 0
+    while stage_idx < len(stages) and np.count_nonzero(mask) > mask.size * COMPACT_SURVIVOR_RATE:
+        mask = apply_filter_stages(
+            stages[stage_idx:stage_idx + 1], get_values, mask, funnel)
+        stage_idx += 1
+
+    return apply_filter_stages_compacted(stages[stage_idx:], legs, list(np.nonzero(mask)), funnel)
+
+
+def calc_combination_mask(legs: list, filter_params: dict, funnel: FilterFunnel = None) -> np.ndarray:
+    '''
+    各レースの直積をbroadcastで表現し、抽出条件を満たす組合せのマスクを算出する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            各レースの選択頭数を次元とする真偽値の配列
+    '''
+    shape = tuple(len(leg['馬番']) for leg in legs)
+    mask = np.ones(shape, dtype=bool)
+
+    if funnel is not None:
+        funnel.add_candidates(mask.size)
+
+    return apply_filter_stages(get_filter_stages(filter_params), partial_broadcast_values(legs), mask, funnel)
+
+
+def partial_broadcast_values(legs: list):
+    '''
+    列名からbroadcast済みの配列を取得する関数を生成する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+        Returns
+            列名を受け取り、レースごとのbroadcast済み配列のlistを返す関数
+    '''
+    return lambda col: get_broadcast_values(legs, col)
+
+
+def mask_to_tickets(legs: list, mask: np.ndarray) -> np.ndarray:
+    '''
+    組合せのマスクから馬番配列を作成する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            mask: np.ndarray
+                calc_combination_maskで算出したマスク
+        Returns
+            (組合せ数, レース数)の馬番配列
+    '''
+    # マスクが真になっている位置のインデックスからレースごとの馬番を取得
+    return indexes_to_tickets(legs, np.nonzero(mask))
+
+
+def indexes_to_tickets(legs: list, indexes: list) -> np.ndarray:
+    '''
+    レースごとの馬のインデックス配列から馬番配列を作成する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            indexes: list
+                レースごとの、組合せ数分の馬のインデックス配列のlist
+        Returns
+            (組合せ数, レース数)の馬番配列
+    '''
+    tickets = np.empty((len(indexes[0]), len(legs)), dtype=np.uint8)
+    for leg_idx, (leg, idx) in enumerate(zip(legs, indexes)):
+        tickets[:, leg_idx] = leg['馬番'][idx]
+
+    return tickets
+
+
+def iter_combination_boxes(legs: list, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    '''
+    直積を先頭のレースの馬で分割し、組合せ数がchunk_size以下の部分直積を順に返すジェネレーター
+    部分直積も直積なので、calc_combination_maskをそのまま適用できる
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                部分直積の組合せ数の上限
+        Yields
+            先頭から分割したレースを1頭に絞ったレースごとの配列が入ったdictのlist
+    '''
+    sizes = [len(leg['馬番']) for leg in legs]
+
+    # 後ろのレースの直積がchunk_sizeに収まるまで、分割するレース数を増やす
+    split_cnt = 0
+    while split_cnt < len(legs) and int(np.prod(sizes[split_cnt:])) > chunk_size:
+        split_cnt += 1
+
+    for prefix in np.ndindex(*sizes[:split_cnt]):
+        sub_legs = [{col: vals[idx:idx+1] for col, vals in leg.items()}
+                    for leg, idx in zip(legs, prefix)]
+        yield sub_legs + legs[split_cnt:]
+
+
+def iter_combination_chunks(legs: list, filter_params: dict, chunk_size: int = DEFAULT_CHUNK_SIZE, funnel: FilterFunnel = None, adaptive: bool = True):
+    '''
+    購入組合せの馬番配列をchunk_size件ずつ返すジェネレーター
+    全組合せを保持しないため、選択頭数によらずメモリ使用量はchunk_size程度に収まる
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1チャンクあたりの組合せ数
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+            adaptive: bool = True
+                抽出条件を効率のよい順に並べ替え、残った組合せのみに詰め直して適用するかどうか
+                Falseの場合はget_filter_stagesの順に部分直積全体へbroadcastで適用する
+        Yields
+            (chunk_size, レース数)のuint8馬番配列(最後のチャンクのみchunk_size未満)
+            並び順は1レース目を最外ループとした直積の順序
+    '''
+    buffer = []
+    buffer_cnt = 0
+
+    # 抽出条件の並びは部分直積ごとではなく、直積全体の標本で1度だけ決める
+    if adaptive:
+        stages = get_ordered_filter_stages(legs, filter_params)
+
+    for sub_legs in iter_combination_boxes(legs, chunk_size):
+        if adaptive:
+            tickets = indexes_to_tickets(
+                sub_legs, calc_combination_indexes(sub_legs, stages, funnel))
+        else:
+            tickets = mask_to_tickets(
+                sub_legs, calc_combination_mask(sub_legs, filter_params, funnel))
+        if len(tickets) == 0:
+            continue
+
+        buffer.append(tickets)
+        buffer_cnt += len(tickets)
+
+        # チャンクサイズに達した分を切り出して返す
+        if buffer_cnt >= chunk_size:
+            tickets = np.concatenate(buffer)
+            for start in range(0, len(tickets) - chunk_size + 1, chunk_size):
+                yield tickets[start:start + chunk_size]
+            rest = tickets[len(tickets) - len(tickets) % chunk_size:]
+            buffer = [rest] if len(rest) > 0 else []
+            buffer_cnt = len(rest)
+
+    if buffer_cnt > 0:
+        yield np.concatenate(buffer)
+
+
+def calc_combination_array(legs: list, filter_params: dict) -> np.ndarray:
+    '''
+    選択された出走馬と抽出条件から購入組合せの馬番配列を算出する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+        Returns
+            (組合せ数, レース数)の馬番配列
+            並び順は1レース目を最外ループとした直積の順序
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    mask = calc_combination_mask(legs, filter_params)
+    tickets = mask_to_tickets(legs, mask)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return tickets
+
+
+def pack_tickets(tickets: np.ndarray) -> np.ndarray:
+    '''
+    (組合せ数, レース数)の馬番配列を1組合せ1つのuint32に詰める処理
+    1レース目が上位ビットになるため、詰めた値の大小は馬番の辞書順と一致する
+        Params
+            tickets: np.ndarray
+                (組合せ数, レース数)の馬番配列
+        Returns
+            組合せ数分のuint32配列
+    '''
+    packed = np.zeros(len(tickets), dtype=np.uint32)
+    for leg_idx in range(tickets.shape[1]):
+        packed = (packed << HORSE_NUM_BITS) | tickets[:, leg_idx].astype(np.uint32)
+
+    return packed
+
+
+def unpack_tickets(packed: np.ndarray, leg_count: int = LEG_COUNT) -> np.ndarray:
+    '''
+    pack_ticketsで詰めた組合せを(組合せ数, レース数)の馬番配列に戻す処理
+        Params
+            packed: np.ndarray
+                組合せを詰めたuint32配列
+            leg_count: int = LEG_COUNT
+                対象レース数
+        Returns
+            (組合せ数, レース数)のuint8馬番配列
+    '''
+    tickets = np.empty((len(packed), leg_count), dtype=np.uint8)
+    for leg_idx in range(leg_count):
+        shift = HORSE_NUM_BITS * (leg_count - leg_idx - 1)
+        tickets[:, leg_idx] = (packed >> shift) & HORSE_NUM_MASK
+
+    return tickets
+
+
+def iter_unpacked_chunks(packed: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE, leg_count: int = LEG_COUNT):
+    '''
+    詰めた組合せをchunk_size件ずつ馬番配列に戻して返すジェネレーター
+        Params
+            packed: np.ndarray
+                組合せを詰めたuint32配列
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1チャンクあたりの組合せ数
+            leg_count: int = LEG_COUNT
+                対象レース数
+        Yields
+            (chunk_size, レース数)のuint8馬番配列
+    '''
+    for start in range(0, len(packed), chunk_size):
+        yield unpack_tickets(packed[start:start + chunk_size], leg_count)
+
+
+def sort_unique_tickets(packed: np.ndarray) -> np.ndarray:
+    '''
+    詰めた組合せを昇順に並べ、重複を除く処理
+    np.uniqueはコピーを作成するため、その場でソートし重複がある場合のみ除く
+        Params
+            packed: np.ndarray
+                組合せを詰めたuint32配列(その場で並べ替える)
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    is_sorted = packed[1:] > packed[:-1]
+    if is_sorted.all():
+        return packed
+
+    packed.sort()
+    is_duplicated = packed[1:] == packed[:-1]
+    if is_duplicated.any():
+        packed = packed[np.concatenate(([True], ~is_duplicated))]
+
+    return packed
+
+
+def calc_product_size(legs: list) -> int:
+    '''
+    各レースの選択頭数の直積の大きさを算出する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+        Returns
+            抽出条件を適用する前の組合せ数
+    '''
+    return int(np.prod([len(leg['馬番']) for leg in legs]))
+
+
+def calc_packed_tickets_shard(legs: list, filter_params: dict, chunk_size: int = DEFAULT_CHUNK_SIZE, funnel: FilterFunnel = None, adaptive: bool = True) -> np.ndarray:
+    '''
+    1シャード(先頭レースを絞った部分直積)の購入組合せを詰めて算出する処理
+    並列実行時にワーカープロセスで実行されるため、ログは出力しない
+        Params
+            legs: list
+                シャードのレースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1チャンクあたりの組合せ数
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+            adaptive: bool = True
+                抽出条件を効率のよい順に並べ替えて適用するかどうか
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    packed_list = [pack_tickets(chunk) for chunk in iter_combination_chunks(
+        legs, filter_params, chunk_size, funnel, adaptive)]
+    if len(packed_list) == 0:
+        return np.empty(0, dtype=np.uint32)
+
+    packed = np.concatenate(packed_list)
+    del packed_list
+
+    return sort_unique_tickets(packed)
+
+
+def calc_packed_tickets_shard_with_funnel(legs: list, filter_params: dict, chunk_size: int = DEFAULT_CHUNK_SIZE, adaptive: bool = True) -> tuple:
+    '''
+    1シャードの購入組合せと、抽出条件ごとの除外数を算出する処理
+    ワーカープロセスからは集計先を共有できないため、シャードごとに集計して返す
+        Params
+            legs: list
+                シャードのレースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1チャンクあたりの組合せ数
+            adaptive: bool = True
+                抽出条件を効率のよい順に並べ替えて適用するかどうか
+        Returns
+            packed: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+            funnel: FilterFunnel
+                シャードの抽出条件ごとの除外数
+    '''
+    funnel = FilterFunnel()
+    packed = calc_packed_tickets_shard(
+        legs, filter_params, chunk_size, funnel, adaptive)
+
+    return packed, funnel
+
+
+def get_shards(legs: list, worker_cnt: int) -> list:
+    '''
+    並列実行のため、直積を1レース目の馬(頭数がワーカー数に満たない場合は1、2レース目の馬の組)で分割する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            worker_cnt: int
+                ワーカープロセス数
+        Returns
+            シャードごとのレースの配列が入ったdictのlistを、詰めた組合せの昇順になるよう並べたlist
+    '''
+    split_cnt = 1 if len(legs[0]['馬番']) >= worker_cnt or len(legs) < 2 else 2
+
+    shards = []
+    for prefix in np.ndindex(*[len(leg['馬番']) for leg in legs[:split_cnt]]):
+        shard = [{col: vals[idx:idx+1] for col, vals in leg.items()}
+                 for leg, idx in zip(legs, prefix)] + legs[split_cnt:]
+        shards.append(shard)
+
+    # 先頭レースの馬番は詰めた値の上位ビットなので、馬番順に並べれば結果を連結するだけで昇順になる
+    shards.sort(key=lambda shard: [int(leg['馬番'][0])
+                for leg in shard[:split_cnt]])
+
+    return shards
+
+
+def calc_packed_tickets(legs: list, filter_params: dict, chunk_size: int = DEFAULT_CHUNK_SIZE, worker_cnt: int = 1, funnel: FilterFunnel = None, adaptive: bool = True) -> np.ndarray:
+    '''
+    購入組合せをチャンクごとに算出して詰め、昇順に並べたuint32配列を作成する処理
+    保持するのは1組合せあたり4バイトのみで、馬番配列は1チャンク分しか作成しない
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1チャンクあたりの組合せ数
+            worker_cnt: int = 1
+                ワーカープロセス数
+                2以上の場合は直積を分割し、ProcessPoolExecutorで並列に算出する
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+            adaptive: bool = True
+                抽出条件を効率のよい順に並べ替え、残った組合せのみに詰め直して適用するかどうか
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    if worker_cnt <= 1 or calc_product_size(legs) == 0:
+        packed = calc_packed_tickets_shard(
+            legs, filter_params, chunk_size, funnel, adaptive)
+    else:
+        shards = get_shards(legs, worker_cnt)
+        log_manager.info(
+            f'{len(shards)}シャードを{worker_cnt}プロセスで並列に算出します。')
+
+        with ProcessPoolExecutor(max_workers=worker_cnt) as executor:
+            if funnel is None:
+                packed_list = list(executor.map(calc_packed_tickets_shard, shards, [filter_params] * len(shards),
+                                                [chunk_size] * len(shards), [None] * len(shards), [adaptive] * len(shards)))
+            else:
+                packed_list = []
+                for packed, shard_funnel in executor.map(calc_packed_tickets_shard_with_funnel, shards, [filter_params] * len(shards),
+                                                         [chunk_size] * len(shards), [adaptive] * len(shards)):
+                    packed_list.append(packed)
+                    funnel.merge(shard_funnel)
+
+        packed = sort_unique_tickets(np.concatenate(packed_list))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return packed
+
+
+def union_tickets(packed_a: np.ndarray, packed_b: np.ndarray) -> np.ndarray:
+    '''
+    詰めた組合せ同士の和集合を算出する処理
+        Params
+            packed_a: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+            packed_b: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+        Returns
+            昇順かつ重複なしの和集合
+    '''
+    # 昇順の配列2つの連結なので、既にソート済みの区間を活かせる安定ソートで並べる
+    merged = np.concatenate((packed_a, packed_b))
+    merged.sort(kind='stable')
+
+    is_duplicated = merged[1:] == merged[:-1]
+    if is_duplicated.any():
+        merged = merged[np.concatenate(([True], ~is_duplicated))]
+
+    return merged
+
+
+def intersect_tickets(packed_a: np.ndarray, packed_b: np.ndarray) -> np.ndarray:
+    '''
+    詰めた組合せ同士の積集合を算出する処理
+        Params
+            packed_a: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+            packed_b: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+        Returns
+            昇順かつ重複なしの積集合
+    '''
+    return np.intersect1d(packed_a, packed_b, assume_unique=True)
+
+
+def diff_tickets(packed_a: np.ndarray, packed_b: np.ndarray) -> np.ndarray:
+    '''
+    詰めた組合せ同士の差集合(packed_aにありpacked_bにないもの)を算出する処理
+        Params
+            packed_a: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+            packed_b: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+        Returns
+            昇順かつ重複なしの差集合
+    '''
+    if len(packed_b) == 0:
+        return packed_a
+
+    # 昇順の配列なので二分探索で存在判定する
+    idx = np.searchsorted(packed_b, packed_a)
+    idx[idx == len(packed_b)] = 0
+
+    return packed_a[packed_b[idx] != packed_a]
+
+
+def calc_leg_popular_histogram(leg: dict) -> np.ndarray:
+    '''
+    1レース分の選択馬から(人気, 1番人気かどうか)の度数分布を作成する処理
+        Params
+            leg: dict
+                1レース分の配列が入ったdict
+        Returns
+            [人気, 1番人気の頭数(0 or 1)]を添字とする度数の配列
+    '''
+    popular = leg['人気']
+
+    # 人気、馬番がまだ決定していない馬は組み合わせに含めない
+    popular = popular[(popular != UNDECIDED_VAL) & (leg['馬番'] != UNDECIDED_VAL)]
+
+    histogram = np.zeros((popular.max() + 1 if len(popular) > 0 else 1, 2),
+                         dtype=np.int64)
+    np.add.at(histogram, (popular, (popular == 1).astype(np.int8)), 1)
+
+    return histogram
+
+
+def count_combinations_by_ninkiwa(legs: list) -> np.ndarray:
+    '''
+    各レースの人気の度数分布を多項式の積として掛け合わせ、人気和と1番人気頭数ごとの組合せ数を算出する処理
+    組合せを列挙しないため、選択頭数によらず一瞬で計算できる
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+        Returns
+            [人気和, 1番人気頭数]を添字とする組合せ数の配列
+    '''
+    counts = np.ones((1, 1), dtype=np.int64)
+
+    for leg in legs:
+        histogram = calc_leg_popular_histogram(leg)
+        tmp = np.zeros((counts.shape[0] + histogram.shape[0] - 1,
+                        counts.shape[1] + histogram.shape[1] - 1), dtype=np.int64)
+
+        # 度数が存在する(人気, 1番人気頭数)の分だけずらして足し込む(2次元の畳み込み)
+        for popular, first_cnt in zip(*np.nonzero(histogram)):
+            tmp[popular:popular + counts.shape[0], first_cnt:first_cnt + counts.shape[1]] += \
+                counts * histogram[popular, first_cnt]
+        counts = tmp
+
+    return counts
+
+
+def count_combinations(legs: list, filter_params: dict) -> int:
+    '''
+    人気和と1番人気頭数の抽出条件を満たす組合せ数を列挙せずに算出する処理
+    枠、馬番の抽出条件は考慮しない
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+        Returns
+            組合せ数
+    '''
+    counts = count_combinations_by_ninkiwa(legs)
+
+    ninkiwa_params = filter_params.get('ninkiwa', [])
+    ninki_tousu_params = filter_params.get('ninki_tousu', [])
+
+    if len(ninkiwa_params) > 0:
+        counts = counts[[val for val in ninkiwa_params if 0 <= val < counts.shape[0]], :]
+
+    if len(ninki_tousu_params) > 0:
+        counts = counts[:, [val for val in ninki_tousu_params if 0 <= val < counts.shape[1]]]
+
+    return int(counts.sum())
+
+
+def get_decided_legs(legs: list) -> list:
+    '''
+    人気、馬番がまだ決定していない馬を各レースの配列から除く処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+        Returns
+            人気、馬番が決定している馬のみのレースごとの配列が入ったdictのlist
+    '''
+    decided_legs = []
+    for leg in legs:
+        is_decided = (leg['人気'] != UNDECIDED_VAL) & (
+            leg['馬番'] != UNDECIDED_VAL)
+        decided_legs.append({col: vals[is_decided]
+                            for col, vals in leg.items()})
+
+    return decided_legs
+
+
+def partial_gathered_values(legs: list, indexes: list):
+    '''
+    列名から、組合せごとに各レースの値を集めた配列を取得する関数を生成する処理
+    get_filter_stagesのマスク関数をbroadcastではなく1次元の組合せ配列に適用する際に使用する
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            indexes: list
+                レースごとの、組合せ数分の馬のインデックス配列のlist
+        Returns
+            列名を受け取り、レースごとの組合せ数分の配列のlistを返す関数
+    '''
+    return lambda col: [leg[col][idx] for leg, idx in zip(legs, indexes)]
+
+
+def indexes_to_packed(legs: list, indexes: list) -> np.ndarray:
+    '''
+    レースごとの馬のインデックス配列から、組合せを詰めたuint32配列を作成する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            indexes: list
+                レースごとの、組合せ数分の馬のインデックス配列のlist
+        Returns
+            組合せを詰めたuint32配列
+    '''
+    packed = np.zeros(len(indexes[0]) if len(indexes) > 0 else 0,
+                      dtype=np.uint32)
+    for leg, idx in zip(legs, indexes):
+        packed = (packed << HORSE_NUM_BITS) | leg['馬番'][idx].astype(
+            np.uint32)
+
+    return packed
+
+
+def get_allowed_lookup(params: list, max_val: int) -> np.ndarray:
+    '''
+    選択値が範囲[lo, hi]に含まれるかを一括判定するための累積和を作成する処理
+        Params
+            params: list
+                選択値のlist(空の場合は全ての値を許可する)
+            max_val: int
+                取りうる値の最大値
+        Returns
+            添字v+1までの選択値の個数を格納した配列(先頭は0)
+    '''
+    allowed = np.zeros(max_val + 1, dtype=np.int32)
+    if len(params) == 0:
+        allowed[:] = 1
+    else:
+        allowed[[val for val in params if 0 <= val <= max_val]] = 1
+
+    return np.concatenate(([0], np.cumsum(allowed)))
+
+
+def has_allowed_in_range(lookup: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    '''
+    範囲[lo, hi]に選択値が1つ以上含まれるかを判定する処理
+        Params
+            lookup: np.ndarray
+                get_allowed_lookupで作成した累積和
+            lo: np.ndarray
+                範囲の下限
+            hi: np.ndarray
+                範囲の上限
+        Returns
+            範囲ごとの判定結果
+    '''
+    max_val = len(lookup) - 2
+    lo = np.clip(lo, 0, max_val + 1)
+    hi = np.clip(hi, -1, max_val)
+
+    return (hi >= lo) & (lookup[hi + 1] - lookup[lo] > 0)
+
+
+def get_leg_bounds(values_list: list) -> tuple:
+    '''
+    レースごとの値の最小値、最大値を取得する処理
+        Params
+            values_list: list
+                レースごとの値の配列のlist(空の配列を含まないこと)
+        Returns
+            mins: np.ndarray
+                レースごとの最小値
+            maxs: np.ndarray
+                レースごとの最大値
+    '''
+    return np.array([vals.min() for vals in values_list]), np.array([vals.max() for vals in values_list])
+
+
+def calc_alive_horses(legs: list, filter_params: dict) -> list:
+    '''
+    抽出条件を満たす組合せに含まれうる馬を判定する処理
+    他のレースの選択馬で取りうる人気和、1番人気頭数、合成オッズの対数の範囲(枝刈りと同じ最小値、最大値)と、
+    枠、馬番の「全て〇〇のみを除く」条件から、どの組合せでも条件を満たせない馬を除く
+    除いた馬により他のレースの範囲も狭まるため、除く馬がなくなるまで繰り返す
+    抽出式の条件は考慮しない
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+        Returns
+            レースごとの、条件を満たす組合せに含まれうるかどうかの配列のlist
+    '''
+    ninkiwa_params = filter_params.get('ninkiwa', [])
+    ninki_tousu_params = filter_params.get('ninki_tousu', [])
+    waku_params = filter_params.get('waku', [])
+    odd_even_params = filter_params.get('horse_num', [])
+    odds_min_params = filter_params.get('odds_min', [])
+    odds_max_params = filter_params.get('odds_max', [])
+    is_odds_filtered = len(odds_min_params) > 0 or len(odds_max_params) > 0
+
+    leg_count = len(legs)
+    popular_list = [leg['人気'].astype(np.int64) for leg in legs]
+    first_list = [(popular == 1).astype(np.int64) for popular in popular_list]
+
+    # 人気、馬番が未確定の馬は組合せに含まれない
+    alive_list = [(popular != UNDECIDED_VAL) & (leg['馬番'] != UNDECIDED_VAL)
+                  for leg, popular in zip(legs, popular_list)]
+    if len(waku_params) > 0:
+        alive_list = [alive & (leg['枠番'] != UNDECIDED_VAL)
+                      for leg, alive in zip(legs, alive_list)]
+    if is_odds_filtered:
+        log_odds_list = [get_log_odds(leg['オッズ']) for leg in legs]
+        alive_list = [alive & ~np.isnan(log_odds)
+                      for log_odds, alive in zip(log_odds_list, alive_list)]
+
+    # 「全て〇〇のみを除く」条件ごとの、除く対象かどうかの配列
+    all_excluded_list = []
+    if 0 in waku_params:
+        all_excluded_list.append([leg['枠番'] >= OUTER_WAKU_MIN for leg in legs])
+    if 1 in waku_params:
+        all_excluded_list.append([(leg['枠番'] <= INNER_WAKU_MAX) & (
+            leg['枠番'] != UNDECIDED_VAL) for leg in legs])
+    if 0 in odd_even_params:
+        all_excluded_list.append([leg['馬番'] % 2 != 0 for leg in legs])
+    if 1 in odd_even_params:
+        all_excluded_list.append([leg['馬番'] % 2 == 0 for leg in legs])
+
+    is_changed = True
+    while is_changed:
+        # 選択馬が残っていないレースがあれば組合せは存在しない
+        if not all(alive.any() for alive in alive_list):
+            return [np.zeros(len(alive), dtype=bool) for alive in alive_list]
+
+        new_alive_list = [alive.copy() for alive in alive_list]
+
+        if len(ninkiwa_params) > 0 or len(ninki_tousu_params) > 0:
+            popular_min, popular_max = get_leg_bounds(
+                [popular[alive] for popular, alive in zip(popular_list, alive_list)])
+            first_min, first_max = get_leg_bounds(
+                [first[alive] for first, alive in zip(first_list, alive_list)])
+            ninkiwa_lookup = get_allowed_lookup(
+                ninkiwa_params, int(popular_max.sum()))
+            ninki_tousu_lookup = get_allowed_lookup(
+                ninki_tousu_params, leg_count)
+
+            for leg_idx in range(leg_count):
+                # 他のレースで取りうる範囲を加えても選択値に届かない馬を除く
+                others_min = popular_min.sum() - popular_min[leg_idx]
+                others_max = popular_max.sum() - popular_max[leg_idx]
+                new_alive_list[leg_idx] &= has_allowed_in_range(
+                    ninkiwa_lookup, popular_list[leg_idx] + others_min, popular_list[leg_idx] + others_max)
+
+                others_min = first_min.sum() - first_min[leg_idx]
+                others_max = first_max.sum() - first_max[leg_idx]
+                new_alive_list[leg_idx] &= has_allowed_in_range(
+                    ninki_tousu_lookup, first_list[leg_idx] + others_min, first_list[leg_idx] + others_max)
+
+        if is_odds_filtered:
+            log_odds_min, log_odds_max = get_leg_bounds(
+                [log_odds[alive] for log_odds, alive in zip(log_odds_list, alive_list)])
+            for leg_idx in range(leg_count):
+                others_min = log_odds_min.sum() - log_odds_min[leg_idx]
+                others_max = log_odds_max.sum() - log_odds_max[leg_idx]
+                with np.errstate(invalid='ignore'):
+                    if len(odds_min_params) > 0:
+                        new_alive_list[leg_idx] &= log_odds_list[leg_idx] + others_max >= np.log(
+                            max(odds_min_params)) - LOG_ODDS_TOLERANCE
+                    if len(odds_max_params) > 0:
+                        new_alive_list[leg_idx] &= log_odds_list[leg_idx] + others_min <= np.log(
+                            min(odds_max_params)) + LOG_ODDS_TOLERANCE
+
+        # 他のレースの選択馬が全て除く対象の場合、このレースの除く対象の馬は組合せに含まれない
+        for is_excluded_list in all_excluded_list:
+            is_all_excluded = [is_excluded[alive].all()
+                               for is_excluded, alive in zip(is_excluded_list, alive_list)]
+            for leg_idx in range(leg_count):
+                if all(is_all_excluded[:leg_idx] + is_all_excluded[leg_idx + 1:]):
+                    new_alive_list[leg_idx] &= ~is_excluded_list[leg_idx]
+
+        is_changed = any((new_alive != alive).any()
+                         for new_alive, alive in zip(new_alive_list, alive_list))
+        alive_list = new_alive_list
+
+    return alive_list
+
+
+def drop_dead_horses(legs: list, filter_params: dict) -> list:
+    '''
+    抽出条件を満たす組合せに含まれない馬を、レースごとの配列から除く処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+        Returns
+            組合せに含まれうる馬のみのレースごとの配列が入ったdictのlist
+    '''
+    alive_list = calc_alive_horses(legs, filter_params)
+
+    return [{col: vals[alive] for col, vals in leg.items()} for leg, alive in zip(legs, alive_list)]
+
+
+def record_pruned_stages(funnel: FilterFunnel, legs: list, decided_legs: list, filter_params: dict, survivor_cnt: int, elapsed: float):
+    '''
+    枝刈り、結合で人気和、1番人気頭数の条件を適用した場合に、除外した組合せ数を集計する処理
+    人気和のみを適用した組合せ数は度数分布の畳み込みで求め、列挙せずに人気和と1番人気頭数の除外数を分ける
+        Params
+            funnel: FilterFunnel
+                集計先(Noneの場合は集計しない)
+            legs: list
+                未確定の馬を含むレースごとの配列が入ったdictのlist
+            decided_legs: list
+                未確定の馬を除いたレースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            survivor_cnt: int
+                人気和、1番人気頭数の条件を満たした組合せ数
+            elapsed: float
+                枝刈り、結合の処理時間(秒)
+    '''
+    if funnel is None:
+        return
+
+    decided_cnt = calc_product_size(decided_legs)
+    funnel.add_candidates(calc_product_size(legs))
+    funnel.record('undecided', calc_product_size(legs) - decided_cnt, 0.0)
+
+    ninkiwa_params = filter_params.get('ninkiwa', [])
+    ninki_tousu_params = filter_params.get('ninki_tousu', [])
+
+    if len(ninkiwa_params) > 0:
+        ninkiwa_cnt = count_combinations(
+            decided_legs, {'ninkiwa': ninkiwa_params}) if decided_cnt > 0 else 0
+        funnel.record('ninkiwa', decided_cnt - ninkiwa_cnt, elapsed)
+        if len(ninki_tousu_params) > 0:
+            funnel.record('ninki_tousu', ninkiwa_cnt - survivor_cnt, 0.0)
+    elif len(ninki_tousu_params) > 0:
+        funnel.record('ninki_tousu', decided_cnt - survivor_cnt, elapsed)
+
+
+def calc_packed_tickets_branch_and_bound(legs: list, filter_params: dict, funnel: FilterFunnel = None) -> np.ndarray:
+    '''
+    人気和、1番人気頭数の上下限で途中までの組合せを枝刈りしながら購入組合せを算出する処理
+    残りのレースで取りうる人気和、1番人気頭数の範囲に選択値が含まれない途中の組合せは展開しないため、
+    処理量は直積の大きさではなく、条件を満たす組合せ数に比例する
+    1レースずつ、生き残った途中の組合せ全体をまとめて配列演算で展開する
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    start = perf_counter()
+    all_legs = legs
+    legs = get_decided_legs(legs)
+    if calc_product_size(legs) == 0:
+        record_pruned_stages(funnel, all_legs, legs, filter_params, 0, 0.0)
+        return np.empty(0, dtype=np.uint32)
+
+    leg_count = len(legs)
+    popular_list = [leg['人気'].astype(np.int32) for leg in legs]
+    first_list = [(popular == 1).astype(np.int32)
+                  for popular in popular_list]
+
+    # 各レース以降の残りのレースで取りうる人気和、1番人気頭数の最小値、最大値
+    popular_min, popular_max = get_leg_bounds(popular_list)
+    first_min, first_max = get_leg_bounds(first_list)
+    rest_popular_min = np.concatenate((np.cumsum(popular_min[::-1])[::-1], [0]))
+    rest_popular_max = np.concatenate((np.cumsum(popular_max[::-1])[::-1], [0]))
+    rest_first_min = np.concatenate((np.cumsum(first_min[::-1])[::-1], [0]))
+    rest_first_max = np.concatenate((np.cumsum(first_max[::-1])[::-1], [0]))
+
+    ninkiwa_lookup = get_allowed_lookup(
+        filter_params.get('ninkiwa', []), int(rest_popular_max[0]))
+    ninki_tousu_lookup = get_allowed_lookup(
+        filter_params.get('ninki_tousu', []), leg_count)
+
+    # 途中の組合せ(レースごとの馬のインデックス)と、その人気和、1番人気頭数
+    indexes = []
+    popular_sum = np.zeros(1, dtype=np.int32)
+    first_cnt = np.zeros(1, dtype=np.int32)
+
+    for leg_idx in range(leg_count):
+        horse_cnt = len(popular_list[leg_idx])
+
+        # 途中の組合せ×このレースの馬に展開(途中の組合せが外側なので直積の順序は保たれる)
+        parent = np.repeat(np.arange(len(popular_sum)), horse_cnt)
+        child = np.tile(np.arange(horse_cnt), len(popular_sum))
+        popular_sum = popular_sum[parent] + popular_list[leg_idx][child]
+        first_cnt = first_cnt[parent] + first_list[leg_idx][child]
+
+        # 残りのレースを加えても選択された人気和、1番人気頭数に届かない途中の組合せを枝刈り
+        is_alive = has_allowed_in_range(ninkiwa_lookup, popular_sum + rest_popular_min[leg_idx + 1],
+                                        popular_sum + rest_popular_max[leg_idx + 1]) & \
+            has_allowed_in_range(ninki_tousu_lookup, first_cnt + rest_first_min[leg_idx + 1],
+                                 first_cnt + rest_first_max[leg_idx + 1])
+
+        indexes = [idx[parent][is_alive] for idx in indexes] + \
+            [child[is_alive]]
+        popular_sum = popular_sum[is_alive]
+        first_cnt = first_cnt[is_alive]
+
+    record_pruned_stages(funnel, all_legs, legs, filter_params,
+                         len(popular_sum), perf_counter() - start)
+
+    # 人気和、1番人気頭数以外の抽出条件を、効率のよい順に生き残った組合せにのみ適用
+    stages = get_ordered_filter_stages(
+        legs, filter_params, ('undecided', 'ninkiwa', 'ninki_tousu'))
+    indexes = apply_filter_stages_compacted(stages, legs, indexes, funnel)
+
+    packed = sort_unique_tickets(indexes_to_packed(legs, indexes))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return packed
+
+
+def get_partial_product(legs: list) -> tuple:
+    '''
+    一部のレースの直積をレースごとのインデックス配列と人気和、1番人気頭数で表現する処理
+    レースが0件の場合は、人気和、1番人気頭数が0の組合せ1件とする
+        Params
+            legs: list
+                直積をとるレースの配列が入ったdictのlist
+        Returns
+            indexes: list
+                レースごとの、組合せ数分の馬のインデックス配列のlist
+            popular_sum: np.ndarray
+                組合せごとの人気和
+            first_cnt: np.ndarray
+                組合せごとの1番人気頭数
+    '''
+    grids = np.meshgrid(*[np.arange(len(leg['人気'])) for leg in legs],
+                        indexing='ij')
+    indexes = [grid.ravel() for grid in grids]
+
+    popular_sum = reduce(np.add, [leg['人気'].astype(np.int32)[idx]
+                                  for leg, idx in zip(legs, indexes)], np.zeros(1, dtype=np.int32))
+    first_cnt = reduce(np.add, [(leg['人気'] == 1).astype(np.int32)[idx]
+                                for leg, idx in zip(legs, indexes)], np.zeros(1, dtype=np.int32))
+
+    return indexes, popular_sum, first_cnt
+
+
+def calc_packed_tickets_meet_in_the_middle(legs: list, filter_params: dict, split_leg_cnt: int = None, funnel: FilterFunnel = None) -> np.ndarray:
+    '''
+    前半と後半(5レースの場合は1,2レースと3,4,5レース)の部分組合せを人気和でグループ化し、
+    合計が選択された人気和になるグループ同士のみを結合して購入組合せを算出する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            split_leg_cnt: int = None
+                前半とするレース数(Noneの場合はレース数の半分(切り捨て))
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    stage_start = perf_counter()
+    all_legs = legs
+    legs = get_decided_legs(legs)
+    if calc_product_size(legs) == 0:
+        record_pruned_stages(funnel, all_legs, legs, filter_params, 0, 0.0)
+        return np.empty(0, dtype=np.uint32)
+
+    if split_leg_cnt is None:
+        split_leg_cnt = len(legs) // 2
+
+    left_indexes, left_sum, left_first = get_partial_product(
+        legs[:split_leg_cnt])
+    right_indexes, right_sum, right_first = get_partial_product(
+        legs[split_leg_cnt:])
+
+    # 後半を人気和で並べ替え、人気和ごとの範囲を二分探索できるようにする
+    right_order = np.argsort(right_sum, kind='stable')
+    right_sum_sorted = right_sum[right_order]
+
+    ninkiwa_params = filter_params.get('ninkiwa', [])
+    if len(ninkiwa_params) == 0:
+        ninkiwa_params = range(
+            int(left_sum.min() + right_sum.min()), int(left_sum.max() + right_sum.max()) + 1)
+
+    # 前半の人気和ごとに、合計が選択された人気和になる後半のグループと結合
+    left_pos_list = []
+    right_pos_list = []
+    for left_val in np.unique(left_sum):
+        left_pos = np.flatnonzero(left_sum == left_val)
+        for ninkiwa in ninkiwa_params:
+            start, end = np.searchsorted(
+                right_sum_sorted, [ninkiwa - left_val, ninkiwa - left_val + 1])
+            if start == end:
+                continue
+            left_pos_list.append(np.repeat(left_pos, end - start))
+            right_pos_list.append(
+                np.tile(right_order[start:end], len(left_pos)))
+
+    if len(left_pos_list) == 0:
+        record_pruned_stages(funnel, all_legs, legs, filter_params,
+                             0, perf_counter() - stage_start)
+        return np.empty(0, dtype=np.uint32)
+
+    left_pos = np.concatenate(left_pos_list)
+    right_pos = np.concatenate(right_pos_list)
+
+    # 1番人気頭数は結合後の組合せで判定
+    ninki_tousu_params = filter_params.get('ninki_tousu', [])
+    if len(ninki_tousu_params) > 0:
+        is_match = np.isin(left_first[left_pos] +
+                           right_first[right_pos], ninki_tousu_params)
+        left_pos = left_pos[is_match]
+        right_pos = right_pos[is_match]
+
+    record_pruned_stages(funnel, all_legs, legs, filter_params,
+                         len(left_pos), perf_counter() - stage_start)
+
+    indexes = [idx[left_pos] for idx in left_indexes] + \
+        [idx[right_pos] for idx in right_indexes]
+
+    # 人気和、1番人気頭数以外の抽出条件を、効率のよい順に結合した組合せにのみ適用
+    stages = get_ordered_filter_stages(
+        legs, filter_params, ('undecided', 'ninkiwa', 'ninki_tousu'))
+    indexes = apply_filter_stages_compacted(stages, legs, indexes, funnel)
+
+    packed = sort_unique_tickets(indexes_to_packed(legs, indexes))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return packed
+
+
+def estimate_enumeration_costs(legs: list, filter_params: dict, split_leg_cnt: int = None) -> dict:
+    '''
+    各レースの選択頭数と抽出条件の選択率から、算出方法ごとの処理時間を見積もる処理
+    人気和、1番人気頭数を満たす組合せ数は人気の度数分布の畳み込みで正確に求める
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            split_leg_cnt: int = None
+                半分全列挙で前半とするレース数(Noneの場合はレース数の半分(切り捨て))
+        Returns
+            算出方法ごとの見積もり処理時間(ナノ秒)のdict
+    '''
+    sizes = [len(leg['馬番']) for leg in get_decided_legs(legs)]
+    if split_leg_cnt is None:
+        split_leg_cnt = len(legs) // 2
+    product_size = int(np.prod(sizes))
+    survivor_cnt = count_combinations(legs, filter_params)
+    partial_size = int(np.prod(sizes[:split_leg_cnt])) + \
+        int(np.prod(sizes[split_leg_cnt:]))
+
+    costs = {
+        ENUMERATION_METHODS['brute_force']: BRUTE_FORCE_COST['fixed'] +
+        BRUTE_FORCE_COST['product'] * product_size + BRUTE_FORCE_COST['survivor'] * survivor_cnt,
+    }
+
+    # 人気和、1番人気頭数が選択されていない場合は枝刈りも結合もできない
+    if len(filter_params.get('ninkiwa', [])) > 0 or len(filter_params.get('ninki_tousu', [])) > 0:
+        costs[ENUMERATION_METHODS['branch_and_bound']] = BRANCH_AND_BOUND_COST['fixed'] + \
+            BRANCH_AND_BOUND_COST['survivor'] * survivor_cnt
+
+    if len(filter_params.get('ninkiwa', [])) > 0:
+        costs[ENUMERATION_METHODS['meet_in_the_middle']] = MEET_IN_THE_MIDDLE_COST['fixed'] + \
+            MEET_IN_THE_MIDDLE_COST['partial'] * partial_size + \
+            MEET_IN_THE_MIDDLE_COST['survivor'] * survivor_cnt
+
+    return costs
+
+
+def choose_enumeration_method(legs: list, filter_params: dict) -> str:
+    '''
+    見積もり処理時間が最小となる組合せの算出方法を選択する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+        Returns
+            ENUMERATION_METHODSのいずれか
+    '''
+    costs = estimate_enumeration_costs(legs, filter_params)
+
+    return min(costs, key=costs.get)
+
+
+def calc_packed_tickets_auto(legs: list, filter_params: dict, worker_cnt: int = 1, funnel: FilterFunnel = None) -> np.ndarray:
+    '''
+    コストモデルで選択した方法で購入組合せを算出する処理
+        Params
+            legs: list
+                レースごとの配列が入ったdictのlist
+            filter_params: dict
+                抽出条件ごとの選択値
+            worker_cnt: int = 1
+                全列挙を選択した場合のワーカープロセス数
+            funnel: FilterFunnel = None
+                抽出条件ごとの除外数の集計先
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    # どの組合せにも含まれない馬は列挙前に除く
+    if calc_product_size(legs) > 0:
+        start = perf_counter()
+        product_size = calc_product_size(legs)
+        legs = drop_dead_horses(legs, filter_params)
+        dead_cnt = product_size - calc_product_size(legs)
+        log_manager.info(f'対象外の馬を除いて{dead_cnt}点を列挙対象から除外')
+
+        if funnel is not None:
+            funnel.add_candidates(dead_cnt)
+            funnel.record('dead_horses', dead_cnt, perf_counter() - start)
+
+    method = choose_enumeration_method(legs, filter_params)
+    log_manager.info(f'組合せの算出方法: {method}')
+
+    if method == ENUMERATION_METHODS['branch_and_bound']:
+        packed = calc_packed_tickets_branch_and_bound(
+            legs, filter_params, funnel)
+    elif method == ENUMERATION_METHODS['meet_in_the_middle']:
+        packed = calc_packed_tickets_meet_in_the_middle(
+            legs, filter_params, funnel=funnel)
+    else:
+        packed = calc_packed_tickets(
+            legs, filter_params, worker_cnt=worker_cnt, funnel=funnel)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return packed
+
+
+class IncrementalCombinationEngine():
+    '''
+    選択中の出走馬と抽出条件に対する購入組合せを保持し、
+    1頭の追加、削除や抽出条件の変更の際に影響する組合せのみ再計算するクラス
+    '''
+
+    def __init__(self, race_card):
+        '''
+        コンストラクタ
+            Params
+                race_card: RaceCard
+                    全出走馬の情報を馬番を添字とする配列で保持した出馬表
+        '''
+        self.race_card = race_card
+        self.leg_count = race_card.leg_count
+
+        # レースごとの選択中の馬番
+        self.selected_horse_nums = [[] for _ in range(self.leg_count)]
+
+        # 抽出条件
+        self.filter_params = {}
+
+        # 抽出条件を適用する前の組合せ(人気、馬番が決定していないものは除く)
+        self.candidates = np.empty(0, dtype=np.uint32)
+
+        # 抽出条件を適用した購入組合せ
+        self.tickets = np.empty(0, dtype=np.uint32)
+
+    def get_legs(self, selected_horse_nums: list) -> list:
+        '''
+        選択された馬番からレースごとの配列を作成する処理
+            Params
+                selected_horse_nums: list
+                    レースごとの選択された馬番のlist
+            Returns
+                レースごとの配列が入ったdictのlist
+        '''
+        return self.race_card.get_legs(selected_horse_nums)
+
+    def calc_mask(self, packed: np.ndarray, chunk_size: int = DEFAULT_CHUNK_SIZE) -> np.ndarray:
+        '''
+        詰めた組合せに抽出条件を適用したマスクを算出する処理
+            Params
+                packed: np.ndarray
+                    組合せを詰めたuint32配列
+                chunk_size: int = DEFAULT_CHUNK_SIZE
+                    1度に馬番配列に戻す組合せ数
+            Returns
+                抽出条件を満たすかどうかの配列
+        '''
+        lookups = self.race_card.lookups
+
+        # 保持している組合せからの標本で、抽出条件を効率のよい順に並べる
+        rng = np.random.default_rng(0)
+        sample = packed[rng.integers(0, len(packed), min(
+            STAGE_SAMPLE_SIZE, len(packed)))] if len(packed) > 0 else packed
+        stages = order_filter_stages(get_filter_stages(self.filter_params),
+                                     partial_lookup_values(lookups, sample), len(sample))
+
+        mask = np.zeros(len(packed), dtype=bool)
+
+        for start in range(0, len(packed), chunk_size):
+            # 抽出条件ごとに、残った組合せのみに詰め直して適用する
+            chunk = packed[start:start + chunk_size]
+            alive = np.arange(len(chunk))
+            for _, mask_func in stages:
+                alive = alive[mask_func(
+                    partial_lookup_values(lookups, chunk[alive]))]
+            mask[start + alive] = True
+
+        return mask
+
+    def add_horse(self, leg_idx: int, horse_num: int):
+        '''
+        1頭追加し、その馬を含む組合せのみ算出して追加する処理
+            Params
+                leg_idx: int
+                    レースのインデックス(0始まり)
+                horse_num: int
+                    馬番
+        '''
+        if horse_num in self.selected_horse_nums[leg_idx]:
+            return
+
+        # 追加した馬以外のレースは選択中の馬のまま、追加した馬のレースのみ1頭に絞った直積
+        target_horse_nums = list(self.selected_horse_nums)
+        target_horse_nums[leg_idx] = [horse_num]
+        self.selected_horse_nums[leg_idx].append(horse_num)
+
+        new_candidates = calc_packed_tickets(
+            self.get_legs(target_horse_nums), {})
+
+        self.candidates = union_tickets(self.candidates, new_candidates)
+        self.tickets = union_tickets(
+            self.tickets, new_candidates[self.calc_mask(new_candidates)])
+
+    def remove_horse(self, leg_idx: int, horse_num: int):
+        '''
+        1頭削除し、その馬を含む組合せのみ取り除く処理
+            Params
+                leg_idx: int
+                    レースのインデックス(0始まり)
+                horse_num: int
+                    馬番
+        '''
+        if not horse_num in self.selected_horse_nums[leg_idx]:
+            return
+
+        self.selected_horse_nums[leg_idx].remove(horse_num)
+
+        shift = HORSE_NUM_BITS * (self.leg_count - leg_idx - 1)
+        self.candidates = self.candidates[(
+            (self.candidates >> shift) & HORSE_NUM_MASK) != horse_num]
+        self.tickets = self.tickets[(
+            (self.tickets >> shift) & HORSE_NUM_MASK) != horse_num]
+
+    def set_filter_params(self, filter_params: dict):
+        '''
+        抽出条件を変更し、保持している組合せにマスクを適用し直す処理
+            Params
+                filter_params: dict
+                    抽出条件ごとの選択値
+        '''
+        self.filter_params = filter_params
+
+        # 抽出条件が絞り込まれている場合は、保持している組合せ全体にマスクを適用し直すより
+        # 選択中の馬から枝刈り等で算出し直すほうが速いため、見積もり処理時間で選択する
+        legs = self.get_legs(self.selected_horse_nums)
+        remask_cost = REMASK_COST['candidate'] * len(self.candidates)
+        if min(estimate_enumeration_costs(legs, filter_params).values()) < remask_cost:
+            self.tickets = calc_packed_tickets_auto(legs, filter_params)
+        else:
+            self.tickets = self.candidates[self.calc_mask(self.candidates)]
+
+
+def partial_lookup_values(lookups: list, packed: np.ndarray):
+    '''
+    列名から、詰めた組合せに対応するレースごとの値を取得する関数を生成する処理
+    同じ列は何度も参照されるため、1度取得した値は保持しておく
+        Params
+            lookups: list
+                RaceCardが保持するレースごとの馬番を添字とする配列
+            packed: np.ndarray
+                組合せを詰めたuint32配列
+        Returns
+            列名を受け取り、レースごとの組合せ数分の配列のlistを返す関数
+    '''
+    leg_count = len(lookups)
+    horse_nums = [(packed >> (HORSE_NUM_BITS * (leg_count - leg_idx - 1))) & HORSE_NUM_MASK
+                  for leg_idx in range(leg_count)]
+    values = {}
+
+    def get_values(col):
+        if not col in values:
+            values[col] = [lookup[col][nums]
+                           for lookup, nums in zip(lookups, horse_nums)]
+        return values[col]
+
+    return get_values
+
+
+def select_top_k_tickets(packed: np.ndarray, lookups: list, k: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    '''
+    詰めた組合せから、推定的中確率(各レースの推定勝率の積)が高い順にk件を選択する処理
+    全件を並べ替えず、チャンクごとに暫定上位k件と合わせてargpartitionで上位k件のみ残す
+    推定勝率はオッズから控除率を除いて正規化しているため、的中確率×合成オッズ(期待値)は
+    組合せによらず一定となり、期待値での順位付けは意味をなさないため的中確率で順位付けする
+        Params
+            packed: np.ndarray
+                組合せを詰めたuint32配列
+            lookups: list
+                RaceCardが保持するレースごとの馬番を添字とする配列
+            k: int
+                選択する組合せ数
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1度に推定的中確率を算出する組合せ数
+        Returns
+            top_tickets: np.ndarray
+                推定的中確率の降順に並べた上位k件の組合せを詰めたuint32配列
+            top_log_probs: np.ndarray
+                top_ticketsの推定的中確率の対数
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    top_tickets = np.empty(0, dtype=np.uint32)
+    top_log_probs = np.empty(0, dtype=np.float64)
+
+    if k > 0:
+        for start in range(0, len(packed), chunk_size):
+            chunk = packed[start:start + chunk_size]
+            log_probs = reduce(np.add, partial_lookup_values(
+                lookups, chunk)(IMPLIED_LOG_PROB_COLUMN))
+
+            # オッズが未確定の馬を含む組合せは確率を算出できないため選択しない
+            is_known = ~np.isnan(log_probs)
+            tickets = np.concatenate((top_tickets, chunk[is_known]))
+            log_probs = np.concatenate((top_log_probs, log_probs[is_known]))
+
+            if len(tickets) > k:
+                top_idx = np.argpartition(-log_probs, k - 1)[:k]
+                tickets = tickets[top_idx]
+                log_probs = log_probs[top_idx]
+
+            top_tickets = tickets
+            top_log_probs = log_probs
+
+        # 残ったk件のみ降順に並べる(同じ確率の場合は詰めた値の昇順)
+        order = np.lexsort((top_tickets, -top_log_probs))
+        top_tickets = top_tickets[order]
+        top_log_probs = top_log_probs[order]
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return top_tickets, top_log_probs
+
+
+def select_budget_tickets(packed: np.ndarray, lookups: list, budget: int, unit_price: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    '''
+    予算内で推定的中確率の合計が最大となる組合せを選択する処理
+    1組合せの金額は全て同じなので、予算で買える点数まで推定的中確率の高い順に選べば最大となる
+        Params
+            packed: np.ndarray
+                組合せを詰めたuint32配列
+            lookups: list
+                RaceCardが保持するレースごとの馬番を添字とする配列
+            budget: int
+                予算(円)
+            unit_price: int
+                1組合せあたりの金額(円)
+            chunk_size: int = DEFAULT_CHUNK_SIZE
+                1度に推定的中確率を算出する組合せ数
+        Returns
+            tickets: np.ndarray
+                選択した組合せを昇順に詰めたuint32配列
+            hit_prob: float
+                選択した組合せの推定的中確率の合計
+            cost: int
+                選択した組合せの合計金額(円)
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    if unit_price <= 0:
+        raise ValueError(f'1組合せあたりの金額は1円以上で指定してください。: {unit_price}')
+    if budget < 0:
+        raise ValueError(f'予算は0円以上で指定してください。: {budget}')
+
+    ticket_cnt = budget // unit_price
+    top_tickets, top_log_probs = select_top_k_tickets(
+        packed, lookups, ticket_cnt, chunk_size)
+
+    tickets = np.sort(top_tickets)
+    hit_prob = float(np.exp(top_log_probs).sum())
+    cost = len(tickets) * unit_price
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return tickets, hit_prob, cost
+
+
+def calc_box_cover(packed: np.ndarray, leg_count: int = LEG_COUNT) -> np.ndarray:
+    '''
+    詰めた組合せを、互いに重ならないフォーメーション(レースごとの馬番の集合の直積)で過不足なく覆う処理
+    最終レースから順に、残りのレースの馬番が同じ組合せを最終レースの馬番の集合でまとめ、
+    最終レースの集合が同じものごとに残りのレースを再帰的にまとめる
+    その後、1レースを除いて同じ集合のフォーメーション同士を併合できなくなるまで併合する
+        Params
+            packed: np.ndarray
+                昇順かつ重複なしの組合せを詰めたuint32配列
+            leg_count: int = LEG_COUNT
+                対象レース数
+        Returns
+            (フォーメーション数, レース数)のuint32配列
+            各要素はそのレースで選択する馬番のビットを立てた値(馬番nは1 << n)
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    if len(packed) == 0:
+        boxes = np.empty((0, leg_count), dtype=np.uint32)
+    else:
+        boxes = merge_boxes(factorize_tickets(packed, leg_count))
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return boxes
+
+
+def factorize_tickets(packed: np.ndarray, leg_count: int) -> np.ndarray:
+    '''
+    詰めた組合せを最終レースの馬番の集合でまとめ、残りのレースを再帰的にまとめる処理
+        Params
+            packed: np.ndarray
+                昇順かつ重複なしのleg_countレース分の組合せを詰めた配列
+            leg_count: int
+                packedに詰めたレース数
+        Returns
+            (フォーメーション数, leg_count)の馬番のビットを立てたuint32配列
+    '''
+    last_bits = np.left_shift(np.uint32(1), (packed & HORSE_NUM_MASK).astype(np.uint32))
+
+    if leg_count == 1:
+        return np.array([[np.bitwise_or.reduce(last_bits)]], dtype=np.uint32)
+
+    # 昇順なので、最終レースを除いた組合せが同じものは連続している
+    heads = packed >> HORSE_NUM_BITS
+    is_head_start = np.concatenate(([True], heads[1:] != heads[:-1]))
+    start_idx = np.flatnonzero(is_head_start)
+    heads = heads[start_idx]
+    last_sets = np.bitwise_or.reduceat(last_bits, start_idx)
+
+    # 最終レースの集合が同じものごとに、残りのレースの組合せをまとめる
+    boxes = []
+    for last_set in np.unique(last_sets):
+        head_boxes = factorize_tickets(heads[last_sets == last_set], leg_count - 1)
+        boxes.append(np.column_stack(
+            (head_boxes, np.full(len(head_boxes), last_set, dtype=np.uint32))))
+
+    return np.concatenate(boxes)
+
+
+def merge_boxes(boxes: np.ndarray) -> np.ndarray:
+    '''
+    1レースを除いて同じ集合のフォーメーション同士を、そのレースの集合の和で1つに併合する処理
+    互いに重ならないフォーメーションは、他のレースの集合が同じであれば残りのレースの集合も重ならないため、
+    併合後も過不足なく覆ったままとなる
+        Params
+            boxes: np.ndarray
+                (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+        Returns
+            併合後の(フォーメーション数, レース数)の配列
+    '''
+    leg_count = boxes.shape[1]
+    is_merged = True
+    while is_merged and len(boxes) > 1:
+        is_merged = False
+        for leg_idx in range(leg_count):
+            others = np.delete(boxes, leg_idx, axis=1)
+            _, group_idx = np.unique(others, axis=0, return_inverse=True)
+            group_idx = group_idx.reshape(-1)
+            if group_idx.max() + 1 == len(boxes):
+                continue
+
+            order = np.argsort(group_idx, kind='stable')
+            start_idx = np.flatnonzero(np.concatenate(
+                ([True], group_idx[order][1:] != group_idx[order][:-1])))
+            merged = boxes[order][start_idx]
+            merged[:, leg_idx] = np.bitwise_or.reduceat(
+                boxes[order][:, leg_idx], start_idx)
+            boxes = merged
+            is_merged = True
+
+    return boxes
+
+
+def get_box_horse_nums(box: np.ndarray) -> list:
+    '''
+    フォーメーションからレースごとに選択する馬番を取得する処理
+        Params
+            box: np.ndarray
+                レース数分の馬番のビットを立てたuint32配列
+        Returns
+            レースごとの昇順の馬番のlist
+    '''
+    return [[num for num in range(1 << HORSE_NUM_BITS) if (int(horse_set) >> num) & 1] for horse_set in box]
+
+
+def expand_boxes(boxes: np.ndarray) -> np.ndarray:
+    '''
+    フォーメーションを展開し、詰めた組合せに戻す処理
+        Params
+            boxes: np.ndarray
+                (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+        Returns
+            昇順かつ重複なしの組合せを詰めたuint32配列
+    '''
+    packed_list = [np.empty(0, dtype=np.uint32)]
+    for box in boxes:
+        grids = np.meshgrid(*[np.array(nums, dtype=np.uint32)
+                            for nums in get_box_horse_nums(box)], indexing='ij')
+        packed_list.append(pack_tickets(
+            np.stack([grid.reshape(-1) for grid in grids], axis=1)))
+
+    return sort_unique_tickets(np.concatenate(packed_list))
+
+
+def get_box_cover_report(ticket_cnt: int, boxes: np.ndarray) -> dict:
+    '''
+    フォーメーションで覆った結果の圧縮率と、購入画面での入力操作数を算出する処理
+    1回のセットあたり、選択する馬番のチェック数と金額入力、セットボタンの操作が必要となる
+        Params
+            ticket_cnt: int
+                覆った組合せ数
+            boxes: np.ndarray
+                (フォーメーション数, レース数)の馬番のビットを立てたuint32配列
+        Returns
+            {'ticket_cnt': 組合せ数, 'box_cnt': フォーメーション数, 'compression_ratio': 組合せ数/フォーメーション数,
+             'ticket_operations': 1組合せずつ入力する場合の操作数, 'box_operations': フォーメーションで入力する場合の操作数,
+             'saved_operations': 削減できる操作数}のdict
+    '''
+    leg_count = boxes.shape[1]
+    check_cnt = sum(len(nums) for box in boxes for nums in get_box_horse_nums(box))
+
+    ticket_operations = ticket_cnt * (leg_count + ENTRY_EXTRA_OPERATIONS)
+    box_operations = check_cnt + len(boxes) * ENTRY_EXTRA_OPERATIONS
+
+    return {
+        'ticket_cnt': ticket_cnt,
+        'box_cnt': len(boxes),
+        'compression_ratio': ticket_cnt / len(boxes) if len(boxes) > 0 else 0.0,
+        'ticket_operations': ticket_operations,
+        'box_operations': box_operations,
+        'saved_operations': ticket_operations - box_operations,
+    }
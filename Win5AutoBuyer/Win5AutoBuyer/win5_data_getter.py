@@ -1,19 +1,27 @@
 # 標準モジュール
+from concurrent.futures import ThreadPoolExecutor
 import inspect
+import atexit
 import datetime
 import sqlite3
 import re
+import threading
+import time
 
 # インストールモジュール
 import pandas as pd
 from bs4 import BeautifulSoup as bs
-from playwright.sync_api import Playwright, Page
-import requests
+from bs4 import UnicodeDammit
+import lxml.html
+from playwright.sync_api import Page
 
 
 # 自作モジュール
 from utilities.common_log_manager import log_manager
 from utilities.log_manager import LogManager
+from utilities.browser_session import BrowserSession
+from utilities.http_cache import CACHE_MISS, HttpCache
+from utilities.http_client import HttpClient
 
 from config.settings import *
 
@@ -26,61 +34,220 @@ else:
     log_manager = log_manager
 
 # 定数
+# HTTPキャッシュの有効期限を判定するページの種類
+# オッズ発表前の出馬表
+PAGE_CLASS_RACE_CARD = 'race_card'
+# オッズ発表後の出馬表
+PAGE_CLASS_ODDS = 'odds'
+
+# 出馬表一覧ページのWIN5を含む開催日(画面遷移後に待つ要素)
+RACE_LIST_PANEL_SELECTOR = '#main > div.panel.no-padding.no-border h3.sub_header'
+
+# WIN5対象レース一覧ページの対象レースの表(画面遷移後に待つ要素)
+WIN5_RACES_TABLE_SELECTOR = '#contentsBody > div.result_detail.mt30 > table'
+
+# BeautifulSoupが空白とみなす文字
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# タグとタグ以外の文字列に分割する正規表現
+HTML_TAG_PATTERN = re.compile(r'(<[^>]*>)')
+
+# 出馬表の各出走馬の列から値を取得する要素のパス((タグ名, クラス)のlist、CSSの「>」と同じく子要素をたどる)
+SYUTSUBA_WAKU_IMG_PATH = [('td', 'waku'), ('img', None)]
+SYUTSUBA_WAKU_PATH = [('td', 'waku')]
+SYUTSUBA_NUM_PATH = [('td', 'num')]
+SYUTSUBA_HORSE_NAME_PATH = [('td', 'horse'), ('div', 'name_line'),
+                            ('div', 'name'), ('a', None)]
+SYUTSUBA_ODDS_PATH = [('td', 'horse'), ('div', 'name_line'), ('div', 'odds'),
+                      ('div', 'odds_line'), ('span', 'num'), ('strong', None)]
+SYUTSUBA_POP_RANK_PATH = [('td', 'horse'), ('div', 'name_line'), ('div', 'odds'),
+                          ('div', 'odds_line'), ('span', 'pop_rank')]
+SYUTSUBA_TRAINER_PATH = [('td', 'horse'), ('p', 'trainer')]
+SYUTSUBA_AGE_PATH = [('td', 'jockey'), ('p', 'age')]
+SYUTSUBA_WEIGHT_PATH = [('td', 'jockey'), ('p', 'weight')]
+SYUTSUBA_JOCKEY_PATH = [('td', 'jockey'), ('p', 'jockey'), ('a', None)]
+
+
+class TokenBucket():
+    '''
+    トークンバケット方式でリクエストの間隔を制限するクラス
+    トークンは一定間隔で補充され、リクエストのたびに1つ消費する
+    トークンがない場合は補充されるまで待つため、複数スレッドから呼び出しても間隔が守られる
+    '''
+
+    def __init__(self, interval: float, capacity: int = 1):
+        '''
+        コンストラクタ
+            Params
+                interval: float
+                    トークンを1つ補充する間隔(秒)
+                    0以下の場合は制限しない
+                capacity: int = 1
+                    保持できるトークン数の上限(連続して送れるリクエスト数)
+        '''
+        self.interval = interval
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+        # 待機した合計時間(秒)
+        self.wait_time = 0.0
+
+    def acquire(self):
+        '''
+        トークンを1つ消費する処理
+        トークンがない場合は補充されるまで待つ
+        '''
+        if self.interval <= 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens +
+                              (now - self.updated_at) / self.interval)
+            self.updated_at = now
+
+            # 補充を待つ分だけ前借りし、待ち時間はロックの外で待つ
+            self.tokens -= 1
+            wait = -self.tokens * self.interval if self.tokens < 0 else 0.0
+            self.wait_time += wait
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+# JRAへのリクエストで共有する、ACCESS_INTERVAL秒に1回までのレート制限
+jra_rate_limiter = TokenBucket(ACCESS_INTERVAL)
+
+# JRAへのリクエストで共有する、接続を使い回すHTTPクライアント(TIME_OUTはミリ秒)
+# 並行に取得するスレッド数分の接続を保持する
+# 出馬表はオッズ発表まではほぼ変わらないため、ページの種類ごとの有効期限で応答をキャッシュする
+# 再送もJRAへのリクエストのため、レート制限のトークンを取得してから送る
+jra_http_client = HttpClient(USER_AGENT, TIME_OUT / 1000, pool_size=FETCH_WORKER_COUNT,
+                             retry_cnt=HTTP_RETRY_COUNT, backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX,
+                             cache=HttpCache(HTTP_CACHE_DIR, {PAGE_CLASS_RACE_CARD: HTTP_CACHE_TTL_RACE_CARD, PAGE_CLASS_ODDS: HTTP_CACHE_TTL_ODDS}),
+                             rate_limiter=jra_rate_limiter)
+
+# URLごとの出馬表の解析結果
+# 前回と同じ本文(キャッシュのhit、revalidate)の場合は解析せずにこれを使用する
+parsed_race_cards = {}
+
+# アプリ終了まで起動したまま使い回すブラウザ
+browser_session = BrowserSession(
+    USER_AGENT, TIME_OUT, PLAYWRIGHT_BLOCKED_RESOURCE_TYPES)
+atexit.register(browser_session.close)
+
+
+def fetch_concurrently(fetch_func, args_list: list, rate_limiter: TokenBucket, worker_cnt: int) -> tuple:
+    '''
+    レート制限をかけながら、複数のリクエストをスレッドプールで並行に実行する処理
+    リクエストの開始間隔はレート制限で守り、応答待ちの時間のみ重ねる
+        Params
+            fetch_func
+                1件分のリクエストを実行する関数
+            args_list: list
+                fetch_funcに渡す引数のtupleのlist
+            rate_limiter: TokenBucket
+                リクエストの開始間隔を制限するトークンバケット
+            worker_cnt: int
+                スレッド数
+        Returns
+            results: list
+                args_listと同じ順のfetch_funcの戻り値のlist
+            report: dict
+                wall_time: 全体の経過時間(秒)
+                fetch_time: リクエストごとの処理時間の合計(秒)
+                sequential_time: 1件ずつ取得しACCESS_INTERVAL秒ずつ待つ従来の方法の見積もり時間(秒)
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    def fetch(args):
+        rate_limiter.acquire()
+        start = time.perf_counter()
+        result = fetch_func(*args)
+        return result, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, worker_cnt)) as executor:
+        fetched = list(executor.map(fetch, args_list))
+    wall_time = time.perf_counter() - start
+
+    results = [result for result, _ in fetched]
+    fetch_time = sum(elapsed for _, elapsed in fetched)
+    report = {
+        'wall_time': wall_time,
+        'fetch_time': fetch_time,
+        'sequential_time': fetch_time + max(rate_limiter.interval, 0) * len(args_list),
+    }
+
+    log_manager.info(
+        f'{len(args_list)}件取得 経過時間: {wall_time:.2f}秒 逐次取得の見積もり: {report["sequential_time"]:.2f}秒')
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
+    return results, report
 
-def get_playwright_page(playwright: Playwright, target_url: str, use_headless=True) -> Page:
+
+def get_playwright_page(session: BrowserSession, target_url: str, use_headless=True) -> Page:
     '''
-    playwrightで対象urlのページオブジェクトを取得する処理
+    起動済みのブラウザで対象urlのページオブジェクトを取得する処理(BrowserSession.runで実行する)
+    ページの読込はDOMContentLoadedまで待ち、以降は操作する要素ごとに待つ
         Params
-            playwright: Playwright
-                playwrightオブジェクト
+            session: BrowserSession
+                ブラウザのセッション
             target_url: str
                 取得するページのurl
+            use_headless: bool = True
+                ヘッドレスのブラウザで開くかどうか
         Returns
             対象urlのページオブジェクト
     '''
+    page = None
     try:
         log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
-        # playwrightオブジェクトからページオブジェクトを生成
-        browser = playwright.chromium.launch(headless=use_headless)
-        context = browser.new_context(user_agent=USER_AGENT)
-        page = context.new_page()
-        page.set_default_timeout(TIME_OUT)
+        # 起動済みのコンテキストでページを開く
+        page = session.new_page(use_headless)
 
         # 対象urlへ遷移
-        page.goto(target_url, wait_until='networkidle')
+        with session.step('ページ遷移'):
+            page.goto(target_url, wait_until='domcontentloaded')
 
         return page
     except Exception as e:
         log_manager.logging_error_traceback()
-        page.close()
-        context.close()
-        browser.close()
+        if page is not None:
+            page.close()
     finally:
         log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
 
-def get_win5_races_page(playwright: Playwright, target_url: str) -> bs:
+def get_win5_races_page(session: BrowserSession, target_url: str) -> bs:
     '''
-    WIN5対象レース一覧ページを取得する処理
+    WIN5対象レース一覧ページを取得する処理(BrowserSession.runで実行する)
         Params
-            playwright: Playwright
-                playwrightオブジェクト
+            session: BrowserSession
+                ブラウザのセッション
             target_url: str
                 取得するページのurl
         Returns
             WIN5対象レース一覧ページのbs4オブジェクト
     '''
+    page = None
     try:
         log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
         # トップページ
-        page = get_playwright_page(playwright, target_url)
+        page = get_playwright_page(session, target_url)
+
+        # トップページを開けなかった場合は処理不要(原因はget_playwright_pageでログに出力済み)
+        if page is None:
+            return None
 
         # 出馬表クリック
-        page.click('#kaisai > ul > li:nth-child(2) > a')
-        page.wait_for_load_state('networkidle')
+        with session.step('出馬表一覧'):
+            page.click('#kaisai > ul > li:nth-child(2) > a')
+            page.wait_for_selector(RACE_LIST_PANEL_SELECTOR, state='attached')
 
         # win5をクリック
         # WIN5が複数存在する場合があるので、ヘッダの日付からWIN5を含む直近のもの(=現在より未来かつ一番日付が近いもの)を選択する
@@ -135,10 +302,10 @@ def get_win5_races_page(playwright: Playwright, target_url: str) -> bs:
 
         formatted_target_date = f'{target_race_date_month}月{target_race_date_day}日'
 
-        page.locator('#main > div.panel.no-padding.no-border').filter(
-            has=page.locator('h3.sub_header').get_by_text(formatted_target_date)).get_by_role('link').filter(has=page.get_by_alt_text('ウインファイヴ')).click()
-
-        page.wait_for_load_state('networkidle')
+        with session.step('WIN5対象レース一覧'):
+            page.locator('#main > div.panel.no-padding.no-border').filter(
+                has=page.locator('h3.sub_header').get_by_text(formatted_target_date)).get_by_role('link').filter(has=page.get_by_alt_text('ウインファイヴ')).click()
+            page.wait_for_selector(WIN5_RACES_TABLE_SELECTOR, state='attached')
 
         html = page.content()
 
@@ -149,7 +316,8 @@ def get_win5_races_page(playwright: Playwright, target_url: str) -> bs:
     except Exception as e:
         log_manager.logging_error_traceback()
     finally:
-        page.close()
+        if page is not None:
+            page.close()
         log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
 
 
@@ -260,86 +428,23 @@ def get_entry_horce_info(target_url: str, race_date: str, race_no: str) -> pd.Da
     try:
         log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
 
-        response = requests.get(target_url)
-
-        # ↓この処理は重すぎるので、エンコードはshift-jis決め打ち
-        # chardetresult = chardet.detect(response.content)
-        response.encoding = ENCODING
-        soup = bs(response.content, 'html.parser')
+        content, cache_result = jra_http_client.get_with_cache(
+            target_url, PAGE_CLASS_RACE_CARD)
 
-        tbody = soup.select_one('#syutsuba > table > tbody')
+        # 前回から変わっていない場合は、前回の解析結果をそのまま使用する
+        if cache_result != CACHE_MISS and target_url in parsed_race_cards:
+            df_race_detail = parsed_race_cards[target_url].copy()
+            df_race_detail['レース日付'] = race_date
+            df_race_detail['レース番号'] = race_no
+            return df_race_detail
 
-        # 枠番
-        if tbody.select_one('tr > td.waku > img') is not None:
-            waku_list = [int(waku_img.attrs['alt'][1:-1])
-                         for waku_img in tbody.select('tr > td.waku > img')]
-        else:
-            waku_list = [int(waku.text.replace('\n', '')) if waku.text.replace('\n', '') != '' else -1
-                         for waku in tbody.select('tr > td.waku')]
+        df_race_detail = parse_entry_horce_info(content, race_date, race_no)
 
-        # 馬番
-        num_list = [int(num.text.replace('\n', '')) if num.text.replace('\n', '') != '' else -1
-                    for num in tbody.select('tr > td.num')]
+        parsed_race_cards[target_url] = df_race_detail.copy()
 
-        # 馬名
-        horse_name_list = [hourse_name.text.replace('\n', '').replace('\r', '') for hourse_name in tbody.select(
-            'tr > td.horse > div.name_line > div.name > a')]
-
-        # オッズ
-        if tbody.select_one(
-                'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong') is not None:
-            odds_list = [float(odds_num.text) for odds_num in tbody.select(
-                'tr > td.horse > div.name_line > div.odds > div.odds_line > span.num > strong')]
-        else:
-            odds_list = [-1 for rg in range(len(horse_name_list))]
-
-        # 人気
-        if tbody.select_one(
-                'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank') is not None:
-            pop_rank_list = [int(pop_rank.text.replace('(', '').replace('番人気)', '')) for pop_rank in tbody.select(
-                'tr > td.horse > div.name_line > div.odds > div.odds_line > span.pop_rank')]
-        else:
-            pop_rank_list = [-1 for rg in range(len(horse_name_list))]
-
-        # 調教師名
-        trainer_list = [trainer.text for trainer in tbody.select(
-            'tr > td.horse > p.trainer')]
-
-        # 年齢
-        age_list = [age.text for age in tbody.select('tr > td.jockey > p.age')]
-
-        # 斤量
-        weight_list = [float(weight.next.text.replace('\r\n', '')) if weight.next.text.replace('\r\n', '') != '' else -1
-                       for weight in tbody.select('tr > td.jockey > p.weight')]
-
-        # ジョッキー
-        jockey_list = [jockey.text for jockey in tbody.select(
-            'tr > td.jockey > p.jockey > a')]
-
-        # コース
-        course_list = [soup.select_one('div.cell.course').text.replace(
-            '\n', '').replace('コース：', '') for _ in range(len(horse_name_list))]
-
-        # ハンデ
-        handicap_list = [soup.select_one('div.cell.weight').text.replace(
-            '\n', '') for _ in range(len(horse_name_list))]
-
-        # DF変換
-        df_race_detail = pd.DataFrame({
-            'レース日付': [race_date for _ in range(len(horse_name_list))],
-            'レース番号': [race_no for _ in range(len(horse_name_list))],
-            '枠番': waku_list,
-            '馬番': num_list,
-            '馬名': horse_name_list,
-            'オッズ': odds_list,
-            '人気': pop_rank_list,
-            '調教師名': trainer_list,
-            '年齢': age_list,
-            '斤量': weight_list,
-            'ジョッキー': jockey_list,
-            'コース': course_list,
-            'ハンデ': handicap_list,
-        })
+        # オッズが発表された後は更新されやすいため、短い有効期限で判定させる
+        if (df_race_detail['オッズ'] != -1).any():
+            jra_http_client.cache.set_page_class(target_url, PAGE_CLASS_ODDS)
 
         return df_race_detail
 
@@ -350,3 +455,205 @@ def get_entry_horce_info(target_url: str, race_date: str, race_no: str) -> pd.Da
         return pd.DataFrame()
     finally:
         log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+
+def get_entry_horce_infos(targets: list) -> list:
+    '''
+    複数のWIN5対象レースの出馬表を並行に取得する処理
+    JRAへの負荷を抑えるため、リクエストの開始間隔はACCESS_INTERVAL秒以上空ける
+        Params
+            targets: list
+                (出馬表URL, レース日付, レース番号)のlist
+        Returns
+            targetsと同じ順の出馬表情報の入ったDataFrameのlist
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    df_list, _ = fetch_concurrently(
+        get_entry_horce_info, targets, jra_rate_limiter, FETCH_WORKER_COUNT)
+    jra_http_client.log_stats()
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return df_list
+
+
+def select_child_elements(element, path: list) -> list:
+    '''
+    (タグ名, クラス)のlistの順に子要素をたどり、一致する要素を取得する処理
+    CSSセレクタの「td.horse > p.trainer」と同じく、各段階では直下の子要素のみを対象とする
+        Params
+            element
+                起点のlxmlの要素
+            path: list
+                (タグ名, クラス)のlist(クラスがNoneの場合はタグ名のみで判定)
+        Returns
+            一致した要素のlist(文書順)
+    '''
+    elements = [element]
+    for tag, class_name in path:
+        elements = [child for parent in elements for child in parent.iterchildren(tag)
+                    if class_name is None or class_name in child.get('class', '').split()]
+
+    return elements
+
+
+def normalize_blank_string(text: str) -> str:
+    '''
+    空白のみの文字列をBeautifulSoupと同じく1文字にまとめる処理
+    改行を含む場合は\\n、含まない場合は半角スペースとし、それ以外の文字列はそのまま返す
+        Params
+            text: str
+                タグで区切られた文字列
+        Returns
+            まとめた文字列
+    '''
+    if text.strip(ASCII_SPACES) != '':
+        return text
+
+    return '\n' if '\n' in text else ' '
+
+
+def get_element_text(element) -> str:
+    '''
+    要素内の文字列を連結して取得する処理(BeautifulSoupの.textと同じ)
+        Params
+            element
+                lxmlの要素
+        Returns
+            要素内の文字列
+    '''
+    return ''.join([normalize_blank_string(text) for text in element.itertext()])
+
+
+def parse_html_keeping_cr(content: bytes):
+    '''
+    ページの本文をlxmlで解析する処理
+    文字コードはBeautifulSoupと同じ方法で判定し、
+    lxmlは文字列中の改行コード(\\r\\n)を\\nに変換するため、タグ以外の\\rは文字参照にして残す
+        Params
+            content: bytes
+                ページの本文
+        Returns
+            lxmlのルート要素
+    '''
+    markup = UnicodeDammit(content, is_html=True).unicode_markup
+
+    if '\r' in markup:
+        parts = HTML_TAG_PATTERN.split(markup)
+        parts[::2] = [part.replace('\r', '&#13;') for part in parts[::2]]
+        markup = ''.join(parts)
+
+    return lxml.html.document_fromstring(markup)
+
+
+def parse_entry_horce_info(content: bytes, race_date: str, race_no: str) -> pd.DataFrame:
+    '''
+    出馬表のページから各出走馬の詳細情報を取得する処理
+    出馬表(#syutsuba)の行を1度だけ走査し、1行ごとに全ての列の値を取得する
+        Params
+            content: bytes
+                出馬表のページの本文
+            race_date: str
+                レース日付
+            race_no: str
+                レース番号
+        Returns
+            出馬表情報の入ったDataFrame
+    '''
+    root = parse_html_keeping_cr(content)
+
+    syutsuba = root.get_element_by_id('syutsuba')
+    tbody = select_child_elements(syutsuba, [('table', None), ('tbody', None)])[0]
+
+    waku_img_list = []
+    waku_text_list = []
+    num_list = []
+    horse_name_list = []
+    odds_list = []
+    pop_rank_list = []
+    trainer_list = []
+    age_list = []
+    weight_list = []
+    jockey_list = []
+
+    for tr in tbody.iter('tr'):
+        # 枠番(枠順確定後は画像の代替テキスト、確定前は文字列)
+        waku_img_list.extend([int(img.get('alt')[1:-1])
+                              for img in select_child_elements(tr, SYUTSUBA_WAKU_IMG_PATH)])
+        waku_text_list.extend([get_element_text(td).replace('\n', '')
+                               for td in select_child_elements(tr, SYUTSUBA_WAKU_PATH)])
+
+        # 馬番
+        num_list.extend([get_element_text(td).replace('\n', '')
+                         for td in select_child_elements(tr, SYUTSUBA_NUM_PATH)])
+
+        # 馬名
+        horse_name_list.extend([get_element_text(a).replace('\n', '').replace('\r', '')
+                                for a in select_child_elements(tr, SYUTSUBA_HORSE_NAME_PATH)])
+
+        # オッズ、人気(発表前は要素なし)
+        odds_list.extend([float(get_element_text(strong))
+                          for strong in select_child_elements(tr, SYUTSUBA_ODDS_PATH)])
+        pop_rank_list.extend([int(get_element_text(span).replace('(', '').replace('番人気)', ''))
+                              for span in select_child_elements(tr, SYUTSUBA_POP_RANK_PATH)])
+
+        # 調教師名
+        trainer_list.extend([get_element_text(p)
+                             for p in select_child_elements(tr, SYUTSUBA_TRAINER_PATH)])
+
+        # 年齢
+        age_list.extend([get_element_text(p)
+                         for p in select_child_elements(tr, SYUTSUBA_AGE_PATH)])
+
+        # 斤量(単位の要素より前の文字列)
+        for p in select_child_elements(tr, SYUTSUBA_WEIGHT_PATH):
+            weight = normalize_blank_string(p.text) if p.text is not None else (
+                get_element_text(p[0]) if len(p) > 0 else '')
+            weight = weight.replace('\r\n', '')
+            weight_list.append(float(weight) if weight != '' else -1)
+
+        # ジョッキー
+        jockey_list.extend([get_element_text(a)
+                            for a in select_child_elements(tr, SYUTSUBA_JOCKEY_PATH)])
+
+    horse_cnt = len(horse_name_list)
+
+    waku_list = waku_img_list if len(waku_img_list) > 0 else [
+        int(waku) if waku != '' else -1 for waku in waku_text_list]
+    num_list = [int(num) if num != '' else -1 for num in num_list]
+
+    if len(odds_list) == 0:
+        odds_list = [-1 for _ in range(horse_cnt)]
+    if len(pop_rank_list) == 0:
+        pop_rank_list = [-1 for _ in range(horse_cnt)]
+
+    # コース、ハンデはレースごとに1つ
+    cells = {}
+    for div in root.iter('div'):
+        classes = div.get('class', '').split()
+        if 'cell' in classes:
+            for class_name in ('course', 'weight'):
+                if class_name in classes and class_name not in cells:
+                    cells[class_name] = get_element_text(div)
+    course = cells['course'].replace('\n', '').replace('コース：', '')
+    handicap = cells['weight'].replace('\n', '')
+
+    # DF変換
+    df_race_detail = pd.DataFrame({
+        'レース日付': [race_date for _ in range(horse_cnt)],
+        'レース番号': [race_no for _ in range(horse_cnt)],
+        '枠番': waku_list,
+        '馬番': num_list,
+        '馬名': horse_name_list,
+        'オッズ': odds_list,
+        '人気': pop_rank_list,
+        '調教師名': trainer_list,
+        '年齢': age_list,
+        '斤量': weight_list,
+        'ジョッキー': jockey_list,
+        'コース': [course for _ in range(horse_cnt)],
+        'ハンデ': [handicap for _ in range(horse_cnt)],
+    })
+
+    return df_race_detail
@@ -0,0 +1,378 @@
+# 標準モジュール
+from functools import lru_cache, reduce
+import inspect
+import os
+import re
+
+# インストールモジュール
+import numpy as np
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+# 定数
+# 抽出式で使用できる変数名と、対応するレースごとの配列の列名
+VARIABLE_COLUMNS = {
+    'pop': '人気',
+    'waku': '枠番',
+    'num': '馬番',
+    'odds': 'オッズ',
+}
+
+# レースごとの値を組合せごとの値に集計する関数
+AGGREGATE_FUNCS = {
+    'sum': lambda values: reduce(np.add, values),
+    'count': lambda values: reduce(np.add, [vals.astype(np.int32) for vals in values]),
+    'all': lambda values: reduce(np.logical_and, values),
+    'any': lambda values: reduce(np.logical_or, values),
+    'min': lambda values: reduce(np.minimum, values),
+    'max': lambda values: reduce(np.maximum, values),
+}
+
+# 二項演算子と対応する配列演算
+BINARY_OPERATORS = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.true_divide,
+    '%': np.mod,
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+    'and': np.logical_and,
+    'or': np.logical_or,
+}
+
+# 比較演算子
+COMPARISON_OPERATORS = ['<', '<=', '>', '>=', '==', '!=']
+
+# 予約語
+KEYWORDS = ['and', 'or', 'not', 'between']
+
+# 字句の正規表現(数値、名前、演算子、括弧の順に判定)
+TOKEN_PATTERN = re.compile(
+    r'\s*(?:(?P<number>\d+(?:\.\d+)?)|(?P<name>[A-Za-z_]\w*)|(?P<op><=|>=|==|!=|[<>+\-*/%()\[\],]))')
+
+# 値の種類
+# レースごとの配列のlist
+KIND_LEG = 'leg'
+# 組合せごとの配列
+KIND_TICKET = 'ticket'
+# 定数
+KIND_CONST = 'const'
+
+
+class FilterExpressionError(ValueError):
+    '''
+    抽出式の構文や型が正しくない場合の例外
+    '''
+    pass
+
+
+def tokenize(expression: str) -> list:
+    '''
+    抽出式を字句に分割する処理
+        Params
+            expression: str
+                抽出式
+        Returns
+            (種類, 字句)のlist
+            種類はnumber, name, op, endのいずれか
+    '''
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if match is None:
+            raise FilterExpressionError(
+                f'{pos + 1}文字目の「{expression[pos:].strip()[:1]}」は使用できません。')
+
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+
+    tokens.append(('end', ''))
+
+    return tokens
+
+
+def apply_binary(op: str, left: tuple, right: tuple) -> tuple:
+    '''
+    2つの値に二項演算子を適用する値を作成する処理
+    レースごとの値と組合せごとの値、定数を混在させた場合は、レースごとに適用する
+        Params
+            op: str
+                演算子
+            left: tuple
+                (値の種類, 値を算出する関数)
+            right: tuple
+                (値の種類, 値を算出する関数)
+        Returns
+            (値の種類, 値を算出する関数)
+    '''
+    func = BINARY_OPERATORS[op]
+    left_kind, left_func = left
+    right_kind, right_func = right
+
+    if left_kind == KIND_LEG and right_kind == KIND_LEG:
+        return KIND_LEG, lambda get_values: [func(left_vals, right_vals) for left_vals, right_vals in zip(left_func(get_values), right_func(get_values))]
+
+    if left_kind == KIND_LEG:
+        return KIND_LEG, lambda get_values: [func(vals, right_func(get_values)) for vals in left_func(get_values)]
+
+    if right_kind == KIND_LEG:
+        return KIND_LEG, lambda get_values: [func(left_func(get_values), vals) for vals in right_func(get_values)]
+
+    kind = KIND_CONST if left_kind == KIND_CONST and right_kind == KIND_CONST else KIND_TICKET
+
+    return kind, lambda get_values: func(left_func(get_values), right_func(get_values))
+
+
+class FilterExpressionParser():
+    '''
+    抽出式を再帰下降で構文解析し、配列演算の関数に変換するクラス
+
+    式 := 論理和
+    論理和 := 論理積 ('or' 論理積)*
+    論理積 := 否定 ('and' 否定)*
+    否定 := 'not' 否定 | 比較
+    比較 := 加減算 (比較演算子 加減算 | 'between' 加減算 'and' 加減算)?
+    加減算 := 乗除算 (('+' | '-') 乗除算)*
+    乗除算 := 単項 (('*' | '/' | '%') 単項)*
+    単項 := '-' 単項 | 数値 | 変数 | 変数 '[' レース番号 ']' | 集計関数 '(' 式 ')' | '(' 式 ')'
+    '''
+
+    def __init__(self, expression: str):
+        '''
+        コンストラクタ
+            Params
+                expression: str
+                    抽出式
+        '''
+        self.tokens = tokenize(expression)
+        self.pos = 0
+
+    def peek(self) -> tuple:
+        '''
+        次の字句を取得する処理(読み進めない)
+            Returns
+                (種類, 字句)
+        '''
+        return self.tokens[self.pos]
+
+    def next(self) -> tuple:
+        '''
+        次の字句を取得して読み進める処理
+            Returns
+                (種類, 字句)
+        '''
+        token = self.tokens[self.pos]
+        self.pos += 1
+
+        return token
+
+    def expect(self, text: str):
+        '''
+        次の字句が指定した字句であることを確認して読み進める処理
+            Params
+                text: str
+                    期待する字句
+        '''
+        _, token = self.next()
+        if token != text:
+            raise FilterExpressionError(
+                f'「{text}」が必要な位置に「{token}」があります。' if token else f'「{text}」が不足しています。')
+
+    def is_next(self, text: str) -> bool:
+        '''
+        次の字句が指定した演算子または予約語かどうかを判定する処理
+            Params
+                text: str
+                    判定する字句
+            Returns
+                一致する場合はTrue
+        '''
+        kind, token = self.peek()
+
+        return kind in ('op', 'name') and token == text
+
+    def parse(self) -> tuple:
+        '''
+        抽出式全体を構文解析する処理
+            Returns
+                (値の種類, 値を算出する関数)
+        '''
+        node = self.parse_or()
+
+        _, token = self.peek()
+        if token != '':
+            raise FilterExpressionError(f'「{token}」以降を解釈できません。')
+
+        return node
+
+    def parse_or(self) -> tuple:
+        node = self.parse_and()
+        while self.is_next('or'):
+            self.next()
+            node = apply_binary('or', node, self.parse_and())
+
+        return node
+
+    def parse_and(self) -> tuple:
+        node = self.parse_not()
+        while self.is_next('and'):
+            self.next()
+            node = apply_binary('and', node, self.parse_not())
+
+        return node
+
+    def parse_not(self) -> tuple:
+        if self.is_next('not'):
+            self.next()
+            kind, func = self.parse_not()
+            if kind == KIND_LEG:
+                return kind, lambda get_values: [np.logical_not(vals) for vals in func(get_values)]
+            return kind, lambda get_values: np.logical_not(func(get_values))
+
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> tuple:
+        node = self.parse_additive()
+
+        _, token = self.peek()
+        if token in COMPARISON_OPERATORS:
+            self.next()
+            node = apply_binary(token, node, self.parse_additive())
+        elif self.is_next('between'):
+            # 「a between b and c」は「a >= b and a <= c」
+            self.next()
+            lower = self.parse_additive()
+            self.expect('and')
+            upper = self.parse_additive()
+            node = apply_binary('and', apply_binary(
+                '>=', node, lower), apply_binary('<=', node, upper))
+
+        return node
+
+    def parse_additive(self) -> tuple:
+        node = self.parse_multiplicative()
+        while self.peek()[1] in ('+', '-'):
+            _, op = self.next()
+            node = apply_binary(op, node, self.parse_multiplicative())
+
+        return node
+
+    def parse_multiplicative(self) -> tuple:
+        node = self.parse_unary()
+        while self.peek()[1] in ('*', '/', '%'):
+            _, op = self.next()
+            node = apply_binary(op, node, self.parse_unary())
+
+        return node
+
+    def parse_unary(self) -> tuple:
+        kind, token = self.next()
+
+        if token == '-':
+            return apply_binary('-', (KIND_CONST, lambda get_values: 0), self.parse_unary())
+
+        if kind == 'number':
+            val = float(token) if '.' in token else int(token)
+            return KIND_CONST, lambda get_values: val
+
+        if token == '(':
+            node = self.parse_or()
+            self.expect(')')
+            return node
+
+        if kind == 'name' and token in VARIABLE_COLUMNS:
+            return self.parse_variable(VARIABLE_COLUMNS[token])
+
+        if kind == 'name' and token in AGGREGATE_FUNCS:
+            return self.parse_aggregate(token)
+
+        if token == '':
+            raise FilterExpressionError('式が途中で終わっています。')
+
+        raise FilterExpressionError(
+            f'「{token}」は変数({", ".join(VARIABLE_COLUMNS)})または関数({", ".join(AGGREGATE_FUNCS)})ではありません。')
+
+    def parse_variable(self, col: str) -> tuple:
+        # 「pop[1]」のようにレース番号を指定した場合は、そのレースの値のみ
+        if not self.is_next('['):
+            return KIND_LEG, lambda get_values: get_values(col)
+
+        self.next()
+        kind, token = self.next()
+        if kind != 'number' or '.' in token or int(token) < 1:
+            raise FilterExpressionError(f'レース番号「{token}」は1以上の整数で指定してください。')
+        self.expect(']')
+
+        leg_idx = int(token) - 1
+
+        def get_leg_values(get_values):
+            values = get_values(col)
+            if leg_idx >= len(values):
+                raise FilterExpressionError(
+                    f'レース番号は{len(values)}以下で指定してください。')
+            return values[leg_idx]
+
+        return KIND_TICKET, get_leg_values
+
+    def parse_aggregate(self, name: str) -> tuple:
+        self.expect('(')
+        kind, func = self.parse_or()
+        self.expect(')')
+
+        if kind != KIND_LEG:
+            raise FilterExpressionError(
+                f'{name}()にはレースごとの値(pop, waku, num, odds を含む式)を指定してください。')
+
+        aggregate = AGGREGATE_FUNCS[name]
+
+        return KIND_TICKET, lambda get_values: aggregate(func(get_values))
+
+
+@lru_cache(maxsize=64)
+def compile_filter_expression(expression: str):
+    '''
+    抽出式を構文解析し、組合せのマスクを算出する関数に変換する処理
+    同じ抽出式は何度も適用されるため、変換結果は保持しておく
+        Params
+            expression: str
+                抽出式(例: sum(pop) between 10 and 16 and count(pop<=3) >= 3 and not all(waku>=7))
+        Returns
+            get_filter_stagesのマスク関数と同じく、列名を受け取りレースごとの配列のlistを返す関数を引数にとる関数
+    '''
+    log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+    kind, func = FilterExpressionParser(expression).parse()
+
+    # レースごとの値のままでは組合せを判定できない
+    if kind == KIND_LEG:
+        raise FilterExpressionError(
+            f'レースごとの値は集計関数({", ".join(AGGREGATE_FUNCS)})で組合せごとの値にしてください。')
+
+    def mask_expression(get_values):
+        mask = func(get_values)
+        # 定数のみの式は全組合せに同じ値を適用する
+        if kind == KIND_CONST:
+            mask = np.full(np.broadcast(*get_values(VARIABLE_COLUMNS['num'])).shape, bool(mask))
+        return np.asarray(mask, dtype=bool)
+
+    log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    return mask_expression
@@ -0,0 +1,248 @@
+# 標準モジュール
+import hashlib
+import inspect
+import os
+
+# インストールモジュール
+import numpy as np
+import pandas as pd
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+from win5_combination_engine import HORSE_NUM_BITS, IMPLIED_LOG_PROB_COLUMN, LEG_COUNT, LOG_ODDS_COLUMN, UNDECIDED_VAL, get_implied_log_probs, get_log_odds  # nopep8
+
+# 定数
+# 馬番を添字とする配列の大きさ(馬番は組合せを詰める際のビット数に収まる)
+HORSE_NUM_SIZE = 1 << HORSE_NUM_BITS
+
+# 出馬表から保持する数値の列名と型
+RACE_CARD_COLUMNS = {
+    '馬番': np.int16,
+    '枠番': np.int16,
+    '人気': np.int16,
+    'オッズ': np.float64,
+}
+
+# 出馬表から画面表示用に保持する列名
+RACE_CARD_TEXT_COLUMNS = ['馬名', '年齢', '斤量', 'ジョッキー', '調教師名']
+
+# 出走馬ごとのフラグ(ビットごとに意味を持たせる)
+# 1番人気
+FLAG_FAVORITE = 1
+# 人気、オッズ未確定
+FLAG_UNDECIDED = 2
+# 選択中の馬と抽出条件では、どの購入組合せにも含まれない(選択内容により変わる)
+FLAG_DEAD = 4
+
+# フラグの画面表示名
+FLAG_LABELS = {
+    FLAG_FAVORITE: '1人気',
+    FLAG_UNDECIDED: '未確定',
+    FLAG_DEAD: '対象外',
+}
+
+
+class RaceCard():
+    '''
+    WIN5対象レースの出走馬情報を、レースごとに馬番を添字とする固定長の配列で保持するクラス
+    レース詳細の読込時に1度だけ作成し、画面と組合せ計算の両方から馬番で直接参照する
+    '''
+
+    def __init__(self, df_race_detail: pd.DataFrame, leg_count: int = LEG_COUNT):
+        '''
+        コンストラクタ
+            Params
+                df_race_detail: pd.DataFrame
+                    全出走馬のレース詳細
+                leg_count: int = LEG_COUNT
+                    対象レース数
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        self.leg_count = leg_count
+
+        # レースごとに{列名: 馬番を添字とする配列}のdictを格納したlist
+        # 出走しない馬番の値はUNDECIDED_VAL
+        self.lookups = []
+
+        # レースごとに{列名: 馬番を添字とする画面表示用の配列}のdictを格納したlist
+        self.texts = []
+
+        # 出走馬かどうか(レース数, 馬番)
+        self.is_entry = np.zeros((leg_count, HORSE_NUM_SIZE), dtype=bool)
+
+        # 出走馬ごとのフラグ(レース数, 馬番)
+        self.flags = np.zeros((leg_count, HORSE_NUM_SIZE), dtype=np.uint8)
+
+        # 馬番が未確定のため配列に格納できない出走馬の{列名: 値}のlist(レースごと)
+        self.undecided_horses = []
+
+        # レースごとのコース、ハンデ
+        self.course_list = []
+        self.handicap_list = []
+
+        # レース日付
+        self.race_date = str(df_race_detail['レース日付'].iloc[0]) if 'レース日付' in df_race_detail and len(
+            df_race_detail) > 0 else ''
+
+        for leg_idx in range(leg_count):
+            df_leg = df_race_detail.loc[df_race_detail['レース番号']
+                                        == leg_idx + 1]
+            is_decided = (df_leg['馬番'] != UNDECIDED_VAL).to_numpy()
+            df_decided = df_leg.loc[is_decided]
+            horse_nums = df_decided['馬番'].to_numpy(dtype=np.int64)
+
+            lookup = {}
+            for col, dtype in RACE_CARD_COLUMNS.items():
+                lookup[col] = np.full(
+                    HORSE_NUM_SIZE, UNDECIDED_VAL, dtype=dtype)
+                lookup[col][horse_nums] = df_decided[col].to_numpy(
+                    dtype=dtype)
+
+            # 合成オッズの判定用にオッズの対数も保持する(未確定はnan)
+            lookup[LOG_ODDS_COLUMN] = get_log_odds(lookup['オッズ'])
+
+            # 的中確率での順位付け用に、出走馬全体で正規化した推定勝率の対数を保持する
+            lookup[IMPLIED_LOG_PROB_COLUMN] = np.full(HORSE_NUM_SIZE, np.nan)
+            lookup[IMPLIED_LOG_PROB_COLUMN][horse_nums] = get_implied_log_probs(
+                lookup['オッズ'][horse_nums])
+            self.lookups.append(lookup)
+
+            text = {}
+            for col in RACE_CARD_TEXT_COLUMNS:
+                text[col] = np.full(HORSE_NUM_SIZE, '', dtype=object)
+                if col in df_decided:
+                    text[col][horse_nums] = df_decided[col].to_numpy()
+            self.texts.append(text)
+
+            self.is_entry[leg_idx, horse_nums] = True
+            self.flags[leg_idx, horse_nums] = np.where(
+                lookup['人気'][horse_nums] == 1, FLAG_FAVORITE, 0) | np.where(
+                lookup['人気'][horse_nums] == UNDECIDED_VAL, FLAG_UNDECIDED, 0)
+
+            undecided_horses = df_leg.loc[~is_decided].to_dict('records')
+            for horse in undecided_horses:
+                horse['フラグ'] = FLAG_UNDECIDED
+            self.undecided_horses.append(undecided_horses)
+
+            self.course_list.append(
+                df_leg['コース'].iloc[0] if 'コース' in df_leg and len(df_leg) > 0 else '')
+            self.handicap_list.append(
+                df_leg['ハンデ'].iloc[0] if 'ハンデ' in df_leg and len(df_leg) > 0 else '')
+
+        # オッズが更新されたかどうかを判定するため、全レースのオッズからハッシュ値を算出
+        self.odds_version = hashlib.sha1(np.stack(
+            [lookup['オッズ'] for lookup in self.lookups]).tobytes()).hexdigest()
+
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+    def get_horse(self, leg_idx: int, horse_num: int) -> dict:
+        '''
+        馬番から1頭分の情報を取得する処理
+            Params
+                leg_idx: int
+                    レースのインデックス(0始まり)
+                horse_num: int
+                    馬番
+            Returns
+                {列名: 値}のdict(レース番号、フラグを含む)
+        '''
+        # 画面のコントロールの値にそのまま使えるよう、数値はpythonの型に変換する
+        horse = {col: vals[horse_num].item()
+                 for col, vals in self.lookups[leg_idx].items()}
+        horse.update({col: vals[horse_num]
+                     for col, vals in self.texts[leg_idx].items()})
+        horse['レース番号'] = leg_idx + 1
+        horse['フラグ'] = self.flags[leg_idx, horse_num].item()
+
+        return horse
+
+    def get_entry_horse_nums(self, leg_idx: int) -> np.ndarray:
+        '''
+        出走馬の馬番一覧を取得する処理
+            Params
+                leg_idx: int
+                    レースのインデックス(0始まり)
+            Returns
+                昇順の馬番配列
+        '''
+        return np.flatnonzero(self.is_entry[leg_idx])
+
+    def get_sorted_horse_nums(self, leg_idx: int, sort_col: str, ascending: bool = True) -> np.ndarray:
+        '''
+        出走馬の馬番一覧を指定した列の順に並べて取得する処理
+        並び替えに使用する値が未確定の馬がいる場合は馬番順のまま返す
+            Params
+                leg_idx: int
+                    レースのインデックス(0始まり)
+                sort_col: str
+                    並び替えに使用する列名
+                ascending: bool = True
+                    昇順かどうか
+            Returns
+                並べ替えた馬番配列
+        '''
+        horse_nums = self.get_entry_horse_nums(leg_idx)
+        vals = self.lookups[leg_idx][sort_col][horse_nums]
+
+        if (vals == UNDECIDED_VAL).any():
+            return horse_nums
+
+        order = np.argsort(vals if ascending else -vals, kind='stable')
+
+        return horse_nums[order]
+
+    def set_dead_horses(self, dead_horse_nums: list) -> list:
+        '''
+        どの購入組合せにも含まれない馬のフラグを立て直す処理
+            Params
+                dead_horse_nums: list
+                    レースごとの、組合せに含まれない馬番のlist
+            Returns
+                フラグが変わった(レースのインデックス, 馬番)のlist
+        '''
+        prev_flags = self.flags.copy()
+
+        self.flags &= np.uint8(~FLAG_DEAD & 0xFF)
+        for leg_idx, horse_nums in enumerate(dead_horse_nums):
+            self.flags[leg_idx, np.array(horse_nums, dtype=np.int64)] |= FLAG_DEAD
+
+        return [(int(leg_idx), int(horse_num)) for leg_idx, horse_num in zip(*np.nonzero(self.flags != prev_flags))]
+
+    def get_legs(self, selected_horse_nums: list) -> list:
+        '''
+        レースごとの選択された馬番から、組合せ計算に使用するレースごとの配列を作成する処理
+            Params
+                selected_horse_nums: list
+                    レースごとの選択された馬番のlist
+            Returns
+                レースごとに{列名: 選択された馬の値の配列}のdictを格納したlist
+        '''
+        legs = []
+        for lookup, horse_nums in zip(self.lookups, selected_horse_nums):
+            idx = np.array(horse_nums, dtype=np.int64)
+            legs.append({col: vals[idx] for col, vals in lookup.items()})
+
+        return legs
+
+
+def get_flag_label(flags: int) -> str:
+    '''
+    出走馬のフラグを画面表示用の文字列に変換する処理
+        Params
+            flags: int
+                出走馬のフラグ
+        Returns
+            立っているフラグの表示名を/で連結した文字列
+    '''
+    return '/'.join([label for flag, label in FLAG_LABELS.items() if flags & flag])
@@ -0,0 +1,200 @@
+# 標準モジュール
+from contextlib import closing
+from datetime import datetime
+import inspect
+import json
+import os
+import sqlite3
+
+# インストールモジュール
+import numpy as np
+
+# 自作モジュール
+from utilities.common_log_manager import log_manager
+from utilities.log_manager import LogManager
+
+# ログ設定
+if log_manager is None:
+    # ログマネージャー設定
+    log_manager = LogManager(
+        __name__, f'config{os.path.sep}log_config.json')
+else:
+    log_manager = log_manager
+
+from utilities.sqlite_utils import execute_select_sql_with_param, get_query  # nopep8
+
+
+class TicketStore():
+    '''
+    組合せ計算の結果(詰めた組合せの配列)を.npyファイルに保存し、再起動後も再利用するためのクラス
+    配列はsqliteファイルと同じディレクトリ配下に保存し、入力内容はsqliteのテーブルに記録する
+    読込はメモリマップで行うため、組合せ数によらずコピーせずに即座に参照できる
+    '''
+
+    def __init__(self, db_path: str, store_dir: str, table_name: str, create_sql_path: str, get_sql_path: str):
+        '''
+        コンストラクタ
+            Params
+                db_path: str
+                    入力内容を記録するsqliteファイルまでのパス
+                store_dir: str
+                    .npyファイルの保存先ディレクトリ
+                table_name: str
+                    入力内容を記録するテーブル名
+                create_sql_path: str
+                    テーブルを作成するsqlファイルまでのパス
+                get_sql_path: str
+                    選択ハッシュから入力内容を取得するsqlファイルまでのパス
+        '''
+        self.db_path = db_path
+        self.store_dir = store_dir
+        self.table_name = table_name
+        self.get_sql_path = get_sql_path
+
+        os.makedirs(store_dir, exist_ok=True)
+
+        # 初回起動時は記録先のテーブルがないため作成しておく
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(get_query(create_sql_path))
+
+    def get_ticket_path(self, fingerprint: str) -> str:
+        '''
+        選択ハッシュから.npyファイルのパスを取得する処理
+            Params
+                fingerprint: str
+                    get_selection_fingerprintで算出したハッシュ値
+            Returns
+                .npyファイルのパス
+        '''
+        return os.path.join(self.store_dir, f'{fingerprint}.npy')
+
+    def load(self, fingerprint: str) -> np.ndarray:
+        '''
+        保存済みの組合せをメモリマップで読み込む処理
+            Params
+                fingerprint: str
+                    get_selection_fingerprintで算出したハッシュ値
+            Returns
+                詰めた組合せの配列(読み取り専用)
+                保存していない場合、ファイルが壊れている場合はNone
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        tickets = None
+        df = execute_select_sql_with_param(
+            self.db_path, self.get_sql_path, {'fingerprint': fingerprint})
+        path = self.get_ticket_path(fingerprint)
+
+        if df is None or not os.path.exists(path):
+            log_manager.info(f'保存済みの組合せなし: {fingerprint}')
+        elif int(df['組合せ点数'].iloc[0]) == 0:
+            # 要素数0の配列はメモリマップできない
+            tickets = np.empty(0, dtype=np.uint32)
+        else:
+            try:
+                tickets = np.asarray(np.load(path, mmap_mode='r'))
+            except ValueError:
+                log_manager.logging_error_traceback()
+
+            # 書込途中で終了した場合などで点数が一致しなければ使用しない
+            if tickets is not None and len(tickets) != int(df['組合せ点数'].iloc[0]):
+                log_manager.info(f'保存済みの組合せの点数が一致しません: {path}')
+                tickets = None
+
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+        return tickets
+
+    def save(self, fingerprint: str, race_date: str, filter_params: dict, odds_version: str, tickets: np.ndarray) -> bool:
+        '''
+        組合せを.npyファイルに保存し、入力内容をテーブルに記録する処理
+        保存中に終了しても壊れたファイルを読まないよう、一時ファイルに書いてから置き換える
+        記録に失敗した場合は、記録のない.npyファイルが残らないよう削除する
+            Params
+                fingerprint: str
+                    get_selection_fingerprintで算出したハッシュ値
+                race_date: str
+                    レース日付
+                filter_params: dict
+                    抽出条件ごとの選択値
+                odds_version: str
+                    オッズのハッシュ値
+                tickets: np.ndarray
+                    詰めた組合せの配列
+            Returns
+                実行結果
+                    True: 保存成功 False: 保存失敗
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        path = self.get_ticket_path(fingerprint)
+        tmp_path = f'{path}.tmp'
+
+        is_saved = True
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(tickets, dtype=np.uint32))
+            os.replace(tmp_path, path)
+
+            record = (fingerprint, race_date,
+                      json.dumps(filter_params, ensure_ascii=False,
+                                 sort_keys=True, default=str),
+                      odds_version, len(tickets), os.path.basename(path),
+                      datetime.now().isoformat(timespec='seconds'))
+
+            # 同じ選択ハッシュは同じ組合せになるため、記録済みの場合は1つのトランザクションで置き換える
+            with closing(sqlite3.connect(self.db_path)) as conn, conn:
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {self.table_name} '
+                    '(選択ハッシュ, レース日付, 抽出条件, オッズハッシュ, 組合せ点数, ファイル名, 作成日時) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', record)
+        except (OSError, sqlite3.Error):
+            log_manager.logging_error_traceback()
+            is_saved = False
+
+            for remove_path in (tmp_path, path):
+                if os.path.exists(remove_path):
+                    os.remove(remove_path)
+
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+        return is_saved
+
+    def prune(self, race_date: str) -> int:
+        '''
+        指定したレース日付より前の組合せと記録、記録のない.npyファイルを削除する処理
+        過去のレースの組合せは再利用しないため、保存先が増え続けないようレース詳細の取得時に呼び出す
+            Params
+                race_date: str
+                    現在のレース日付(yyyy-mm-dd)
+            Returns
+                削除した.npyファイル数
+        '''
+        log_manager.info(f'start {inspect.currentframe().f_code.co_name}')
+
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            fingerprints = [row[0] for row in conn.execute(
+                f'SELECT 選択ハッシュ FROM {self.table_name} WHERE レース日付 < ?', (race_date,))]
+            conn.execute(
+                f'DELETE FROM {self.table_name} WHERE レース日付 < ?', (race_date,))
+            recorded_files = {row[0] for row in conn.execute(
+                f'SELECT ファイル名 FROM {self.table_name}')}
+
+        # 記録を削除した組合せと、記録に失敗した組合せ、書込途中の一時ファイル
+        remove_files = [file_name for file_name in os.listdir(self.store_dir)
+                        if file_name not in recorded_files]
+
+        removed_cnt = 0
+        for file_name in remove_files:
+            try:
+                os.remove(os.path.join(self.store_dir, file_name))
+                removed_cnt += 1
+            except OSError:
+                # Windowsではメモリマップ中のファイルを削除できないため、次回に削除する
+                log_manager.logging_error_traceback()
+
+        log_manager.info(
+            f'{race_date}より前の組合せの記録: {len(fingerprints)}件 削除したファイル: {removed_cnt}件')
+        log_manager.info(f'end {inspect.currentframe().f_code.co_name}')
+
+        return removed_cnt